@@ -0,0 +1,30 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+"""
+pytest configuration of the FireWorks unit tests
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import fireworks.utilities.fw_serializers as fw_serializers
+
+__author__ = 'Anubhav Jain'
+
+
+@pytest.fixture(scope='session', autouse=True)
+def fw_name_registry():
+    """
+    Keep the _fw_name registry of the tests out of the home directory of the user.
+    """
+    old_registry = fw_serializers.FW_NAME_REGISTRY
+    tmp_dir = tempfile.mkdtemp()
+    fw_serializers.FW_NAME_REGISTRY = os.path.join(tmp_dir, 'fw_name_registry.json')
+    yield
+    fw_serializers.FW_NAME_REGISTRY = old_registry
+    shutil.rmtree(tmp_dir)
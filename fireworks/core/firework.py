@@ -16,7 +16,7 @@ This module contains some of the most central FireWorks classes:
         a job completes.
 """
 
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, OrderedDict, deque
 import abc
 from datetime import datetime
 import os
@@ -31,7 +31,7 @@ from fireworks.fw_config import TRACKER_LINES, NEGATIVE_FWID_CTR, EXCEPT_DETAILS
 from fireworks.core.fworker import FWorker
 from fireworks.utilities.dict_mods import apply_mod
 from fireworks.utilities.fw_serializers import FWSerializable, recursive_serialize, \
-    recursive_deserialize, serialize_fw
+    recursive_deserialize, serialize_fw, to_db_date
 from fireworks.utilities.fw_utilities import get_my_host, get_my_ip, NestedClassGetter
 
 __author__ = "Anubhav Jain"
@@ -304,8 +304,26 @@ class Firework(FWSerializable):
         # the archived launches are stored separately
         m_dict['archived_launches'] = [l.launch_id for l in self.archived_launches]
         m_dict['state'] = self.state
+        m_dict['routing'] = self.get_routing(self.spec)
+        m_dict['created_on'] = to_db_date(self.created_on)
+        m_dict['updated_on'] = to_db_date(self.updated_on)
         return m_dict
 
+    @staticmethod
+    def get_routing(spec):
+        """
+        Get the routing keys that FWorker.query matches, normalized from the _fworker and
+        _category keys of the spec. They are stored next to the spec in the DB so that checkout
+        queries can use a single compound index.
+
+        Args:
+            spec (dict)
+
+        Returns:
+            dict: {'fworker': str or None, 'category': str or None}
+        """
+        return {'fworker': spec.get('_fworker'), 'category': spec.get('_category')}
+
     @classmethod
     @recursive_deserialize
     def from_dict(cls, m_dict):
@@ -327,9 +345,19 @@ class Firework(FWSerializable):
 class Tracker(FWSerializable, object):
     """
     A Tracker monitors a file and returns the last N lines for updating the Launch object.
+
+    The Tracker remembers the file and the offset it read up to, so that each call of track_file
+    only reads the bytes appended since the previous call and keeps the last N lines in memory.
+    A file that was replaced (e.g. rotated), truncated or rewritten is read again from its last N
+    lines. Compressed files cannot be read from an offset, so they are read in full every time.
     """
 
     MAX_TRACKER_LINES = 1000
+    COMPRESSED_EXTS = ('.gz', '.bz2', '.z', '.xz', '.lzma')
+    BLOCK_BYTES = 8192  # size of the blocks read backwards to find the last lines of a file
+    MAX_APPEND_BYTES = 1 << 20  # above this, the appended bytes are skipped to the last lines
+    MAX_LINE_BYTES = 4096  # per tracked line, bytes kept of a line that is not complete yet
+    TAIL_BYTES = 64  # bytes before the offset compared to detect a file rewritten in place
 
     def __init__(self, filename, nlines=TRACKER_LINES, content='', allow_zipped=False):
         """
@@ -346,6 +374,12 @@ class Tracker(FWSerializable, object):
         self.nlines = nlines
         self.content = content
         self.allow_zipped = allow_zipped
+        # state of the incremental reads
+        self._file_id = None  # (device, inode) of the file read
+        self._offset = 0  # offset read up to
+        self._lines = deque(maxlen=nlines)  # last complete lines read
+        self._partial = b''  # bytes of the last line, if not complete yet
+        self._tail = b''  # bytes before the offset
 
     def track_file(self, launch_dir=None):
         """
@@ -364,14 +398,94 @@ class Tracker(FWSerializable, object):
         if self.allow_zipped:
             m_file = zpath(m_file)
         if os.path.exists(m_file):
-            with zopen(m_file, "rt") as f:
-                for l in reverse_readline(f):
-                    lines.append(l)
-                    if len(lines) == self.nlines:
-                        break
-            self.content = '\n'.join(reversed(lines))
+            if os.path.splitext(m_file)[1].lower() in self.COMPRESSED_EXTS:
+                with zopen(m_file, "rt") as f:
+                    for l in reverse_readline(f):
+                        lines.append(l)
+                        if len(lines) == self.nlines:
+                            break
+                self.content = '\n'.join(reversed(lines))
+            else:
+                self._read_appended(m_file)
+                lines = list(self._lines)
+                if self._partial:
+                    lines.append(self._decode_line(self._partial))
+                self.content = '\n'.join(lines[-self.nlines:])
         return self.content
 
+    def _read_appended(self, m_file):
+        """
+        Read the bytes appended to a file since the last read into the last lines.
+
+        Args:
+            m_file (str): path of the file
+        """
+        with open(m_file, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            data = None
+            if file_id == self._file_id and \
+                    self._offset <= stat.st_size <= self._offset + self.MAX_APPEND_BYTES:
+                # a file rewritten in place may have grown past the offset: check the bytes
+                # before the offset are still the ones read
+                f.seek(self._offset - len(self._tail))
+                data = f.read(stat.st_size - self._offset + len(self._tail))
+                data = data[len(self._tail):] if data.startswith(self._tail) else None
+            if data is None:
+                # new, replaced, truncated or rewritten file, or too much to read: start from the
+                # last lines
+                self._file_id = file_id
+                self._offset = self._find_last_lines(f, stat.st_size)
+                self._lines.clear()
+                self._partial = b''
+                start = max(self._offset - self.TAIL_BYTES, 0)
+                f.seek(start)
+                data = f.read(stat.st_size - start)
+                self._tail, data = data[:self._offset - start], data[self._offset - start:]
+        self._offset += len(data)
+        self._tail = (self._tail + data)[-self.TAIL_BYTES:]
+        lines = (self._partial + data).split(b'\n')
+        # only the end of a line that never completes is kept
+        self._partial = lines.pop()[-self.nlines * self.MAX_LINE_BYTES:]
+        self._lines.extend(self._decode_line(l) for l in lines[-self.nlines:])
+
+    @staticmethod
+    def _decode_line(line):
+        # the lines of a file with Windows line endings are read as in text mode
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        return line.decode('utf-8', 'replace')
+
+    def _find_last_lines(self, f, size):
+        """
+        Find the last N lines of a file by reading it backwards.
+
+        Args:
+            f (file): file open in binary mode
+            size (int): size of the file
+
+        Returns:
+            int: offset of the first of the last N lines
+        """
+        n_lines = 0
+        end = size
+        while end > 0:
+            start = max(end - self.BLOCK_BYTES, 0)
+            f.seek(start)
+            block = f.read(end - start)
+            i = len(block)
+            while True:
+                i = block.rfind(b'\n', 0, i)
+                if i < 0:
+                    break
+                # the newline ending the file does not start a line
+                if start + i < size - 1:
+                    n_lines += 1
+                    if n_lines == self.nlines:
+                        return start + i + 1
+            end = start
+        return 0
+
     def to_dict(self):
         m_dict = {'filename': self.filename, 'nlines': self.nlines, 'allow_zipped': self.allow_zipped}
         if self.content:
@@ -531,11 +645,19 @@ class Launch(FWSerializable, object):
                 'state_history': self.state_history,
                 'launch_id': self.launch_id}
 
-    @recursive_serialize
     def to_db_dict(self):
+        m_d = self._to_db_dict()
+        m_d['time_start'] = to_db_date(self.time_start)
+        m_d['time_end'] = to_db_date(self.time_end)
+        for entry, db_entry in zip(self.state_history, m_d['state_history']):
+            for k in ('created_on', 'updated_on', 'expires_on'):
+                if k in entry:
+                    db_entry[k] = to_db_date(entry[k])
+        return m_d
+
+    @recursive_serialize
+    def _to_db_dict(self):
         m_d = self.to_dict()
-        m_d['time_start'] = self.time_start
-        m_d['time_end'] = self.time_end
         m_d['runtime_secs'] = self.runtime_secs
         if self.reservedtime_secs:
             m_d['reservedtime_secs'] = self.reservedtime_secs
@@ -600,48 +722,117 @@ class Workflow(FWSerializable):
     class Links(dict, FWSerializable):
         """
         An inner class for storing the DAG links between FireWorks
+
+        The reverse links (parent_links) and the set of nodes are kept up to date as links are
+        set, deleted or appended, so reading them does not require a pass over the whole DAG.
         """
 
         def __init__(self, *args, **kwargs):
-            super(Workflow.Links, self).__init__(*args, **kwargs)
-
-            for k, v in list(self.items()):
+            super(Workflow.Links, self).__init__()
+            self._parent_links = {}  # child: [parents]
+            self._node_refs = {}  # node: number of times it appears as a parent or a child
+            self._leaves = OrderedDict()  # parents without children, used as an ordered set
+
+            # keys that need converting come last, so they win over an int key for the same FW
+            items = sorted(dict(*args, **kwargs).items(), key=lambda kv: not isinstance(kv[0], int))
+            for k, v in items:
                 if not isinstance(v, (list, tuple)):
-                    self[k] = [v]  # v must be list
-
-                self[k] = [x.fw_id if hasattr(x, "fw_id") else x for x in self[k]]
+                    v = [v]  # v must be list
+                v = [x.fw_id if hasattr(x, "fw_id") else x for x in v]
 
                 if not isinstance(k, int):
                     if hasattr(k, "fw_id"):  # maybe it's a String?
-                        self[k.fw_id] = self[k]
+                        k = k.fw_id
                     else:  # maybe it's a String?
                         try:
-                            self[int(k)] = self[k]  # k must be int
+                            k = int(k)  # k must be int
                         except:
-                            pass  # garbage input
-                    del self[k]
+                            continue  # garbage input
+                self[k] = v
+
+        def __setitem__(self, parent, children):
+            if parent in self:
+                self._unlink(parent, self[parent])
+                self[parent]._links = None  # the old list is not part of the Links anymore
+            else:
+                self._add_node_ref(parent)
+            children = Workflow._Children(self, parent, children)
+            super(Workflow.Links, self).__setitem__(parent, children)
+            self._link(parent, children)
+
+        def __delitem__(self, parent):
+            self._unlink(parent, self[parent])
+            self[parent]._links = None
+            self._remove_node_ref(parent)
+            super(Workflow.Links, self).__delitem__(parent)
+            self._leaves.pop(parent, None)
+
+        def pop(self, parent, *args):
+            if parent not in self:
+                return super(Workflow.Links, self).pop(parent, *args)
+            children = list(self[parent])
+            del self[parent]
+            return children
+
+        def setdefault(self, parent, default=None):
+            if parent not in self:
+                self[parent] = default if default is not None else []
+            return self[parent]
+
+        def update(self, *args, **kwargs):
+            for parent, children in dict(*args, **kwargs).items():
+                self[parent] = children
+
+        def clear(self):
+            for parent in list(self):
+                del self[parent]
+
+        def _link(self, parent, children):
+            for child in children:
+                self._parent_links.setdefault(child, []).append(parent)
+                self._add_node_ref(child)
+            self._update_leaf(parent)
+
+        def _unlink(self, parent, children):
+            for child in children:
+                parents = self._parent_links[child]
+                parents.remove(parent)
+                if not parents:
+                    del self._parent_links[child]
+                self._remove_node_ref(child)
+            self._update_leaf(parent)
+
+        def _update_leaf(self, parent):
+            if parent in self and not self[parent]:
+                self._leaves[parent] = True
+            else:
+                self._leaves.pop(parent, None)
+
+        def _add_node_ref(self, node):
+            self._node_refs[node] = self._node_refs.get(node, 0) + 1
+
+        def _remove_node_ref(self, node):
+            self._node_refs[node] -= 1
+            if not self._node_refs[node]:
+                del self._node_refs[node]
 
         @property
         def nodes(self):
             """ Return list of all nodes"""
-            allnodes = list(self.keys())
-            for v in self.values():
-                allnodes.extend(v)
-            return list(set(allnodes))
+            return list(self._node_refs)
 
         @property
         def parent_links(self):
             """
-            Return a dict of child and its parents.
-
-            Note: if performance of parent_links becomes an issue, override delitem/setitem to
-            update parent_links
+            Return a dict of child and its parents. The dict is maintained by the Links and must
+            not be modified.
             """
-            child_parents = defaultdict(list)
-            for (parent, children) in self.items():
-                for child in children:
-                    child_parents[child].append(parent)
-            return dict(child_parents)
+            return self._parent_links
+
+        @property
+        def leaves(self):
+            """ Return list of the parents without children"""
+            return list(self._leaves)
 
         def to_dict(self):
             """
@@ -650,7 +841,7 @@ class Workflow(FWSerializable):
             Returns:
                 dict
             """
-            return dict([(str(k), v) for (k, v) in self.items()])
+            return dict([(str(k), list(v)) for (k, v) in self.items()])
 
         def to_db_dict(self):
             """
@@ -660,8 +851,8 @@ class Workflow(FWSerializable):
                 dict
             """
             m_dict = {
-                'links': dict([(str(k), v) for (k, v) in self.items()]),
-                'parent_links': dict([(str(k), v) for (k, v) in self.parent_links.items()]),
+                'links': dict([(str(k), list(v)) for (k, v) in self.items()]),
+                'parent_links': dict([(str(k), list(v)) for (k, v) in self._parent_links.items()]),
                 'nodes': self.nodes}
             return m_dict
 
@@ -679,9 +870,122 @@ class Workflow(FWSerializable):
             Return a class which can return this class when called with the appropriate tuple of
             arguments
             """
-            state = list(self.items())
+            state = [(k, list(v)) for k, v in self.items()]
             return NestedClassGetter(), (Workflow, self.__class__.__name__, ), state
 
+    class _FWStates(dict):
+        """
+        The Firework states of a Workflow (fw_id: state), which keeps count of the Fireworks
+        in each state and records the ids whose state was set, changed or removed after the
+        creation (changed).
+        """
+
+        def __init__(self, *args, **kwargs):
+            super(Workflow._FWStates, self).__init__()
+            self.counts = {}  # state: number of Fireworks
+            self.changed = set()
+            self.update(*args, **kwargs)
+            self.changed.clear()
+
+        def __setitem__(self, fw_id, state):
+            if fw_id in self:
+                if self[fw_id] == state:
+                    return
+                self._count(self[fw_id], -1)
+            super(Workflow._FWStates, self).__setitem__(fw_id, state)
+            self._count(state, 1)
+            self.changed.add(fw_id)
+
+        def __delitem__(self, fw_id):
+            self._count(self[fw_id], -1)
+            super(Workflow._FWStates, self).__delitem__(fw_id)
+            self.changed.add(fw_id)
+
+        def pop(self, fw_id, *args):
+            if fw_id in self:
+                self._count(self[fw_id], -1)
+                self.changed.add(fw_id)
+            return super(Workflow._FWStates, self).pop(fw_id, *args)
+
+        def setdefault(self, fw_id, state=None):
+            if fw_id not in self:
+                self[fw_id] = state
+            return self[fw_id]
+
+        def update(self, *args, **kwargs):
+            for fw_id, state in dict(*args, **kwargs).items():
+                self[fw_id] = state
+
+        def clear(self):
+            self.changed.update(self)
+            super(Workflow._FWStates, self).clear()
+            self.counts.clear()
+
+        def _count(self, state, n):
+            self.counts[state] = self.counts.get(state, 0) + n
+            if not self.counts[state]:
+                del self.counts[state]
+
+        def __reduce__(self):
+            return Workflow._FWStates, (dict(self),)
+
+    class _Children(list):
+        """
+        The list of children of a parent in Workflow.Links. Changing it in place (e.g. with
+        append) keeps the parent_links and nodes of the Links up to date.
+        """
+
+        def __init__(self, links, parent, children):
+            super(Workflow._Children, self).__init__(children)
+            self._links = links
+            self._parent = parent
+
+        def append(self, child):
+            super(Workflow._Children, self).append(child)
+            if self._links is not None:
+                self._links._link(self._parent, [child])
+
+        def extend(self, children):
+            children = list(children)
+            super(Workflow._Children, self).extend(children)
+            if self._links is not None:
+                self._links._link(self._parent, children)
+
+        def __iadd__(self, children):
+            self.extend(children)
+            return self
+
+        def _relink(self, method, *args):
+            # any other change: unlink all the children, apply the change and link them again
+            if self._links is None:
+                return getattr(super(Workflow._Children, self), method)(*args)
+            self._links._unlink(self._parent, self)
+            try:
+                return getattr(super(Workflow._Children, self), method)(*args)
+            finally:
+                self._links._link(self._parent, self)
+
+        def insert(self, index, child):
+            return self._relink('insert', index, child)
+
+        def remove(self, child):
+            return self._relink('remove', child)
+
+        def pop(self, *args):
+            return self._relink('pop', *args)
+
+        def clear(self):
+            return self._relink('__delitem__', slice(None))
+
+        def __setitem__(self, index, value):
+            return self._relink('__setitem__', index, value)
+
+        def __delitem__(self, index):
+            return self._relink('__delitem__', index)
+
+        def __reduce__(self):
+            return list, (list(self),)
+
     def __init__(self, fireworks, links_dict=None, name=None, metadata=None, created_on=None,
                  updated_on=None, fw_states=None):
         """
@@ -748,27 +1052,40 @@ class Workflow(FWSerializable):
         """
         return list(self.id_fw.values())
 
+    @property
+    def fw_states(self):
+        """
+        Return dict of fw_id: state of all fireworks, which also counts the fireworks in each
+        state (fw_states.counts)
+        """
+        return self._fw_states
+
+    @fw_states.setter
+    def fw_states(self, fw_states):
+        old_fw_states = getattr(self, '_fw_states', None)
+        self._fw_states = Workflow._FWStates(fw_states)
+        if old_fw_states is not None:
+            # the states replaced are changes as well
+            changed = self._fw_states.changed
+            changed.update(old_fw_states.changed)
+            changed.update(f for f in set(old_fw_states).union(self._fw_states)
+                           if old_fw_states.get(f) != self._fw_states.get(f))
+
     @property
     def state(self):
         """
         Returns:
             state (str): state of workflow
         """
-        m_state = 'READY'
-        #states = [fw.state for fw in self.fws]
-        states = self.fw_states.values()
-        leaf_fw_ids = self.leaf_fw_ids  # to save recalculating this
+        counts = self.fw_states.counts
 
-        leaf_states = (self.fw_states[fw_id] for fw_id in leaf_fw_ids)
-        if all(s == 'COMPLETED' for s in leaf_states):
-            m_state = 'COMPLETED'
-        elif all(s == 'ARCHIVED' for s in states):
-            m_state = 'ARCHIVED'
-        elif any(s == 'DEFUSED' for s in states):
-            m_state = 'DEFUSED'
-        elif any(s == 'PAUSED' for s in states):
-            m_state = 'PAUSED'
-        elif any(s == 'FIZZLED' for s in states):
+        def leaves_completed():
+            # only look at the leaves if there are enough COMPLETED FWs for them all to be
+            return (counts.get('COMPLETED', 0) >= len(self.links._leaves) and
+                    all(self.fw_states[fw_id] == 'COMPLETED' for fw_id in self.links._leaves))
+
+        def fizzled_blocking():
+            leaf_fw_ids = set(self.leaf_fw_ids)
             fizzled_ids = (fw_id for fw_id, state in self.fw_states.items()
                            if state == 'FIZZLED')
             for fizzled_id in fizzled_ids:
@@ -777,13 +1094,43 @@ class Workflow(FWSerializable):
                     # Otherwise all children must be ok with the fizzled parent
                     not all(self.id_fw[child_id].spec.get('_allow_fizzled_parents', False)
                             for child_id in self.links[fizzled_id])):
-                    m_state = 'FIZZLED'
-                    break
-            else:
-                m_state = 'RUNNING'
-        elif any(s == 'COMPLETED' for s in states) or any(s == 'RUNNING' for s in states):
+                    return True
+            return False
+
+        return Workflow.get_state_from_counts(counts, leaves_completed, fizzled_blocking)
+
+    @staticmethod
+    def get_state_from_counts(counts, leaves_completed, fizzled_blocking):
+        """
+        Get the state of a workflow from the number of its Fireworks in each state. The leaves
+        and the FIZZLED Fireworks are only looked at when the counts are not enough, so that
+        workflows that are not fully in memory can compute their state from the DB.
+
+        Args:
+            counts (dict): number of Fireworks in each state
+            leaves_completed (callable): returns True if all the leaves are COMPLETED
+            fizzled_blocking (callable): returns True if a FIZZLED Firework is a leaf or has a
+                child that does not allow FIZZLED parents
+
+        Returns:
+            state (str): state of workflow
+        """
+        m_state = 'READY'
+        n_fws = sum(counts.values())
+
+        if counts.get('COMPLETED', 0) == n_fws or leaves_completed():
+            m_state = 'COMPLETED'
+        elif counts.get('ARCHIVED', 0) == n_fws:
+            m_state = 'ARCHIVED'
+        elif counts.get('DEFUSED', 0):
+            m_state = 'DEFUSED'
+        elif counts.get('PAUSED', 0):
+            m_state = 'PAUSED'
+        elif counts.get('FIZZLED', 0):
+            m_state = 'FIZZLED' if fizzled_blocking() else 'RUNNING'
+        elif counts.get('COMPLETED', 0) or counts.get('RUNNING', 0):
             m_state = 'RUNNING'
-        elif any(s == 'RESERVED' for s in states):
+        elif counts.get('RESERVED', 0):
             m_state = 'RESERVED'
         return m_state
 
@@ -861,18 +1208,27 @@ class Workflow(FWSerializable):
         """
 
         updated_ids = updated_ids if updated_ids else set()
-        m_fw = self.id_fw[fw_id]
-        m_fw._rerun()
-        updated_ids.add(fw_id)
 
-        # refresh the states of the current fw before rerunning the children
-        # so that they get the correct state of the parent.
-        updated_ids.union(self.refresh(fw_id, updated_ids))
+        # depth-first through the children that are not WAITING, without recursion so that
+        # long chains do not hit the recursion limit
+        to_visit = [iter([fw_id])]
+        while to_visit:
+            m_fw_id = next(to_visit[-1], None)
+            if m_fw_id is None:
+                to_visit.pop()
+                continue
+            if m_fw_id != fw_id and self.id_fw[m_fw_id].state == 'WAITING':
+                continue
+
+            self.id_fw[m_fw_id]._rerun()
+            updated_ids.add(m_fw_id)
 
-        # re-run all the children
-        for child_id in self.links[fw_id]:
-            if self.id_fw[child_id].state != 'WAITING':
-                updated_ids = updated_ids.union(self.rerun_fw(child_id, updated_ids))
+            # refresh the states of the current fw before rerunning the children
+            # so that they get the correct state of the parent.
+            self.refresh(m_fw_id, updated_ids)
+
+            # re-run all the children
+            to_visit.append(iter(self.links[m_fw_id]))
 
         return updated_ids
 
@@ -960,22 +1316,48 @@ class Workflow(FWSerializable):
             set(int): list of Firework ids that were updated
         """
         # these are the fw_ids to re-enter into the database
-        updated_ids = updated_ids if updated_ids else set()
+        updated_ids = updated_ids if updated_ids is not None else set()
+
+        # depth-first through the children whose parent changed to COMPLETED or FIZZLED, without
+        # recursion so that long chains do not hit the recursion limit
+        to_visit = [iter([fw_id])]
+        while to_visit:
+            m_fw_id = next(to_visit[-1], None)
+            if m_fw_id is None:
+                to_visit.pop()
+                continue
+            if self._refresh_fw(m_fw_id, updated_ids):
+                to_visit.append(iter(self.links[m_fw_id]))
 
+        return updated_ids
+
+    def _refresh_fw(self, fw_id, updated_ids):
+        """
+        Refreshes the state of a single Firework, see refresh().
+
+        Args:
+            fw_id (int): id of the Firework on which to perform the refresh
+            updated_ids (set(int)): the ids of the updated Fireworks are added to it
+
+        Returns:
+            bool: True if the children need to be refreshed as well
+        """
         fw = self.id_fw[fw_id]
         prev_state = fw.state
 
         # if we're paused, defused or archived, just skip altogether
         if fw.state == 'DEFUSED' or fw.state == 'ARCHIVED' or fw.state == 'PAUSED':
             self.fw_states[fw_id] = fw.state
-            return updated_ids
+            return False
 
         completed_parent_states = ['COMPLETED']
         if fw.spec.get('_allow_fizzled_parents'):
             completed_parent_states.append('FIZZLED')
 
-        # check parent states for any that are not completed
-        for parent in self.links.parent_links.get(fw_id, []):
+        # check parent states for any that are not completed. The last parents are checked first:
+        # refresh() completes the parents in order, so when a FW with many parents is refreshed
+        # once per completed parent, the first parent checked is usually the one that is not done
+        for parent in reversed(self.links.parent_links.get(fw_id, [])):
             if self.fw_states[parent] not in completed_parent_states:
                 m_state = 'WAITING'
                 break
@@ -997,22 +1379,19 @@ class Workflow(FWSerializable):
         fw.state = m_state
         # Brings self.fw_states in sync with fw_states in db
         self.fw_states[fw_id] = m_state
+        self.updated_on = datetime.utcnow()
 
         if m_state != prev_state:
             updated_ids.add(fw_id)
 
             if m_state == 'COMPLETED':
-                updated_ids = updated_ids.union(self.apply_action(m_action, fw.fw_id))
+                updated_ids.update(self.apply_action(m_action, fw.fw_id))
 
             # refresh all the children that could possibly now be READY to run
             # note that "FIZZLED" is for _allow_fizzled_parents children
-            if m_state in ['COMPLETED', 'FIZZLED']:
-                for child_id in self.links[fw_id]:
-                    updated_ids = updated_ids.union(self.refresh(child_id, updated_ids))
-
-        self.updated_on = datetime.utcnow()
+            return m_state in ['COMPLETED', 'FIZZLED']
 
-        return updated_ids
+        return False
 
     @property
     def root_fw_ids(self):
@@ -1035,11 +1414,7 @@ class Workflow(FWSerializable):
         Returns:
             [int]: Firework ids of leaf FWs
         """
-        leaf_ids = []
-        for id, children in self.links.items():
-            if len(children) == 0:
-                leaf_ids.append(id)
-        return leaf_ids
+        return self.links.leaves
 
     def _reassign_ids(self, old_new):
         """
@@ -1048,6 +1423,9 @@ class Workflow(FWSerializable):
         Args:
             old_new (dict)
         """
+        if not old_new:
+            return
+
         # update id_fw
         new_id_fw = {}
         for (fwid, fws) in self.id_fw.items():
@@ -1082,6 +1460,7 @@ class Workflow(FWSerializable):
         m_dict['created_on'] = self.created_on
         m_dict['updated_on'] = self.updated_on
         m_dict['fw_states'] = dict([(str(k), v) for (k, v) in self.fw_states.items()])
+        m_dict['state_counts'] = dict(self.fw_states.counts)
         return m_dict
 
     def to_display_dict(self):
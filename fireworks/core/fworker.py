@@ -62,21 +62,15 @@ class FWorker(FWSerializable):
         Returns updated query dict.
         """
         q = dict(self._query)
-        fworker_check = [{"spec._fworker": {"$exists": False}},
-                         {"spec._fworker": None},
-                         {"spec._fworker": self.name}]
-        if '$or' in q:
-            q['$and'] = q.get('$and', [])
-            q['$and'].extend([{'$or': q.pop('$or')}, {'$or': fworker_check}])
-        else:
-            q['$or'] = fworker_check
+        # match on the routing keys stored with each Firework (see Firework.get_routing)
+        q['routing.fworker'] = {"$in": [None, self.name]}
         if self.category and isinstance(self.category, six.string_types):
             if self.category == "__none__":
-                q['spec._category'] = {"$exists": False}
+                q['routing.category'] = None
             else:
-                q['spec._category'] = self.category
+                q['routing.category'] = self.category
         elif self.category:  # category is list of str
-            q['spec._category'] = {"$in": self.category}
+            q['routing.category'] = {"$in": self.category}
 
         return q
 
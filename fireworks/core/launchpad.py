@@ -9,30 +9,40 @@ from monty.os.path import zpath
 The LaunchPad manages the FireWorks database.
 """
 
+import atexit
+import copy
 import datetime
+import hashlib
 import json
 import os
 import random
 import time
+import threading
 import traceback
 import shutil
+import tempfile
 import gridfs
+from uuid import uuid4
 from collections import OrderedDict, defaultdict
 from itertools import chain
 from tqdm import tqdm
-from bson import ObjectId
+from bson import BSON, ObjectId
+from bson.errors import InvalidDocument
 
 from pymongo import MongoClient
-from pymongo import DESCENDING, ASCENDING
-from pymongo.errors import DocumentTooLarge
+from pymongo import DESCENDING, ASCENDING, UpdateOne, DeleteOne, ReplaceOne, CursorType
+from pymongo.errors import DocumentTooLarge, CollectionInvalid, OperationFailure
 from monty.serialization import loadfn
 
 from fireworks.fw_config import LAUNCHPAD_LOC, SORT_FWS, RESERVATION_EXPIRATION_SECS, \
     RUN_EXPIRATION_SECS, MAINTAIN_INTERVAL, WFLOCK_EXPIRATION_SECS, WFLOCK_EXPIRATION_KILL, \
-    MONGO_SOCKET_TIMEOUT_MS, GRIDFS_FALLBACK_COLLECTION
-from fireworks.utilities.fw_serializers import FWSerializable, reconstitute_dates
+    MONGO_SOCKET_TIMEOUT_MS, GRIDFS_FALLBACK_COLLECTION, READY_EVENTS_MAX_BYTES, \
+    FUTURE_RUN_CACHE_SECS, WF_EXTERNAL_LINKS_MIN_FWS, WFLOCK_LEASE_SECS, WF_OPTIMISTIC_UPDATES, \
+    WFLOCK_STATS_MAX_BYTES, WFLOCK_STATS_MAX_WFS, BACKUP_MAX_ENTRIES, BACKUP_SPILL_BYTES
+from fireworks.utilities.fw_serializers import FWSerializable, reconstitute_dates, to_db_date, \
+    date_query, recursive_dict
 from fireworks.core.firework import Firework, Launch, Workflow, FWAction, Tracker
-from fireworks.utilities.fw_utilities import get_fw_logger
+from fireworks.utilities.fw_utilities import get_fw_logger, get_my_host
 
 __author__ = 'Anubhav Jain'
 __copyright__ = 'Copyright 2013, The Materials Project'
@@ -43,6 +53,10 @@ __date__ = 'Jan 30, 2013'
 
 # TODO: lots of duplication reduction and cleanup possible
 
+# fields of a Firework document that are copied to its entry in the ready_queue collection
+READY_QUEUE_FIELDS = OrderedDict([('spec._priority', 'priority'), ('routing.category', 'category'),
+                                  ('routing.fworker', 'fworker'), ('created_on', 'created_on')])
+
 
 class LockedWorkflowError(ValueError):
     """
@@ -52,13 +66,242 @@ class LockedWorkflowError(ValueError):
     pass
 
 
+class WorkflowVersionError(ValueError):
+    """
+    Error raised if a workflow that was loaded and changed without lock (WF_OPTIMISTIC_UPDATES)
+    was changed in the DB before it could be written.
+    """
+    pass
+
+
+class WFLockStats(object):
+    """
+    In-process registry of the WFLock statistics of each workflow: number of locks, total and
+    maximum wait and hold times, retries, forced kills, takeovers of expired leases and locks that
+    could not be acquired. It holds the statistics of at most max_wfs workflows, the ones locked
+    least recently being dropped first.
+    """
+
+    def __init__(self, max_wfs=WFLOCK_STATS_MAX_WFS):
+        """
+        Args:
+            max_wfs (int): max number of workflows (0 = unbounded)
+        """
+        self.max_wfs = max_wfs
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    def record(self, sample):
+        """
+        Args:
+            sample (dict): statistics of one lock, as recorded by WFLock
+        """
+        with self._lock:
+            wf_stats = self._stats.pop(sample['wf_id'], None) or {
+                'count': 0, 'wait_secs': 0, 'max_wait_secs': 0, 'hold_secs': 0,
+                'max_hold_secs': 0, 'retries': 0, 'kills': 0, 'takeovers': 0, 'timeouts': 0}
+            self._stats[sample['wf_id']] = wf_stats
+            while self.max_wfs and len(self._stats) > self.max_wfs:
+                self._stats.popitem(last=False)
+            wf_stats['fw_id'] = sample['fw_id']
+            wf_stats['count'] += 1
+            for k in ('wait_secs', 'hold_secs'):
+                wf_stats[k] += sample[k]
+                wf_stats['max_' + k] = max(wf_stats['max_' + k], sample[k])
+            wf_stats['retries'] += sample['retries']
+            wf_stats['kills'] += int(sample['killed'])
+            wf_stats['takeovers'] += int(sample['took_over'])
+            wf_stats['timeouts'] += int(sample['timed_out'])
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: workflow _id: statistics of its locks, with the fw_id of the last one
+        """
+        with self._lock:
+            return dict((wf_id, dict(wf_stats)) for wf_id, wf_stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class BackupStore(object):
+    """
+    Thread-safe store of the backup copies (DB documents) of the Launches and FireWorks being
+    run, used to restore them if a Rocket fails while processing its results. Documents are only
+    removed when popped or discarded: at most max_entries of them are kept in memory, the least
+    recently stored ones being moved to temporary files first. Documents larger than spill_bytes
+    (BSON-encoded) are always written to a temporary file. The temporary files left are removed
+    when the interpreter exits.
+    """
+
+    _spilled = set()  # paths of the temporary files of all the stores
+    _spilled_lock = threading.Lock()
+
+    def __init__(self, max_entries=BACKUP_MAX_ENTRIES, spill_bytes=BACKUP_SPILL_BYTES):
+        """
+        Args:
+            max_entries (int): max number of documents kept in memory (0 = unbounded)
+            spill_bytes (int): documents larger than this are stored in temporary files
+                (0 = only the documents beyond max_entries)
+        """
+        self.max_entries = max_entries
+        self.spill_bytes = spill_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key: (document, None) or (None, path of spilled document)
+        self._n_in_memory = 0
+
+    def __setitem__(self, key, doc):
+        entry = (doc, None)
+        if self.spill_bytes:
+            data = self._encode(doc)
+            if data is not None and len(data) > self.spill_bytes:
+                entry = (None, self._spill(data))
+        with self._lock:
+            _, old_path = self._pop_entry(key)
+            self._entries[key] = entry
+            if entry[1] is None:
+                self._n_in_memory += 1
+            over = self._n_in_memory - self.max_entries if self.max_entries else 0
+            oldest = [(k, e[0]) for k, e in self._entries.items() if e[1] is None][:max(over, 0)]
+        self._remove(old_path)
+        for k, old_doc in oldest:
+            self._move_to_file(k, old_doc)
+
+    def __getitem__(self, key):
+        with self._lock:
+            doc, path = self._entries[key]
+        if path is None:
+            return doc
+        with open(path, 'rb') as f:
+            return BSON(f.read()).decode()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def pop(self, key, default=None):
+        """
+        Remove a document from the store.
+
+        Args:
+            key: launch_id or fw_id
+            default: returned if there is no such document
+
+        Returns:
+            dict: the document
+        """
+        try:
+            doc = self[key]
+        except (KeyError, IOError, OSError):
+            doc = default
+        self.discard(key)
+        return doc
+
+    def discard(self, key):
+        """
+        Remove a document from the store without reading it, if it is there.
+
+        Args:
+            key: launch_id or fw_id
+        """
+        with self._lock:
+            _, path = self._pop_entry(key)
+        self._remove(path)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._n_in_memory = 0
+        for _, path in entries:
+            self._remove(path)
+
+    def _pop_entry(self, key):
+        # to be called with self._lock held
+        if key not in self._entries:
+            return None, None
+        doc, path = self._entries.pop(key)
+        if path is None:
+            self._n_in_memory -= 1
+        return doc, path
+
+    def _move_to_file(self, key, doc):
+        data = self._encode(doc)
+        if data is None:
+            return  # kept in memory
+        path = self._spill(data)
+        with self._lock:
+            # the document may have been popped or replaced meanwhile
+            if key in self._entries and self._entries[key][0] is doc:
+                self._entries[key] = (None, path)
+                self._n_in_memory -= 1
+                path = None
+        self._remove(path)
+
+    @staticmethod
+    def _encode(doc):
+        try:
+            return BSON.encode(doc)
+        except (InvalidDocument, TypeError):
+            return None  # kept as is, it is written as is to the DB anyway
+
+    @classmethod
+    def _spill(cls, data):
+        fd, path = tempfile.mkstemp(prefix='fw_backup_', suffix='.bson')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with cls._spilled_lock:
+            cls._spilled.add(path)
+        return path
+
+    @classmethod
+    def _remove(cls, path):
+        if path:
+            with cls._spilled_lock:
+                cls._spilled.discard(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @classmethod
+    def _remove_all_spilled(cls):
+        with cls._spilled_lock:
+            paths = list(cls._spilled)
+        for path in paths:
+            cls._remove(path)
+
+
+atexit.register(BackupStore._remove_all_spilled)
+
+
 class WFLock(object):
     """
     Lock a Workflow, i.e. for performing update operations
     Raises a LockedWorkflowError if the lock couldn't be acquired withing expire_secs and kill==False.
     Calling functions are responsible for handling the error in order to avoid database inconsistencies.
+
+    The lock is a lease stored in the 'locked' field of the workflow: the owner token, host and pid
+    of the holder and the time when the lease expires. The holder renews the lease in the
+    background (a single thread renews all the leases of a LaunchPad), so it only expires if the
+    holder died or hangs, and expired leases are taken over.
+    While the workflow is locked, acquisition is retried with capped exponential backoff.
+
+    Every lock records its wait and hold times, retries, forced kills and takeovers in
+    WFLock.stats and, if WFLOCK_STATS_MAX_BYTES is set, in the capped lock_stats collection
+    (see "lpad admin lock_report").
     """
 
+    backoff_min_secs = 0.01  # first wait for the lock
+    backoff_max_secs = 0.5  # longest wait for the lock between two attempts
+    stats = WFLockStats()  # statistics of all the locks of this process
+
     def __init__(self, lp, fw_id, expire_secs=WFLOCK_EXPIRATION_SECS, kill=WFLOCK_EXPIRATION_KILL):
         """
         Args:
@@ -71,37 +314,163 @@ class WFLock(object):
         self.fw_id = fw_id
         self.expire_secs = expire_secs
         self.kill = kill
+        self.owner = uuid4().hex
+        self._released = threading.Event()
+        self.wf_id = None  # _id of the workflow document, once found
+        self._query = None  # see query
+        self.wait_secs = 0
+        self.retries = 0
+        self.killed = False
+        self.took_over = False
+        self._started_on = None
+        self._acquired_at = None
+
+    @property
+    def query(self):
+        """
+        Returns:
+            dict: query on the workflows collection for the workflow of the Firework
+        """
+        if self._query is None:
+            self._query = self.lp._get_wf_query(self.fw_id)
+        return self._query
+
+    def get_lease(self):
+        """
+        Returns:
+            dict: the 'locked' field of a workflow locked by this WFLock
+        """
+        return {'owner': self.owner, 'host': get_my_host(), 'pid': os.getpid(),
+                'expires': datetime.datetime.utcnow() + datetime.timedelta(
+                    seconds=WFLOCK_LEASE_SECS)}
 
     def __enter__(self):
-        ctr = 0
-        waiting_time = 0
+        self._started_on = datetime.datetime.utcnow()
+        start = time.time()
+        backoff = self.backoff_min_secs
         # acquire lock
-        links_dict = self.lp.workflows.find_one_and_update({'nodes': self.fw_id,
-                                                            'locked': {"$exists": False}},
-                                                           {'$set': {'locked': True}})
-        # could not acquire lock b/c WF is already locked for writing
-        while not links_dict:
-            ctr += 1
-            time_incr = ctr/10.0+random.random()/100.0
-            time.sleep(time_incr)  # wait a bit for lock to free up
-            waiting_time += time_incr
-            if waiting_time > self.expire_secs:  # too much time waiting, expire lock
-                wf = self.lp.workflows.find_one({'nodes': self.fw_id})
-                if not wf:
-                    raise ValueError("Could not find workflow in database: {}".format(self.fw_id))
+        while not self._acquire():
+            # could not acquire lock b/c WF is already locked for writing
+            wf = self.lp.workflows.find_one(self.query, {'locked': 1})
+            if not wf:
+                raise ValueError("Could not find workflow in database: {}".format(self.fw_id))
+            self.wf_id = wf['_id']
+            time_incr = backoff * random.uniform(0.5, 1)
+            if time.time() - start + time_incr > self.expire_secs:  # too much time waiting
                 if self.kill:  # force lock acquisition
-                    self.lp.m_logger.warning('FORCIBLY ACQUIRING LOCK, WF: {}'.format(self.fw_id))
-                    links_dict = self.lp.workflows.find_one_and_update({'nodes': self.fw_id},
-                                                                       {'$set': {'locked': True}})
+                    self.lp.m_logger.warning('FORCIBLY ACQUIRING LOCK, WF: {}, HELD BY: {}'.format(
+                        self.fw_id, self._get_holder(wf.get('locked'))))
+                    self.lp.workflows.find_one_and_update(self.query,
+                                                          {'$set': {'locked': self.get_lease()}})
+                    self.killed = True
+                    break
                 else:  # throw error if we don't want to force lock acquisition
+                    self.wait_secs = time.time() - start
+                    self._record(timed_out=True)
                     raise LockedWorkflowError("Could not get workflow - LOCKED: {}".format(self.fw_id))
-            else:
-                # retry lock
-                links_dict = self.lp.workflows.find_one_and_update(
-                    {'nodes': self.fw_id, 'locked': {"$exists": False}}, {'$set': {'locked': True}})
+            time.sleep(time_incr)  # wait a bit for lock to free up
+            backoff = min(backoff * 2, self.backoff_max_secs)
+            self.retries += 1
+
+        self._acquired_at = time.time()
+        self.wait_secs = self._acquired_at - start
+        self._start_renewal()
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.lp.workflows.find_one_and_update({"nodes": self.fw_id}, {"$unset": {"locked": True}})
+        self.lp._remove_lease(self)
+        self._released.set()
+        if not self.lp.workflows.find_one_and_update(dict(self.query, **{'locked.owner': self.owner}),
+                                                     {'$unset': {'locked': True}}, {'_id': 1}):
+            self.lp.m_logger.warning('LOCK WAS TAKEN OVER BEFORE RELEASE, WF: {}'.format(self.fw_id))
+        self._record()
+
+    def claim(self, version):
+        """
+        Lock the workflow without waiting, only if it is not locked and still has the given
+        version, and increment its version. This is how a workflow that was loaded and changed
+        without lock (WF_OPTIMISTIC_UPDATES) is locked while it is written. The lock is released
+        by __exit__.
+
+        Args:
+            version (int): version of the workflow document when it was loaded, None if it had none
+
+        Returns:
+            bool: whether the lock was acquired
+        """
+        self._started_on = datetime.datetime.utcnow()
+        wf = self.lp.workflows.find_one_and_update(
+            dict(self.query, version=version, locked={'$exists': False}),
+            {'$set': {'locked': self.get_lease()}, '$inc': {'version': 1}}, {'_id': 1})
+        if wf is None:
+            return False
+        self.wf_id = wf['_id']
+        self._acquired_at = time.time()
+        self._start_renewal()
+        return True
+
+    def _acquire(self):
+        """
+        Try to lock the workflow once, taking over an expired lease.
+
+        Returns:
+            bool: whether the lock was acquired
+        """
+        wf = self.lp.workflows.find_one_and_update(
+            dict(self.query, **{'$or': [{'locked': {'$exists': False}},
+                                        {'locked.expires': {'$lt': datetime.datetime.utcnow()}}]}),
+            {'$set': {'locked': self.get_lease()}}, {'locked': 1})
+        if wf and 'locked' in wf:
+            self.lp.m_logger.warning('TOOK OVER EXPIRED LOCK, WF: {}, HELD BY: {}'.format(
+                self.fw_id, self._get_holder(wf['locked'])))
+            self.took_over = True
+        if wf:
+            self.wf_id = wf['_id']
+        return wf is not None
+
+    def _record(self, timed_out=False):
+        """
+        Record the statistics of this lock in WFLock.stats and, if WFLOCK_STATS_MAX_BYTES is
+        set, in the lock_stats collection.
+
+        Args:
+            timed_out (bool): whether the lock could not be acquired
+        """
+        sample = {'wf_id': self.wf_id, 'fw_id': self.fw_id, 'host': get_my_host(),
+                  'created_on': self._started_on, 'wait_secs': self.wait_secs,
+                  'hold_secs': 0 if timed_out else time.time() - self._acquired_at,
+                  'retries': self.retries, 'killed': self.killed, 'took_over': self.took_over,
+                  'timed_out': timed_out}
+        self.stats.record(sample)
+        if WFLOCK_STATS_MAX_BYTES:
+            self.lp._get_lock_stats().insert_one(sample)
+
+    def _start_renewal(self):
+        self.lp._add_lease(self)
+
+    def _renew(self):
+        """
+        Extend the lease, see LaunchPad._renew_leases.
+
+        Returns:
+            bool: whether the lock is still held
+        """
+        if self.lp.workflows.update_one(
+                dict(self.query, **{'locked.owner': self.owner}),
+                {'$set': {'locked.expires': self.get_lease()['expires']}}).matched_count:
+            return True
+        if not self._released.is_set():
+            self.lp.m_logger.warning('LOST LOCK, WF: {}'.format(self.fw_id))
+        return False
+
+    @staticmethod
+    def _get_holder(lease):
+        """
+        Describe the holder of a lease for the logs.
+        """
+        if isinstance(lease, dict):
+            return '{}, pid {}'.format(lease.get('host'), lease.get('pid'))
+        return 'unknown'
 
 
 class LaunchPad(FWSerializable):
@@ -164,13 +533,29 @@ class LaunchPad(FWSerializable):
         self.offline_runs = self.db.offline_runs
         self.fw_id_assigner = self.db.fw_id_assigner
         self.workflows = self.db.workflows
+        self.workflow_nodes = self.db.workflow_nodes
+        self.ready_queue = self.db.ready_queue
         if GRIDFS_FALLBACK_COLLECTION:
             self.gridfs_fallback = gridfs.GridFS(self.db, GRIDFS_FALLBACK_COLLECTION)
         else:
             self.gridfs_fallback = None
-
-        self.backup_launch_data = {}
-        self.backup_fw_data = {}
+        self._ready_events = None  # capped collection, created on first use
+        self._ready_events_capped = False
+        self._lock_stats = None  # capped collection, created on first use
+        self._future_run_cache = {}  # fworker query: (time, future_run_exists result)
+        self._completions = []  # launches waiting to be written by complete_launch()
+        self._completing = False  # a thread is writing completed launches
+        self._completions_cv = threading.Condition()
+        self._pinged_trackers = {}  # launch_id: (launch_dir, [Tracker], [content hash])
+        self._leases = {}  # held WFLock: time of its next renewal
+        self._renewing = False  # a thread is renewing the leases
+        self._leases_cv = threading.Condition()
+        self._ready_queue_complete = False  # see _is_ready_queue_complete()
+        self._routing_complete = False  # see _check_routing()
+
+        # backup copies of the checked out Launches and FireWorks, until they are completed
+        self.backup_launch_data = BackupStore()
+        self.backup_fw_data = BackupStore()
 
     def to_dict(self):
         """
@@ -213,6 +598,7 @@ class LaunchPad(FWSerializable):
         allowed_states = ["READY", "WAITING", "FIZZLED", "DEFUSED", "PAUSED"]
         self.fireworks.update_many({'fw_id': {"$in": fw_ids},
                                     'state': {"$in": allowed_states}}, mod_spec)
+        self._refresh_routing({'fw_id': {"$in": fw_ids}, 'state': {"$in": allowed_states}})
         for fw in self.fireworks.find({'fw_id': {"$in": fw_ids}, 'state': {"$nin": allowed_states}},
                                       {"fw_id": 1, "state": 1}):
             self.m_logger.warning("Cannot update spec of fw_id: {} with state: {}. "
@@ -260,7 +646,13 @@ class LaunchPad(FWSerializable):
             self.fireworks.delete_many({})
             self.launches.delete_many({})
             self.workflows.delete_many({})
+            self.workflow_nodes.delete_many({})
             self.offline_runs.delete_many({})
+            self.ready_queue.delete_many({})
+            self.db.drop_collection('ready_events')
+            self._ready_events = None
+            self.db.drop_collection('lock_stats')
+            self._lock_stats = None
             self._restart_ids(1, 1)
             if self.gridfs_fallback is not None:
                 self.db.drop_collection("{}.chunks".format(GRIDFS_FALLBACK_COLLECTION))
@@ -330,7 +722,8 @@ class LaunchPad(FWSerializable):
         # update the Workflow with the new ids
         wf._reassign_ids(old_new)
         # insert the WFLinks
-        self.workflows.insert_one(wf.to_db_dict())
+        self._insert_wfs([wf])
+        self._notify_ready([wf.id_fw[fw_id] for fw_id in wf.root_fw_ids])
         self.m_logger.info('Added a workflow. id_map: {}'.format(old_new))
         return old_new
 
@@ -372,9 +765,11 @@ class LaunchPad(FWSerializable):
 
         # Insert all fws and wfs, do workflows first so fws don't
         # get checked out prematurely
-        self.workflows.insert_many(wf.to_db_dict() for wf in wfs)
+        self._insert_wfs(wfs)
         all_fws = chain.from_iterable(wf.fws for wf in wfs)
         self.fireworks.insert_many(fw.to_db_dict() for fw in all_fws)
+        self._sync_ready_queue([wf.id_fw[fw_id] for wf in wfs for fw_id in wf.root_fw_ids])
+        self._notify_ready([wf.id_fw[fw_id] for wf in wfs for fw_id in wf.root_fw_ids])
         return None
 
     def append_wf(self, new_wf, fw_ids, detour=False, pull_spec_mods=True):
@@ -389,10 +784,9 @@ class LaunchPad(FWSerializable):
             pull_spec_mods (bool): Whether the new Workflow should pull the FWActions of the parent
                 fw_ids
         """
-        wf = self.get_wf_by_fw_id(fw_ids[0])
-        updated_ids = wf.append_wf(new_wf, fw_ids, detour=detour, pull_spec_mods=pull_spec_mods)
-        with WFLock(self, fw_ids[0]):
-            self._update_wf(wf, updated_ids)
+        # the workflow may be changed more than once, so new_wf itself is left as is
+        self._modify_wf(fw_ids[0], lambda wf: wf.append_wf(
+            copy.deepcopy(new_wf), fw_ids, detour=detour, pull_spec_mods=pull_spec_mods))
 
     def get_launch_by_id(self, launch_id):
         """
@@ -456,9 +850,12 @@ class LaunchPad(FWSerializable):
         Returns:
             A Workflow object
         """
-        links_dict = self.workflows.find_one({'nodes': fw_id})
+        links_dict = self.workflows.find_one(self._get_wf_query(fw_id))
         if not links_dict:
             raise ValueError("Could not find a Workflow with fw_id: {}".format(fw_id))
+        if links_dict.get('external_links'):
+            links_dict['links'] = self._get_external_links(links_dict['_id'])[0]
+            links_dict['nodes'] = list(links_dict['links'])
         fws = map(self.get_fw_by_id, links_dict["nodes"])
         return Workflow(fws, links_dict['links'], links_dict['name'],
                         links_dict['metadata'], links_dict['created_on'], links_dict['updated_on'])
@@ -473,22 +870,108 @@ class LaunchPad(FWSerializable):
         Returns:
             A Workflow object
         """
-        links_dict = self.workflows.find_one({'nodes': fw_id})
+        return self._get_wf_by_fw_id_lzyfw(fw_id)[0]
+
+    def _get_wf_by_fw_id_lzyfw(self, fw_id, fw_ids=None):
+        """
+        Args:
+            fw_id (int)
+            fw_ids ([int]): the fireworks to refresh, if only the part of a workflow with external
+                links around them is needed (see _get_partial_wf)
+
+        Returns:
+            (Workflow, dict): the Workflow containing the FireWork, with LazyFireworks, and the
+                workflow document it was loaded from
+        """
+        links_dict = self.workflows.find_one(self._get_wf_query(fw_id))
         if not links_dict:
             raise ValueError("Could not find a Workflow with fw_id: {}".format(fw_id))
 
-        fws = []
-        for fw_id in links_dict['nodes']:
-            fws.append(LazyFirework(fw_id, self.fireworks, self.launches, self.gridfs_fallback))
         # Check for fw_states in links_dict to conform with pre-optimized workflows
-        if 'fw_states' in links_dict:
-            fw_states = dict([(int(k), v) for (k, v) in links_dict['fw_states'].items()])
+        if links_dict.get('external_links'):
+            # the state_counts are missing after a failed refresh, until a full one
+            if fw_ids and 'state_counts' in links_dict:
+                return self._get_partial_wf(links_dict, fw_ids), links_dict
+            links, fw_states = self._get_external_links(links_dict['_id'])
+            nodes = list(links)
         else:
-            fw_states = None
+            links = links_dict['links']
+            nodes = links_dict['nodes']
+            if 'fw_states' in links_dict:
+                fw_states = dict([(int(k), v) for (k, v) in links_dict['fw_states'].items()])
+            else:
+                fw_states = None
 
-        return Workflow(fws, links_dict['links'], links_dict['name'],
-                        links_dict['metadata'], links_dict['created_on'],
-                        links_dict['updated_on'], fw_states)
+        fws = []
+        for fw_id in nodes:
+            fws.append(LazyFirework(fw_id, self.fireworks, self.launches, self.gridfs_fallback))
+        wf = Workflow(fws, links, links_dict['name'],
+                      links_dict['metadata'], links_dict['created_on'],
+                      links_dict['updated_on'], fw_states)
+        return wf, links_dict
+
+    def _get_partial_wf(self, links_dict, fw_ids):
+        """
+        Load the part of a workflow with external links that is needed to refresh the given
+        fireworks: the fireworks, their parents, their children and the parents of their children.
+
+        Args:
+            links_dict (dict): the workflow document
+            fw_ids ([int])
+
+        Returns:
+            _PartialWorkflow
+        """
+        nodes = {}
+
+        def load(query):
+            query['wf_id'] = links_dict['_id']
+            for node in self.workflow_nodes.find(query, {'_id': 0, 'fw_id': 1, 'children': 1,
+                                                         'state': 1}):
+                nodes[node['fw_id']] = node
+
+        focus = set(fw_ids)
+        load({'fw_id': {'$in': list(focus)}})
+        children = set(c for f in focus if f in nodes for c in nodes[f]['children'])
+        load({'fw_id': {'$in': list(children.difference(nodes))}})
+        load({'children': {'$in': list(focus.union(children))}, 'fw_id': {'$nin': list(nodes)}})
+
+        # the children of the other fireworks are limited to the ones loaded
+        links = dict((fw_id, node['children'] if fw_id in focus else
+                      [c for c in node['children'] if c in nodes])
+                     for fw_id, node in nodes.items())
+        fws = [LazyFirework(fw_id, self.fireworks, self.launches, self.gridfs_fallback)
+               for fw_id in nodes]
+        return _PartialWorkflow(fws, links, links_dict['name'], links_dict['metadata'],
+                                links_dict['created_on'], links_dict['updated_on'],
+                                dict((fw_id, node['state']) for fw_id, node in nodes.items()),
+                                focus, focus.union(children), links_dict['state_counts'])
+
+    def _get_wf_query(self, fw_id):
+        """
+        Args:
+            fw_id (int)
+
+        Returns:
+            dict: query on the workflows collection for the workflow of the firework. The workflow
+                document of a workflow with external links only has its first firework in nodes,
+                and is found from the workflow_nodes collection.
+        """
+        node = self.workflow_nodes.find_one({'fw_id': fw_id}, {'wf_id': 1})
+        return {'_id': node['wf_id']} if node else {'nodes': fw_id}
+
+    def _get_wf_nodes(self, links_dict):
+        """
+        Args:
+            links_dict (dict): a workflow document, with external_links if it has them
+
+        Returns:
+            [int]: the fw_ids of the workflow
+        """
+        if links_dict.get('external_links'):
+            return [node['fw_id'] for node in self.workflow_nodes.find(
+                {'wf_id': links_dict['_id']}, {'_id': 0, 'fw_id': 1})]
+        return links_dict['nodes']
 
     def delete_wf(self, fw_id, delete_launch_dirs=False):
         """
@@ -499,8 +982,9 @@ class LaunchPad(FWSerializable):
             delete_launch_dirs (bool): if True all the launch directories associated with
                 the WF will be deleted as well, if possible.
         """
-        links_dict = self.workflows.find_one({'nodes': fw_id})
-        fw_ids = links_dict["nodes"]
+        links_dict = self.workflows.find_one(self._get_wf_query(fw_id),
+                                             {'nodes': 1, 'external_links': 1})
+        fw_ids = self._get_wf_nodes(links_dict)
         potential_launch_ids = []
         launch_ids = []
         for i in fw_ids:
@@ -530,7 +1014,8 @@ class LaunchPad(FWSerializable):
         self.launches.delete_many({'launch_id': {"$in": launch_ids}})
         self.offline_runs.delete_many({'launch_id': {"$in": launch_ids}})
         self.fireworks.delete_many({"fw_id": {"$in": fw_ids}})
-        self.workflows.delete_one({'nodes': fw_id})
+        self.workflow_nodes.delete_many({"fw_id": {"$in": fw_ids}})
+        self.workflows.delete_one({'_id': links_dict['_id']})
 
     def get_wf_summary_dict(self, fw_id, mode="more"):
         """
@@ -544,7 +1029,7 @@ class LaunchPad(FWSerializable):
         Returns:
             dict: information about Workflow.
         """
-        wf_fields = ["state", "created_on", "name", "nodes"]
+        wf_fields = ["state", "created_on", "name", "nodes", "external_links"]
         fw_fields = ["state", "fw_id"]
         launch_fields = []
 
@@ -560,7 +1045,10 @@ class LaunchPad(FWSerializable):
         if mode == "all":
             wf_fields = None
 
-        wf = self.workflows.find_one({"nodes": fw_id}, projection=wf_fields)
+        wf = self.workflows.find_one(self._get_wf_query(fw_id), projection=wf_fields)
+        wf["nodes"] = self._get_wf_nodes(wf)
+        if mode != "all":
+            wf.pop("external_links", None)
         fw_data = []
         id_name_map = {}
         launch_ids = []
@@ -598,7 +1086,12 @@ class LaunchPad(FWSerializable):
             del wf["nodes"]
 
         if mode == "all":
-            del wf["fw_states"]
+            if wf.get("external_links"):
+                links = Workflow.Links(self._get_external_links(wf["_id"])[0]).to_db_dict()
+                wf["links"] = links["links"]
+                wf["parent_links"] = links["parent_links"]
+            else:
+                del wf["fw_states"]
             wf["links"] = {id_name_map[int(k)]: [id_name_map[i] for i in v] for k, v in wf["links"].items()}
             wf["parent_links"] = {id_name_map[int(k)]: [id_name_map[i] for i in v]
                                   for k, v in wf["parent_links"].items()}
@@ -676,33 +1169,110 @@ class LaunchPad(FWSerializable):
         Returns:
             bool: True if the database contains any FireWorks that are ready to run.
         """
+        self._check_routing()
         q = fworker.query if fworker else {}
-        return bool(self._get_a_fw_to_run(query=q, checkout=False))
+        return self._get_a_fw_to_run(query=q, checkout=False) is not None
+
+    def get_ready_event_id(self):
+        """
+        Get the id of the latest READY event (see wait_for_ready). Get it before checking for
+        FireWorks to run, so that FireWorks becoming READY after the check are not missed.
+
+        Returns:
+            ObjectId: id of the latest READY event, None if it cannot be read
+        """
+        try:
+            last = self._get_ready_events().find_one(sort=[('_id', DESCENDING)],
+                                                     projection={'_id': 1})
+        except OperationFailure:
+            return None
+        return last['_id'] if last else ObjectId('0' * 24)
+
+    def wait_for_ready(self, timeout, fworker=None, since=None):
+        """
+        Block until new FireWorks become READY or until timeout seconds have passed. Idle
+        launchers call this instead of sleeping, so that they wake up as soon as e.g. a dynamic
+        workflow adds new FireWorks.
+
+        Args:
+            timeout (float): max number of seconds to wait
+            fworker (FWorker): if set, only wake up for FireWorks that this FWorker can run
+            since (ObjectId): only wake up for the READY events after this one (see
+                get_ready_event_id). By default, the events after the latest one.
+
+        Returns:
+            bool: True if woken up by new READY FireWorks, False on timeout
+        """
+        deadline = time.time() + timeout
+        try:
+            events = self._get_ready_events()
+            if not self._ready_events_capped:
+                raise OperationFailure('{} is not a capped collection'.format(events.name))
+            if since is None:
+                since = self.get_ready_event_id()
+            query = {'_id': {'$gt': since}}
+            rq_query = self._get_ready_queue_query(fworker.query) if fworker else None
+            if rq_query:
+                # the events record the routing keys of their FireWorks, like the ready_queue
+                query['routing'] = {'$elemMatch': rq_query}
+            while time.time() < deadline:
+                cursor = events.find(query, cursor_type=CursorType.TAILABLE_AWAIT).\
+                    max_await_time_ms(1000)
+                while cursor.alive and time.time() < deadline:
+                    for _ in cursor:
+                        return True
+                # a tailable cursor dies right away on an empty collection; retry shortly
+                time.sleep(max(0, min(1, deadline - time.time())))
+        except OperationFailure as e:
+            self.m_logger.debug('Cannot tail READY events, sleeping instead: {}'.format(e))
+            time.sleep(max(0, deadline - time.time()))
+        return False
 
     def future_run_exists(self, fworker=None):
         """Check if database has any current OR future Fireworks available
 
+        The answer is cached for FUTURE_RUN_CACHE_SECS, e.g. for the many rapidfire processes
+        of a multi launcher sharing this LaunchPad.
+
         Returns:
             bool: True if database has any ready or waiting Fireworks.
         """
+        self._check_routing()
+        q = fworker.query if fworker else {}
+        cache_key = json.dumps(q, sort_keys=True, default=str)
+        cached = self._future_run_cache.get(cache_key)
+        if cached and time.time() - cached[0] < FUTURE_RUN_CACHE_SECS:
+            return cached[1]
+
         if self.run_exists(fworker):
             # check first to see if any are READY
-            return True
+            exists = True
         else:
             # retrieve all [RUNNING/RESERVED] fireworks
-            q = fworker.query if fworker else {}
             q.update({'state': {'$in': ['RUNNING', 'RESERVED']}})
             active = self.get_fw_ids(q)
-            # then check if they have WAITING children
-            for fw_id in active:
-                children = self.get_wf_by_fw_id_lzyfw(fw_id).links[fw_id]
-                if any(self.get_fw_dict_by_id(i)['state'] == 'WAITING'
-                       for i in children):
-                    return True
-
-            # if we loop over all active and none have WAITING children
-            # there is no future work to do
-            return False
+            # then check if they have WAITING children, using the links and fw_states of
+            # their workflows rather than loading each child
+            exists = False
+            if active:
+                for wf in self.workflows.find({'nodes': {'$in': active},
+                                               'external_links': {'$exists': False}},
+                                              {'nodes': 1, 'links': 1, 'fw_states': 1}):
+                    if any(wf['fw_states'].get(str(child)) == 'WAITING'
+                           for fw_id in set(wf['nodes']).intersection(active)
+                           for child in wf['links'].get(str(fw_id), [])):
+                        exists = True
+                        break
+            if active and not exists:
+                # the fireworks of workflows with external links
+                children = set()
+                for node in self.workflow_nodes.find({'fw_id': {'$in': active}}, {'children': 1}):
+                    children.update(node['children'])
+                exists = bool(self.workflow_nodes.find_one(
+                    {'fw_id': {'$in': list(children)}, 'state': 'WAITING'}, {'_id': 1}))
+
+        self._future_run_cache[cache_key] = (time.time(), exists)
+        return exists
 
     def tuneup(self, bkground=True):
         """
@@ -712,12 +1282,15 @@ class LaunchPad(FWSerializable):
 
         self.m_logger.debug('Updating indices...')
         self.fireworks.create_index('fw_id', unique=True, background=bkground)
-        for f in ("state", 'spec._category', 'created_on', 'updated_on' 'name', 'launches'):
+        for f in ("state", 'spec._category', 'created_on', 'updated_on', 'name', 'launches'):
             self.fireworks.create_index(f, background=bkground)
 
         self.launches.create_index('launch_id', unique=True, background=bkground)
         self.launches.create_index('fw_id', background=bkground)
         self.launches.create_index('state_history.reservation_id', background=bkground)
+        # for detect_lostruns and detect_unreserved
+        self.launches.create_index([("state_history.state", ASCENDING),
+                                    ("state_history.updated_on", ASCENDING)], background=bkground)
 
         if GRIDFS_FALLBACK_COLLECTION is not None:
             files_collection = self.db["{}.files".format(GRIDFS_FALLBACK_COLLECTION)]
@@ -728,6 +1301,11 @@ class LaunchPad(FWSerializable):
 
         for f in ('name', 'created_on', 'updated_on', 'nodes'):
             self.workflows.create_index(f, background=bkground)
+        self.workflow_nodes.create_index('fw_id', unique=True, background=bkground)
+        self.workflow_nodes.create_index([('wf_id', ASCENDING), ('state', ASCENDING)],
+                                         background=bkground)
+        # to find the parents of a firework
+        self.workflow_nodes.create_index('children', background=bkground)
 
         for idx in self.user_indices:
             self.fireworks.create_index(idx, background=bkground)
@@ -741,8 +1319,28 @@ class LaunchPad(FWSerializable):
                                      ("created_on", DESCENDING)], background=bkground)
         self.fireworks.create_index([("state", DESCENDING), ("spec._priority", DESCENDING),
                                      ("created_on", ASCENDING)], background=bkground)
+        # for checkout, see FWorker.query
+        for created_on_order in (ASCENDING, DESCENDING):
+            self.fireworks.create_index([("state", DESCENDING), ("routing.category", ASCENDING),
+                                         ("routing.fworker", ASCENDING),
+                                         ("spec._priority", DESCENDING),
+                                         ("created_on", created_on_order)], background=bkground)
         self.workflows.create_index([("state", DESCENDING), ("_id", DESCENDING)], background=bkground)
 
+        self.ready_queue.create_index('fw_id', unique=True, background=bkground)
+        for created_on_order in (ASCENDING, DESCENDING):
+            self.ready_queue.create_index([("category", ASCENDING), ("fworker", ASCENDING),
+                                           ("priority", DESCENDING),
+                                           ("created_on", created_on_order)], background=bkground)
+
+        self._check_routing()
+
+        # also repairs the entries lost if a process died between the write of a firework and
+        # the one of its ready_queue entry
+        self.m_logger.debug('Adding READY FWs to the ready_queue...')
+        n_ready = self._backfill_ready_queue()
+        self.m_logger.info('{} READY FWs in the ready_queue'.format(n_ready))
+
         if not bkground:
             self.m_logger.debug('Compacting database...')
             try:
@@ -751,6 +1349,78 @@ class LaunchPad(FWSerializable):
             except:
                 self.m_logger.debug('Database compaction failed (not critical)')
 
+    def migrate_dates(self, batch_size=1000):
+        """
+        Convert the dates of the fireworks, launches and ready_queue collections that are stored
+        as isoformat strings to BSON dates (see BSON_DATES), batch_size documents at a time. Only
+        the documents with string dates are read, so the migration can be interrupted and run
+        again, and run while FireWorks are running. BSON_DATES must be set beforehand, so that
+        documents written in the meantime get BSON dates as well and that the dates are queried
+        and reported as BSON dates.
+
+        Args:
+            batch_size (int): number of documents read and updated at a time
+
+        Returns:
+            dict: number of documents converted in each collection
+        """
+        # the dates written by FireWorks (see BSON_DATES)
+        if not isinstance(to_db_date(datetime.datetime.utcnow()), datetime.datetime):
+            raise ValueError("Set BSON_DATES: True in the FW_config.yaml file before migrating "
+                             "the dates; otherwise FireWorks keeps writing string dates.")
+        n_migrated = {}
+        for coll_name, fields in (('fireworks', ['created_on', 'updated_on']),
+                                  ('launches', ['time_start', 'time_end',
+                                                'state_history.created_on',
+                                                'state_history.updated_on']),
+                                  ('ready_queue', ['created_on'])):
+            coll = self.db[coll_name]
+            query = {'$or': [{f: {'$type': 'string'}} for f in fields]}
+            projection = dict((f.split('.')[0], 1) for f in fields)
+            n_migrated[coll_name] = 0
+            last_id = None
+            while True:
+                if last_id is not None:
+                    query['_id'] = {'$gt': last_id}
+                docs = list(coll.find(query, projection).sort('_id', ASCENDING).limit(batch_size))
+                if not docs:
+                    break
+                requests = []
+                for doc in docs:
+                    old_dates, new_dates = self._get_date_updates(doc)
+                    if new_dates:
+                        # the old dates are part of the filter, so that documents that changed
+                        # since they were read are left for the next migration
+                        old_dates['_id'] = doc['_id']
+                        requests.append(UpdateOne(old_dates, {'$set': new_dates}))
+                if requests:
+                    n_migrated[coll_name] += coll.bulk_write(requests, ordered=False).modified_count
+                last_id = docs[-1]['_id']
+                self.m_logger.debug('Migrated the dates of {} {}'.format(n_migrated[coll_name],
+                                                                         coll_name))
+        return n_migrated
+
+    @staticmethod
+    def _get_date_updates(doc):
+        """
+        Args:
+            doc (dict): firework, launch or ready_queue document
+
+        Returns:
+            (dict, dict): the string dates of the document and their BSON dates, by field path
+        """
+        values = [(k, v) for k, v in doc.items() if k not in ('_id', 'state_history')]
+        for i, entry in enumerate(doc.get('state_history', [])):
+            values.extend(('state_history.{}.{}'.format(i, k), entry.get(k))
+                          for k in ('created_on', 'updated_on', 'expires_on') if k in entry)
+        old_dates, new_dates = {}, {}
+        for path, value in values:
+            date = reconstitute_dates(value)
+            if date is not value and isinstance(date, datetime.datetime):
+                old_dates[path] = value
+                new_dates[path] = date
+        return old_dates, new_dates
+
     def pause_fw(self,fw_id):
         """
         Given the firework id, pauses the firework and refresh the workflow
@@ -761,8 +1431,9 @@ class LaunchPad(FWSerializable):
         allowed_states =  ['WAITING', 'READY', 'RESERVED']
         f = self.fireworks.find_one_and_update(
             {'fw_id': fw_id, 'state': {'$in': allowed_states}},
-            {'$set': {'state': 'PAUSED', 'updated_on': datetime.datetime.utcnow()}})
+            {'$set': {'state': 'PAUSED', 'updated_on': to_db_date(datetime.datetime.utcnow())}})
         if f:
+            self.ready_queue.delete_one({'fw_id': fw_id})
             self._refresh_wf(fw_id)
         if not f:
             self.m_logger.error('No pausable (WAITING,READY,RESERVED) Firework exists with fw_id: {}'.format(fw_id))
@@ -781,15 +1452,17 @@ class LaunchPad(FWSerializable):
         allowed_states = ['DEFUSED', 'WAITING', 'READY', 'FIZZLED', 'PAUSED']
         f = self.fireworks.find_one_and_update(
             {'fw_id': fw_id, 'state': {'$in': allowed_states}},
-            {'$set': {'state': 'DEFUSED', 'updated_on': datetime.datetime.utcnow()}})
+            {'$set': {'state': 'DEFUSED', 'updated_on': to_db_date(datetime.datetime.utcnow())}})
         if f:
+            self.ready_queue.delete_one({'fw_id': fw_id})
             self._refresh_wf(fw_id)
         if not f:
             self.rerun_fw(fw_id, rerun_duplicates)
             f = self.fireworks.find_one_and_update(
             {'fw_id': fw_id, 'state': {'$in': allowed_states}},
-            {'$set': {'state': 'DEFUSED', 'updated_on': datetime.datetime.utcnow()}})
+            {'$set': {'state': 'DEFUSED', 'updated_on': to_db_date(datetime.datetime.utcnow())}})
             if f:
+                self.ready_queue.delete_one({'fw_id': fw_id})
                 self._refresh_wf(fw_id)
         return f
 
@@ -802,7 +1475,7 @@ class LaunchPad(FWSerializable):
         """
         f = self.fireworks.find_one_and_update({'fw_id': fw_id, 'state': 'DEFUSED'},
                                                {'$set': {'state': 'WAITING',
-                                                         'updated_on': datetime.datetime.utcnow()}})
+                                                         'updated_on': to_db_date(datetime.datetime.utcnow())}})
         if f:
             self._refresh_wf(fw_id)
         return f
@@ -816,7 +1489,7 @@ class LaunchPad(FWSerializable):
         """
         f = self.fireworks.find_one_and_update({'fw_id': fw_id, 'state': 'PAUSED'},
                                                {'$set': {'state': 'WAITING',
-                                                         'updated_on': datetime.datetime.utcnow()}})
+                                                         'updated_on': to_db_date(datetime.datetime.utcnow())}})
         if f:
             self._refresh_wf(fw_id)
         return f
@@ -876,7 +1549,7 @@ class LaunchPad(FWSerializable):
             for fw in wf.fws:
                 self.fireworks.find_one_and_update({'fw_id': fw.fw_id},
                                                    {'$set': {'state': 'ARCHIVED',
-                                                             'updated_on': datetime.datetime.utcnow()}})
+                                                             'updated_on': to_db_date(datetime.datetime.utcnow())}})
                 self._refresh_wf(fw.fw_id)
 
     def _restart_ids(self, next_fw_id, next_launch_id):
@@ -888,9 +1561,13 @@ class LaunchPad(FWSerializable):
             next_launch_id (int): id to give next Launch
         """
         self.fw_id_assigner.delete_many({})
+        # a new database has no fireworks yet, all of them will have routing keys and go in the
+        # ready_queue
         self.fw_id_assigner.find_one_and_replace({'_id': -1},
                                                  {'next_fw_id': next_fw_id,
-                                                  'next_launch_id': next_launch_id}, upsert=True)
+                                                  'next_launch_id': next_launch_id,
+                                                  'ready_queue_complete': True,
+                                                  'routing_complete': True}, upsert=True)
         self.m_logger.debug(
             'RESTARTED fw_id, launch_id to ({}, {})'.format(next_fw_id, next_launch_id))
 
@@ -912,7 +1589,7 @@ class LaunchPad(FWSerializable):
         self._refresh_wf(m_fw.fw_id)  # since we updated a state, we need to refresh the WF again
         return False
 
-    def _get_a_fw_to_run(self, query=None, fw_id=None, checkout=True):
+    def _get_a_fw_to_run(self, query=None, fw_id=None, checkout=True, launch_id=None):
         """
         Get the next ready firework to run.
 
@@ -922,39 +1599,286 @@ class LaunchPad(FWSerializable):
                 Note: We want to return None if this specific FW  doesn't exist anymore. This is
                 because our queue params might have been tailored to this FW.
             checkout (bool): if True, check out the matching firework and set state=RESERVED
+            launch_id (int): with fw_id, a RESERVED firework is only returned if it is reserved
+                by this launch
 
         Returns:
-            Firework
+            Firework: the checked out firework, or if not checkout, the fw_id (int) of a firework
+                ready to run
         """
         m_query = dict(query) if query else {}  # make a defensive copy
         m_query['state'] = 'READY'
-        sortby = [("spec._priority", DESCENDING)]
-
-        if SORT_FWS.upper() == "FIFO":
-            sortby.append(("created_on", ASCENDING))
-        elif SORT_FWS.upper() == "FILO":
-            sortby.append(("created_on", DESCENDING))
+        sortby = self._get_checkout_sort()
 
         # Override query if fw_id defined
-        if fw_id:
+        if fw_id and launch_id:
+            m_query = {"fw_id": fw_id, "$or": [{"state": "READY"},
+                                               {"state": "RESERVED", "launches": launch_id}]}
+        elif fw_id:
             m_query = {"fw_id": fw_id, "state": {'$in': ['READY', 'RESERVED']}}
+        else:
+            # use the small ready_queue collection, once it holds all the READY fireworks
+            rq_query = self._get_ready_queue_query(query)
+            if rq_query is not None and self._is_ready_queue_complete():
+                return self._get_a_fw_from_ready_queue(rq_query, checkout)
 
         while True:
             # check out the matching firework, depending on the query set by the FWorker
             if checkout:
                 m_fw = self.fireworks.find_one_and_update(m_query,
                                                           {'$set': {'state': 'RESERVED',
-                                                           'updated_on': datetime.datetime.utcnow()}},
-                                                          sort=sortby)
+                                                           'updated_on': to_db_date(datetime.datetime.utcnow())}},
+                                                          projection={'fw_id': 1}, sort=sortby)
             else:
-                m_fw = self.fireworks.find_one(m_query, {'fw_id': 1, 'spec': 1}, sort=sortby)
+                m_fw = self.fireworks.find_one(m_query, {'fw_id': 1, 'spec._dupefinder': 1},
+                                               sort=sortby)
 
             if not m_fw:
                 return None
-            m_fw = self.get_fw_by_id(m_fw['fw_id'])
-            if self._check_fw_for_uniqueness(m_fw):
+            if checkout and fw_id:
+                # not picked from the ready_queue: drop its entry
+                self.ready_queue.delete_one({'fw_id': fw_id})
+            m_fw = self._check_candidate(m_fw, checkout)
+            if m_fw is not None:
+                return m_fw
+
+    def _check_candidate(self, fw_doc, checkout):
+        """
+        Check that a candidate firework to run is not a duplicate (see _check_fw_for_uniqueness).
+        Without checkout, the firework is only loaded if it has a _dupefinder.
+
+        Args:
+            fw_doc (dict): firework document with at least the fw_id, and spec._dupefinder if
+                not checkout
+            checkout (bool): if the candidate was checked out
+
+        Returns:
+            Firework or int: the loaded firework (fw_id if not checkout), or None if it is a
+                duplicate
+        """
+        if not checkout and '_dupefinder' not in fw_doc.get('spec', {}):
+            return fw_doc['fw_id']
+        m_fw = self.get_fw_by_id(fw_doc['fw_id'])
+        if not self._check_fw_for_uniqueness(m_fw):
+            return None
+        return m_fw if checkout else m_fw.fw_id
+
+    def _is_ready_queue_complete(self):
+        """
+        Returns:
+            bool: True if all the READY fireworks have an entry in the ready_queue, i.e. the
+                database was created or backfilled (see _backfill_ready_queue) by a version of
+                FireWorks that maintains it. Until then, fireworks are checked out from the
+                fireworks collection, which might hold READY fireworks of higher priority.
+        """
+        if not self._ready_queue_complete:
+            ids = self.fw_id_assigner.find_one({}, {'ready_queue_complete': 1})
+            self._ready_queue_complete = bool(ids and ids.get('ready_queue_complete'))
+        return self._ready_queue_complete
+
+    def _backfill_ready_queue(self):
+        """
+        Add an entry to the ready_queue for each READY firework, e.g. the ones that became READY
+        before the ready_queue existed, and mark the ready_queue as complete. Until then, fireworks
+        are checked out from the fireworks collection.
+
+        Returns:
+            int: number of READY fireworks
+        """
+        n_ready = 0
+        requests = []
+        for fw in self.fireworks.find({'state': 'READY'},
+                                      {'fw_id': 1, 'spec._fworker': 1, 'spec._category': 1,
+                                       'spec._priority': 1, 'spec._dupefinder': 1,
+                                       'created_on': 1}):
+            entry = self._get_ready_queue_entry(fw['fw_id'], fw.get('spec', {}),
+                                                fw.get('created_on'))
+            requests.append(UpdateOne({'fw_id': fw['fw_id']}, {'$set': entry}, upsert=True))
+            n_ready += 1
+            if len(requests) == 1000:
+                self.ready_queue.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            self.ready_queue.bulk_write(requests, ordered=False)
+        self.fw_id_assigner.update_one({}, {'$set': {'ready_queue_complete': True}})
+        self._ready_queue_complete = True
+        return n_ready
+
+    def _get_a_fw_from_ready_queue(self, rq_query, checkout=True):
+        """
+        Get the next ready firework to run from the ready_queue collection. The state of the
+        Firework itself is checked (and set to RESERVED if checkout) only after picking its entry,
+        and entries of FireWorks that are not READY anymore are dropped along the way.
+
+        Args:
+            rq_query (dict): query on the ready_queue collection
+            checkout (bool): if True, check out the matching firework and set state=RESERVED
+
+        Returns:
+            Firework: the checked out firework, or if not checkout, the fw_id (int) of a firework
+                ready to run
+        """
+        sortby = [(READY_QUEUE_FIELDS.get(k, k), d) for k, d in self._get_checkout_sort()]
+        while True:
+            if checkout:
+                entry = self.ready_queue.find_one_and_delete(rq_query, projection={'fw_id': 1},
+                                                             sort=sortby)
+            else:
+                entry = self.ready_queue.find_one(rq_query, {'fw_id': 1}, sort=sortby)
+            if not entry:
+                return None
+
+            if checkout:
+                m_fw = self.fireworks.find_one_and_update({'fw_id': entry['fw_id'], 'state': 'READY'},
+                                                          {'$set': {'state': 'RESERVED',
+                                                           'updated_on': to_db_date(datetime.datetime.utcnow())}},
+                                                          projection={'fw_id': 1})
+            else:
+                m_fw = self.fireworks.find_one({'fw_id': entry['fw_id'], 'state': 'READY'},
+                                               {'fw_id': 1, 'spec._dupefinder': 1})
+            if not m_fw:
+                # stale entry, the Firework was checked out or changed state in the meantime
+                self.ready_queue.delete_one({'_id': entry['_id']})
+                continue
+            m_fw = self._check_candidate(m_fw, checkout)
+            if m_fw is not None:
                 return m_fw
 
+    @staticmethod
+    def _get_ready_queue_query(query):
+        """
+        Translate a query on the fireworks collection (e.g. FWorker.query) to the equivalent
+        query on the ready_queue collection.
+
+        Args:
+            query (dict)
+
+        Returns:
+            dict: the translated query, or None if the query uses fields that are not in the
+                ready_queue
+        """
+        if not query:
+            return {}
+        rq_query = {}
+        for k, v in query.items():
+            if k in ('$or', '$and', '$nor'):
+                v = [LaunchPad._get_ready_queue_query(q) for q in v]
+                if any(q is None for q in v):
+                    return None
+                rq_query[k] = v
+            elif k in READY_QUEUE_FIELDS:
+                rq_query[READY_QUEUE_FIELDS[k]] = v
+            elif k == 'state' and v == 'READY':
+                continue
+            else:
+                return None
+        return rq_query
+
+    def _sync_ready_queue(self, fws):
+        """
+        Add the READY fireworks to the ready_queue collection and remove the others.
+
+        Args:
+            fws ([Firework]): fireworks with up-to-date ids and states
+        """
+        requests = []
+        for fw in fws:
+            if fw.state == 'READY':
+                entry = self._get_ready_queue_entry(fw.fw_id, fw.spec, fw.created_on)
+                requests.append(UpdateOne({'fw_id': fw.fw_id}, {'$set': entry}, upsert=True))
+            else:
+                requests.append(DeleteOne({'fw_id': fw.fw_id}))
+        if requests:
+            self.ready_queue.bulk_write(requests, ordered=False)
+
+    @staticmethod
+    def _get_ready_queue_entry(fw_id, spec, created_on):
+        """
+        Returns:
+            dict: the ready_queue entry of a READY firework
+        """
+        entry = Firework.get_routing(spec)
+        entry.update({'fw_id': fw_id, 'created_on': to_db_date(created_on),
+                      'priority': spec.get('_priority')})
+        if '_dupefinder' in spec:
+            entry['dupefinder'] = True  # see checkout_fws
+        return entry
+
+    def _check_routing(self):
+        """
+        Make sure that all the fireworks have the routing keys matched by FWorker.query. The
+        fireworks created by an older version of FireWorks have none, and would otherwise match any
+        FWorker: add them once (the first time a FWorker queries the database, or in tuneup) and
+        record it in the database.
+        """
+        if self._routing_complete:
+            return
+        ids = self.fw_id_assigner.find_one({}, {'routing_complete': 1})
+        if not (ids and ids.get('routing_complete')):
+            self.m_logger.debug('Adding routing keys to FWs...')
+            n_routed = self._refresh_routing({'routing': {'$exists': False}})
+            if n_routed:
+                self.m_logger.info('Added routing keys to {} FWs'.format(n_routed))
+            self.fw_id_assigner.update_one({}, {'$set': {'routing_complete': True}})
+        self._routing_complete = True
+
+    def _refresh_routing(self, query):
+        """
+        Recompute the routing keys (see Firework.get_routing) of the fireworks matching the query
+        from their spec, and update their ready_queue entries to match.
+
+        Args:
+            query (dict): query on the fireworks collection
+
+        Returns:
+            int: number of fireworks updated
+        """
+        fw_requests = []
+        rq_requests = []
+        for fw in self.fireworks.find(query, {'fw_id': 1, 'spec._fworker': 1, 'spec._category': 1,
+                                              'spec._priority': 1}):
+            routing = Firework.get_routing(fw['spec'])
+            fw_requests.append(UpdateOne({'fw_id': fw['fw_id']}, {'$set': {'routing': routing}}))
+            # as in _get_ready_queue_entry
+            rq_requests.append(UpdateOne({'fw_id': fw['fw_id']},
+                                         {'$set': dict(routing, priority=fw['spec'].get('_priority'))}))
+        if fw_requests:
+            self.fireworks.bulk_write(fw_requests, ordered=False)
+            self.ready_queue.bulk_write(rq_requests, ordered=False)
+        return len(fw_requests)
+
+    def explain_checkout(self, fworker=None):
+        """
+        Explain the query used to check out a Firework for the given FWorker, e.g. to check
+        that it uses the indexes built by tuneup().
+
+        Args:
+            fworker (FWorker)
+
+        Returns:
+            dict: the query plan as returned by MongoDB
+        """
+        self._check_routing()
+        m_query = dict(fworker.query) if fworker else {}
+        m_query['state'] = 'READY'
+        return self.fireworks.find(m_query, {'fw_id': 1}).sort(self._get_checkout_sort()).\
+            limit(1).explain()
+
+    @staticmethod
+    def _get_checkout_sort():
+        """
+        Get the sort order in which ready fireworks are checked out.
+
+        Returns:
+            [(str, int)]: sort argument in Pymongo format
+        """
+        sortby = [("spec._priority", DESCENDING)]
+        if SORT_FWS.upper() == "FIFO":
+            sortby.append(("created_on", ASCENDING))
+        elif SORT_FWS.upper() == "FILO":
+            sortby.append(("created_on", DESCENDING))
+        return sortby
+
     def _get_active_launch_ids(self):
         """
         Get all the launch ids.
@@ -1024,19 +1948,23 @@ class LaunchPad(FWSerializable):
 
     def cancel_reservation(self, launch_id):
         """
-        given the launch id, cancel the reservation and rerun the fireworks
+        given the launch id, cancel the reservation and rerun the fireworks. Nothing is done if
+        the launch is not RESERVED anymore.
         """
         m_launch = self.get_launch_by_id(launch_id)
         m_launch.state = 'READY'
         self.launches.find_one_and_replace({'launch_id': m_launch.launch_id, "state": "RESERVED"},
-                                           m_launch.to_db_dict(), upsert=True)
+                                           m_launch.to_db_dict())
+        # the reservation will not be run: its backup is not needed anymore
+        self.backup_launch_data.discard(launch_id)
 
         for fw in self.fireworks.find({'launches': launch_id, 'state': 'RESERVED'}, {'fw_id': 1}):
             self.rerun_fw(fw['fw_id'], rerun_duplicates=False)
 
     def detect_unreserved(self, expiration_secs=RESERVATION_EXPIRATION_SECS, rerun=False):
         """
-        Return the reserved launch ids that have not been updated for a while.
+        Return the reserved launch ids that have not been updated for a while, or whose lease
+        expired (see checkout_fws).
 
         Args:
             expiration_secs (seconds): time limit
@@ -1047,15 +1975,12 @@ class LaunchPad(FWSerializable):
         """
         bad_launch_ids = []
         now_time = datetime.datetime.utcnow()
-        cutoff_timestr = (now_time - datetime.timedelta(seconds=expiration_secs)).isoformat()
+        cutoff_time = now_time - datetime.timedelta(seconds=expiration_secs)
+        elem_query = {'state': 'RESERVED',
+                      '$or': date_query('updated_on', '$lte', cutoff_time)['$or'] +
+                      date_query('expires_on', '$lte', now_time)['$or']}
         bad_launch_data = self.launches.find({'state': 'RESERVED',
-                                              'state_history':
-                                                  {'$elemMatch':
-                                                       {'state': 'RESERVED',
-                                                        'updated_on': {'$lte': cutoff_timestr}
-                                                        }
-                                                   }
-                                              },
+                                              'state_history': {'$elemMatch': elem_query}},
                                              {'launch_id': 1, 'fw_id': 1})
         for ld in bad_launch_data:
             if self.fireworks.find_one({'fw_id': ld['fw_id'], 'state': 'RESERVED'}, {'fw_id': 1}):
@@ -1101,16 +2026,10 @@ class LaunchPad(FWSerializable):
         lost_fw_ids = []
         potential_lost_fw_ids = []
         now_time = datetime.datetime.utcnow()
-        cutoff_timestr = (now_time - datetime.timedelta(seconds=expiration_secs)).isoformat()
-
-        lostruns_query = {'state': 'RUNNING',
-                          'state_history':
-                              {'$elemMatch':
-                                   {'state': 'RUNNING',
-                                    'updated_on': {'$lte': cutoff_timestr}
-                                    }
-                               }
-                          }
+        cutoff_time = now_time - datetime.timedelta(seconds=expiration_secs)
+        elem_query = date_query('updated_on', '$lte', cutoff_time)
+        elem_query['state'] = 'RUNNING'
+        lostruns_query = {'state': 'RUNNING', 'state_history': {'$elemMatch': elem_query}}
 
         if query:
             fw_ids = [x["fw_id"] for x in self.fireworks.find(query,
@@ -1149,6 +2068,8 @@ class LaunchPad(FWSerializable):
                     else:
                         lost_fw_ids.append(fw_id)  # all Launches not lost are anyway FIZZLED / ARCHIVED
 
+        for lid in lost_launch_ids:
+            self._pinged_trackers.pop(lid, None)
         if fizzle or rerun:
             for lid in lost_launch_ids:
                 self.mark_fizzled(lid)
@@ -1183,7 +2104,8 @@ class LaunchPad(FWSerializable):
         m_launch.set_reservation_id(reservation_id)
         self.launches.find_one_and_replace({'launch_id': launch_id}, m_launch.to_db_dict())
 
-    def checkout_fw(self, fworker, launch_dir, fw_id=None, host=None, ip=None, state="RUNNING"):
+    def checkout_fw(self, fworker, launch_dir, fw_id=None, host=None, ip=None, state="RUNNING",
+                    launch_id=None):
         """
         Checkout the next ready firework, mark it with the given state(RESERVED or RUNNING) and
         return it to the caller. The caller is responsible for running the Firework.
@@ -1195,17 +2117,21 @@ class LaunchPad(FWSerializable):
             host (str): the host making the request (for creating a Launch object)
             ip (str): the ip making the request (for creating a Launch object)
             state (str): RESERVED or RUNNING, the fetched firework's state will be set to this value.
+            launch_id (int): with fw_id, the launch that reserved the Firework (e.g. with
+                checkout_fws): it is not checked out if it was reserved by another launch since
 
         Returns:
             (Firework, int): firework and the new launch id
         """
-        m_fw = self._get_a_fw_to_run(fworker.query, fw_id=fw_id)
+        self._check_routing()
+        m_fw = self._get_a_fw_to_run(fworker.query, fw_id=fw_id, launch_id=launch_id)
         if not m_fw:
             return None, None
 
         # If this Launch was previously reserved, overwrite that reservation with this Launch
         # note that adding a new Launch is problematic from a duplicate run standpoint
-        prev_reservations = [l for l in m_fw.launches if l.state == 'RESERVED']
+        prev_reservations = [l for l in m_fw.launches if l.state == 'RESERVED' and
+                             (not launch_id or l.launch_id == launch_id)]
         reserved_launch = None if not prev_reservations else prev_reservations[0]
         state_history = reserved_launch.state_history if reserved_launch else None
 
@@ -1229,10 +2155,13 @@ class LaunchPad(FWSerializable):
             # we're updating an existing launch
             m_fw.launches = [m_launch if l.launch_id == m_launch.launch_id else l for l in m_fw.launches]
 
-        # insert the firework and refresh the workflow
+        # update the firework and the workflow, touching only the fields that changed
         m_fw.state = state
-        self._upsert_fws([m_fw])
-        self._refresh_wf(m_fw.fw_id)
+        fw_update = {'$set': {'state': state, 'updated_on': to_db_date(m_fw.updated_on)}}
+        if not reserved_launch:
+            fw_update['$push'] = {'launches': launch_id}
+        self.fireworks.update_one({'fw_id': m_fw.fw_id}, fw_update)
+        self._refresh_wf_checkout(m_fw.fw_id, state)
 
         # update any duplicated runs
         if state == "RUNNING":
@@ -1240,19 +2169,133 @@ class LaunchPad(FWSerializable):
                     {'launches': launch_id,
                      'state': {'$in': ['WAITING', 'READY', 'RESERVED', 'FIZZLED']}}, {'fw_id': 1}):
                 fw_id = fw['fw_id']
-                fw = self.get_fw_by_id(fw_id)
-                fw.state = state
-                self._upsert_fws([fw])
-                self._refresh_wf(fw.fw_id)
+                self.fireworks.update_one(
+                    {'fw_id': fw_id},
+                    {'$set': {'state': state,
+                              'updated_on': to_db_date(datetime.datetime.utcnow())}})
+                self._refresh_wf(fw_id)
 
         # Store backup copies of the initial data for retrieval in case of failure
         self.backup_launch_data[m_launch.launch_id] = m_launch.to_db_dict()
-        self.backup_fw_data[fw_id] = m_fw.to_db_dict()
+        self.backup_fw_data[m_fw.fw_id] = m_fw.to_db_dict()
 
         self.m_logger.debug('{} FW with id: {}'.format(m_fw.state, m_fw.fw_id))
 
         return m_fw, launch_id
 
+    def checkout_fws(self, fworker, launch_dir, n, host=None, ip=None, state="RESERVED",
+                     lease_secs=None):
+        """
+        Checkout up to n ready fireworks at once and mark them with the given state (RESERVED or
+        RUNNING). The fireworks are claimed and their Launches created with bulk writes, and
+        their workflows are refreshed once per workflow, which amortizes the database overhead
+        of checkout_fw() when running many short jobs.
+
+        Fireworks with a _dupefinder are never checked out by this method, since they need a
+        uniqueness check of their own; use checkout_fw() for those.
+
+        Args:
+            fworker (FWorker): A FWorker instance
+            launch_dir (str): the dir the FWs will be run in (for creating the Launch objects)
+            n (int): maximum number of fireworks to check out
+            host (str): the host making the request (for creating the Launch objects)
+            ip (str): the ip making the request (for creating the Launch objects)
+            state (str): RESERVED or RUNNING, the fetched fireworks' state will be set to this value.
+            lease_secs (int): if set, RESERVED launches expire after this many seconds instead of
+                RESERVATION_EXPIRATION_SECS (see detect_unreserved), e.g. for reservations made
+                ahead of time by a launcher that might die before using them
+
+        Returns:
+            [(Firework, int)]: list of the checked out fireworks and their new launch ids
+        """
+        self._check_routing()
+        rq_query = self._get_ready_queue_query(fworker.query)
+        if rq_query is not None and self._is_ready_queue_complete():
+            rq_query['dupefinder'] = {'$exists': False}
+            sortby = [(READY_QUEUE_FIELDS.get(k, k), d) for k, d in self._get_checkout_sort()]
+            candidates = [e['fw_id'] for e in self.ready_queue.find(
+                rq_query, {'fw_id': 1}, sort=sortby).limit(n)]
+        else:
+            m_query = dict(fworker.query)
+            m_query['state'] = 'READY'
+            m_query['spec._dupefinder'] = {'$exists': False}
+            candidates = [f['fw_id'] for f in self.fireworks.find(
+                m_query, {'fw_id': 1}, sort=self._get_checkout_sort()).limit(n)]
+        if not candidates:
+            return []
+
+        # claim the candidates; a firework is ours only if it now holds the launch id we gave it
+        first_launch_id = self.get_new_launch_id(quantity=len(candidates))
+        fw_launch_ids = {fw_id: launch_id for launch_id, fw_id in
+                         enumerate(candidates, start=first_launch_id)}
+        now_time = datetime.datetime.utcnow()
+        self.fireworks.bulk_write(
+            [UpdateOne({'fw_id': fw_id, 'state': 'READY'},
+                       {'$set': {'state': state, 'updated_on': to_db_date(now_time)},
+                        '$push': {'launches': launch_id}})
+             for fw_id, launch_id in fw_launch_ids.items()], ordered=False)
+        fw_dicts = {f['fw_id']: f for f in self.fireworks.find(
+            {'launches': {'$in': list(fw_launch_ids.values())}})}
+        # the entries of the candidates we did not claim are stale if they are not READY anymore
+        # (e.g. claimed by another launcher, which also deletes them)
+        unclaimed = [fw_id for fw_id in candidates if fw_id not in fw_dicts]
+        if unclaimed:
+            still_ready = [f['fw_id'] for f in self.fireworks.find(
+                {'fw_id': {'$in': unclaimed}, 'state': 'READY'}, {'fw_id': 1})]
+            unclaimed = list(set(unclaimed) - set(still_ready))
+        if fw_dicts or unclaimed:
+            self.ready_queue.delete_many({'fw_id': {'$in': list(fw_dicts) + unclaimed}})
+        if not fw_dicts:
+            # look further if the candidates were all stale
+            return self.checkout_fws(fworker, launch_dir, n, host=host, ip=ip, state=state,
+                                     lease_secs=lease_secs) if unclaimed else []
+
+        # recreate the existing launches from the launch collection
+        old_launch_ids = set()
+        for fw_dict in fw_dicts.values():
+            old_launch_ids.update(l for l in fw_dict['launches'] if l != fw_launch_ids[fw_dict['fw_id']])
+            old_launch_ids.update(fw_dict['archived_launches'])
+        old_launches = {}
+        if old_launch_ids:
+            for l in self.launches.find({'launch_id': {'$in': list(old_launch_ids)}}):
+                l["action"] = get_action_from_gridfs(l.get("action"), self.gridfs_fallback)
+                old_launches[l['launch_id']] = Launch.from_dict(l)
+
+        reserved = []
+        for fw_id in candidates:
+            if fw_id not in fw_dicts:
+                continue  # another launcher got there first
+            fw_dict = fw_dicts[fw_id]
+            launch_id = fw_launch_ids[fw_id]
+            m_fw = Firework.from_dict(dict(fw_dict, launches=[], archived_launches=[]))
+            trackers = [Tracker.from_dict(f) for f in m_fw.spec['_trackers']] \
+                if '_trackers' in m_fw.spec else None
+            m_launch = Launch(state, launch_dir, fworker, host, ip, trackers=trackers,
+                              launch_id=launch_id, fw_id=fw_id)
+            if lease_secs and state == 'RESERVED':
+                m_launch.state_history[-1]['expires_on'] = \
+                    now_time + datetime.timedelta(seconds=lease_secs)
+            m_fw.launches = [m_launch if l == launch_id else old_launches[l]
+                             for l in fw_dict['launches']]
+            m_fw.archived_launches = [old_launches[l] for l in fw_dict['archived_launches']]
+            m_fw._state = state
+            reserved.append((m_fw, m_launch))
+
+        self.launches.insert_many([m_launch.to_db_dict() for _, m_launch in reserved])
+        self.m_logger.debug('Created Launches with launch_ids: {}'.format(
+            [m_launch.launch_id for _, m_launch in reserved]))
+
+        self._refresh_wfs([m_fw.fw_id for m_fw, _ in reserved])
+
+        # Store backup copies of the initial data for retrieval in case of failure
+        for m_fw, m_launch in reserved:
+            self.backup_launch_data[m_launch.launch_id] = m_launch.to_db_dict()
+            self.backup_fw_data[m_fw.fw_id] = m_fw.to_db_dict()
+
+        self.m_logger.debug('{} FWs with ids: {}'.format(state, [m_fw.fw_id for m_fw, _ in reserved]))
+
+        return [(m_fw, m_launch.launch_id) for m_fw, m_launch in reserved]
+
     def change_launch_dir(self, launch_id, launch_dir):
         """
         Change the launch directory corresponding to the given launch id.
@@ -1267,17 +2310,25 @@ class LaunchPad(FWSerializable):
 
     def restore_backup_data(self, launch_id, fw_id):
         """
-        For the given launch id and firework id, restore the back up data.
+        For the given launch id and firework id, restore the back up data. The backups are then
+        discarded.
         """
-        if launch_id in self.backup_launch_data:
-            self.launches.find_one_and_replace({'launch_id': launch_id}, self.backup_launch_data[launch_id])
-        if fw_id in self.backup_fw_data:
-            self.fireworks.find_one_and_replace({'fw_id': fw_id}, self.backup_fw_data[fw_id])
+        launch_backup = self.backup_launch_data.pop(launch_id)
+        if launch_backup is not None:
+            self.launches.find_one_and_replace({'launch_id': launch_id}, launch_backup)
+        fw_backup = self.backup_fw_data.pop(fw_id)
+        if fw_backup is not None:
+            self.fireworks.find_one_and_replace({'fw_id': fw_id}, fw_backup)
 
     def complete_launch(self, launch_id, action=None, state='COMPLETED'):
         """
         Internal method used to mark a Firework's Launch as completed.
 
+        Launches completed at the same time by threads sharing this LaunchPad (e.g. the rockets
+        of a multi launcher, through its DataServer) are written together with
+        complete_launches(): while one thread writes, the launches of the others are queued and
+        then written in one batch.
+
         Args:
             launch_id (int)
             action (FWAction): the FWAction of what to do next
@@ -1286,12 +2337,118 @@ class LaunchPad(FWSerializable):
         Returns:
             dict: updated launch
         """
-        # update the launch data to COMPLETED, set end time, etc
-        m_launch = self.get_launch_by_id(launch_id)
-        m_launch.state = state
-        if action:
-            m_launch.action = action
+        completion = {'launch': (launch_id, action, state)}
+        batch = None
+        with self._completions_cv:
+            self._completions.append(completion)
+            while self._completing and 'result' not in completion:
+                self._completions_cv.wait()
+            if 'result' not in completion:
+                # no other thread is writing: write all the launches queued so far
+                batch = self._completions
+                self._completions = []
+                self._completing = True
+
+        if batch is not None:
+            results = [None] * len(batch)
+            completed = {}
+            try:
+                results = self.complete_launches([c['launch'] for c in batch], completed)
+            except Exception:
+                if len(batch) == 1:
+                    raise
+                # the launches written and refreshed before the error are done
+                results = [completed.get(c['launch'][0]) for c in batch]
+            finally:
+                with self._completions_cv:
+                    self._completing = False
+                    for c, result in zip(batch, results):
+                        c['result'] = result
+                    self._completions_cv.notify_all()
+
+        if completion['result'] is None:
+            # the batch failed before this launch was done: complete it alone to find out if it
+            # was the problem
+            return self.complete_launches([completion['launch']])[0]
+        return completion['result']
+
+    def complete_launches(self, launches, completed=None):
+        """
+        Mark several Launches as completed, e.g. the ones that finished together in a packed
+        job. The launch documents are written in bulk and the FireWorks holding them are
+        refreshed together, so that each workflow is locked, loaded and written only once.
+
+        Args:
+            launches ([(int, FWAction, str)]): the launch_id, the FWAction of what to do next
+                (or None) and the state (COMPLETED or FIZZLED) of each Launch
+            completed (dict): if given, the updated launch of each launch_id that was written
+                and whose FireWorks were refreshed is added to it, even if an error is raised
+                for the others
+
+        Returns:
+            [dict]: updated launches
+        """
+        launch_ids = [launch_id for launch_id, _, _ in launches]
+        for launch_id in launch_ids:
+            self._pinged_trackers.pop(launch_id, None)
+        launch_dicts = dict((l['launch_id'], l) for l in
+                            self.launches.find({'launch_id': {'$in': launch_ids}}))
+        m_launches = []
+        for launch_id, action, state in launches:
+            if launch_id not in launch_dicts:
+                raise ValueError('No Launch exists with launch_id: {}'.format(launch_id))
+            # update the launch data to COMPLETED, set end time, etc
+            launch_dict = dict(launch_dicts[launch_id])
+            launch_dict["action"] = get_action_from_gridfs(launch_dict.get("action"),
+                                                           self.gridfs_fallback)
+            m_launch = Launch.from_dict(launch_dict)
+            m_launch.state = state
+            if action:
+                m_launch.action = action
+            m_launches.append(m_launch)
+
+        try:
+            self.launches.bulk_write([ReplaceOne({'launch_id': m_launch.launch_id},
+                                                 m_launch.to_db_dict(), upsert=True)
+                                      for m_launch in m_launches])
+        except DocumentTooLarge:
+            # some actions need to go to gridfs, writing the launches again is harmless
+            for m_launch in m_launches:
+                self._replace_launch(m_launch)
+
+        # find all the fws that have these launches
+        fw_ids = []
+        launch_fw_ids = defaultdict(set)
+        for fw in self.fireworks.find({'launches': {'$in': launch_ids}},
+                                      {'fw_id': 1, 'launches': 1}):
+            fw_ids.append(fw['fw_id'])
+            for launch_id in set(fw['launches']).intersection(launch_ids):
+                launch_fw_ids[launch_id].add(fw['fw_id'])
+        refreshed = set()
+        try:
+            if fw_ids:
+                self._refresh_wfs(fw_ids, refreshed)
+        finally:
+            # the launches written and refreshed: their backups are not needed anymore
+            for m_launch in m_launches:
+                if launch_fw_ids[m_launch.launch_id] <= refreshed:
+                    self.backup_launch_data.discard(m_launch.launch_id)
+                    for fw_id in launch_fw_ids[m_launch.launch_id]:
+                        self.backup_fw_data.discard(fw_id)
+                    if completed is not None:
+                        completed[m_launch.launch_id] = m_launch.to_dict()
 
+        # change return type to dict to make return type serializable to support job packing
+        return [m_launch.to_dict() for m_launch in m_launches]
+
+    def _replace_launch(self, m_launch):
+        """
+        Replace the document of a Launch, moving its action to gridfs if it is too large.
+
+        Args:
+            m_launch (Launch)
+        """
+        launch_id = m_launch.launch_id
         try:
             self.launches.find_one_and_replace({'launch_id': m_launch.launch_id},
                                                m_launch.to_db_dict(), upsert=True)
@@ -1318,31 +2475,107 @@ class LaunchPad(FWSerializable):
             self.launches.find_one_and_replace({'launch_id': m_launch.launch_id},
                                                launch_db_dict, upsert=True)
 
+    def ping_launch(self, launch_id, ptime=None, checkpoint=None):
+        """
+        Ping that a Launch is still alive: updates the 'updated_on' field of the RUNNING entry of
+        the state history of a Launch. The content of its trackers is uploaded as well, if it
+        changed since the last ping.
 
-        # find all the fws that have this launch
-        for fw in self.fireworks.find({'launches': launch_id}, {'fw_id': 1}):
-            fw_id = fw['fw_id']
-            self._refresh_wf(fw_id)
+        Args:
+            launch_id (int)
+            ptime (datetime)
+            checkpoint (dict): checkpoint data (see checkpoint_launch)
+        """
+        m_set = {'state_history.$.updated_on': to_db_date(ptime or datetime.datetime.utcnow())}
+        if checkpoint:
+            m_set['state_history.$.checkpoint'] = recursive_dict(checkpoint)
+        m_set.update(self._track_files(launch_id))
+        result = self.launches.update_one({'launch_id': launch_id, 'state': 'RUNNING',
+                                           'state_history.state': 'RUNNING'}, {'$set': m_set})
+        if not result.matched_count:
+            self._pinged_trackers.pop(launch_id, None)
 
-        # change return type to dict to make return type serializable to support job packing
-        return m_launch.to_dict()
+    def ping_launches(self, launch_ids, ptime=None):
+        """
+        Ping that several Launches are still alive (see ping_launch) with a single update, e.g.
+        all the Launches of a multi launcher. Only the trackers whose content changed are
+        uploaded, with a bulk write.
 
-    def ping_launch(self, launch_id, ptime=None, checkpoint=None):
+        Args:
+            launch_ids ([int])
+            ptime (datetime)
         """
-        Ping that a Launch is still alive: updates the 'update_on 'field of the state history of a
-        Launch.
+        ptime = to_db_date(ptime or datetime.datetime.utcnow())
+        launch_ids = list(launch_ids)
+        result = self.launches.update_many({'launch_id': {'$in': launch_ids}, 'state': 'RUNNING',
+                                            'state_history.state': 'RUNNING'},
+                                           {'$set': {'state_history.$.updated_on': ptime}})
+        if result.matched_count < len(launch_ids):
+            # forget the trackers of the Launches that are not running anymore (e.g. lost and
+            # rerun): they are not pinged again
+            running = set(l['launch_id'] for l in self.launches.find(
+                {'launch_id': {'$in': launch_ids}, 'state': 'RUNNING'}, {'launch_id': 1}))
+            for launch_id in set(launch_ids) - running:
+                self._pinged_trackers.pop(launch_id, None)
+            launch_ids = [launch_id for launch_id in launch_ids if launch_id in running]
+        requests = []
+        for launch_id in launch_ids:
+            m_set = self._track_files(launch_id)
+            if m_set:
+                requests.append(UpdateOne({'launch_id': launch_id, 'state': 'RUNNING'},
+                                          {'$set': m_set}))
+        if requests:
+            self.launches.bulk_write(requests, ordered=False)
+
+    def _track_files(self, launch_id):
+        """
+        Read the files tracked by a Launch. The launch directory and trackers of the Launches
+        pinged by this LaunchPad are kept, with the hashes of the tracked contents in the DB, so
+        that the Launch is only read on its first ping.
+
+        Args:
+            launch_id (int)
+
+        Returns:
+            dict: $set of the content of the trackers that changed since the last upload
+        """
+        pinged = self._pinged_trackers.get(launch_id)
+        if pinged is None:
+            launch = self.launches.find_one({'launch_id': launch_id},
+                                            {'launch_dir': 1, 'trackers': 1}) or {}
+            trackers = [Tracker.from_dict(t) for t in launch.get('trackers') or []]
+            pinged = (launch.get('launch_dir'), trackers,
+                      [self._hash_content(t.content) for t in trackers])
+            self._pinged_trackers[launch_id] = pinged
+        launch_dir, trackers, hashes = pinged
+        m_set = {}
+        for i, tracker in enumerate(trackers):
+            content_hash = self._hash_content(tracker.track_file(launch_dir))
+            if content_hash != hashes[i]:
+                m_set['trackers.{}.content'.format(i)] = tracker.content
+                hashes[i] = content_hash
+        return m_set
+
+    @staticmethod
+    def _hash_content(content):
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+    def checkpoint_launch(self, launch_id, checkpoint, ptime=None):
+        """
+        Store the checkpoint of a running Launch (see Rocket.run), which also pings that the
+        Launch is alive. Unlike ping_launch, the trackers are not read: only the checkpoint and
+        updated_on of the RUNNING state_history entry of the Launch are updated.
 
         Args:
             launch_id (int)
+            checkpoint (dict): checkpoint data
             ptime (datetime)
         """
-        m_launch = self.get_launch_by_id(launch_id)
-        for tracker in m_launch.trackers:
-            tracker.track_file(m_launch.launch_dir)
-        m_launch.touch_history(ptime, checkpoint=checkpoint)
-        self.launches.update_one({'launch_id': launch_id, 'state': 'RUNNING'},
-                                 {'$set': {'state_history': m_launch.to_db_dict()['state_history'],
-                                           'trackers': [t.to_dict() for t in m_launch.trackers]}})
+        ptime = ptime or datetime.datetime.utcnow()
+        self.launches.update_one({'launch_id': launch_id, 'state': 'RUNNING',
+                                  'state_history.state': 'RUNNING'},
+                                 {'$set': {'state_history.$.checkpoint': recursive_dict(checkpoint),
+                                           'state_history.$.updated_on': to_db_date(ptime)}})
 
     def get_new_fw_id(self, quantity=1):
         """
@@ -1358,12 +2591,17 @@ class LaunchPad(FWSerializable):
             raise ValueError("Could not get next FW id! If you have not yet initialized the database,"
                              " please do so by performing a database reset (e.g., lpad reset)")
 
-    def get_new_launch_id(self):
+    def get_new_launch_id(self, quantity=1):
         """
         Checkout the next Launch id
+
+        Args:
+            quantity (int): optionally ask for many ids, otherwise defaults to 1
+                            this then returns the *first* launch_id in that range
         """
         try:
-            return self.fw_id_assigner.find_one_and_update({}, {'$inc': {'next_launch_id': 1}})['next_launch_id']
+            return self.fw_id_assigner.find_one_and_update(
+                {}, {'$inc': {'next_launch_id': quantity}})['next_launch_id']
         except:
             raise ValueError("Could not get next launch id! If you have not yet initialized the "
                              "database, please do so by performing a database reset (e.g., lpad reset)")
@@ -1408,6 +2646,7 @@ class LaunchPad(FWSerializable):
                                                     fw.to_db_dict(),
                                                     upsert=True)
 
+        self._sync_ready_queue(fws)
         return old_new
 
     def rerun_fw(self, fw_id, rerun_duplicates=True, recover_launch=None, recover_mode=None):
@@ -1426,10 +2665,13 @@ class LaunchPad(FWSerializable):
         Returns:
             [int]: list of firework ids that were rerun
         """
-        m_fw = self.fireworks.find_one({"fw_id": fw_id}, {"state": 1})
+        m_fw = self.fireworks.find_one({"fw_id": fw_id}, {"state": 1, "launches": 1})
 
         if not m_fw:
             raise ValueError("FW with id: {} not found!".format(fw_id))
+        # its Launches are not pinged anymore
+        for launch_id in m_fw.get('launches', []):
+            self._pinged_trackers.pop(launch_id, None)
 
         # detect FWs that share the same launch. Must do this before rerun
         duplicates = []
@@ -1465,11 +2707,10 @@ class LaunchPad(FWSerializable):
         elif m_fw['state'] == 'WAITING' and not recover_launch:
             self.m_logger.debug("Skipping rerun fw_id: {}: it is already WAITING.".format(fw_id))
         else:
-            with WFLock(self, fw_id):
-                wf = self.get_wf_by_fw_id_lzyfw(fw_id)
-                updated_ids = wf.rerun_fw(fw_id)
-                self._update_wf(wf, updated_ids)
-                reruns.append(fw_id)
+            self._modify_wf(fw_id, lambda wf: wf.rerun_fw(fw_id))
+            # restoring the backup of a previous run would undo the rerun
+            self.backup_fw_data.discard(fw_id)
+            reruns.append(fw_id)
 
         # rerun duplicated FWs
         for f in duplicates:
@@ -1506,55 +2747,488 @@ class LaunchPad(FWSerializable):
         Args:
             fw_id (int): the parent fw_id - children will be refreshed
         """
-        # TODO: time how long it took to refresh the WF!
-        # TODO: need a try-except here, high probability of failure if incorrect action supplied
-        try:
-            with WFLock(self, fw_id):
-                wf = self.get_wf_by_fw_id_lzyfw(fw_id)
-                updated_ids = wf.refresh(fw_id)
-                self._update_wf(wf, updated_ids)
-        except LockedWorkflowError:
-            self.m_logger.info("fw_id {} locked. Can't refresh!".format(fw_id))
-        except:
-            # some kind of internal error - an example is that fws serialization changed due to
-            # code updates and thus the Firework object can no longer be loaded from db description
-            # Action: *manually* mark the fw and workflow as FIZZLED
-            self.fireworks.find_one_and_update({"fw_id": fw_id}, {"$set": {"state": "FIZZLED"}})
-            self.workflows.find_one_and_update({"nodes": fw_id}, {"$set": {"state": "FIZZLED"}})
-            self.workflows.find_one_and_update({"nodes": fw_id},
-                                               {"$set": {"fw_states.{}".format(fw_id): "FIZZLED"}})
-            import traceback
-            err_message = "Error refreshing workflow. The full stack trace is: {}".format(
-                traceback.format_exc())
-            raise RuntimeError(err_message)
-
-    def _update_wf(self, wf, updated_ids):
+        self._refresh_wfs([fw_id])
+
+    def _refresh_wfs(self, fw_ids, refreshed=None):
+        """
+        Update the FW state of all jobs in the workflows of the given fireworks. Fireworks that
+        belong to the same workflow are refreshed together, so that each workflow is locked,
+        loaded and written only once.
+
+        Args:
+            fw_ids ([int]): the parent fw_ids - children will be refreshed
+            refreshed (set): if given, the fw_ids whose refresh did not fail are added to it
+                (including the locked ones, which are only logged)
+        """
+        if len(fw_ids) == 1:
+            wf_groups = [list(fw_ids)]
+        else:
+            remaining = set(fw_ids)
+            wf_groups = []
+            for links_dict in self.workflows.find({'nodes': {'$in': list(fw_ids)},
+                                                   'external_links': {'$exists': False}},
+                                                  {'nodes': 1}):
+                nodes = set(links_dict['nodes'])
+                group = [f for f in fw_ids if f in remaining and f in nodes]
+                remaining.difference_update(group)
+                wf_groups.append(group)
+            wf_nodes = defaultdict(set)
+            for node in self.workflow_nodes.find({'fw_id': {'$in': list(remaining)}},
+                                                 {'fw_id': 1, 'wf_id': 1}):
+                wf_nodes[node['wf_id']].add(node['fw_id'])
+            for nodes in wf_nodes.values():
+                group = [f for f in fw_ids if f in remaining and f in nodes]
+                remaining.difference_update(group)
+                wf_groups.append(group)
+            # let the lock raise the appropriate error for fireworks without workflow
+            wf_groups.extend([f] for f in fw_ids if f in remaining)
+
+        errors = []
+        for group in wf_groups:
+            def refresh(wf, group=group):
+                updated_ids = set()
+                for fw_id in group:
+                    updated_ids = wf.refresh(fw_id, updated_ids)
+                return updated_ids
+
+            try:
+                self._modify_wf(group[0], refresh, fw_ids=group)
+            except LockedWorkflowError:
+                self.m_logger.info("fw_id {} locked. Can't refresh!".format(group[0]))
+            except:
+                # some kind of internal error - an example is that fws serialization changed due to
+                # code updates and thus the Firework object can no longer be loaded from db description
+                # Action: *manually* mark the fw and workflow as FIZZLED
+                for fw_id in group:
+                    wf_query = self._get_wf_query(fw_id)
+                    self.fireworks.find_one_and_update({"fw_id": fw_id},
+                                                       {"$set": {"state": "FIZZLED"}})
+                    self.workflows.find_one_and_update(wf_query,
+                                                       {"$set": {"state": "FIZZLED"},
+                                                        "$inc": {"version": 1}})
+                    # the state_counts are rebuilt by the next successful (full) refresh
+                    self.workflows.find_one_and_update(
+                        dict(wf_query, external_links={"$exists": False}),
+                        {"$set": {"fw_states.{}".format(fw_id): "FIZZLED"}})
+                    self.workflow_nodes.find_one_and_update({"fw_id": fw_id},
+                                                            {"$set": {"state": "FIZZLED"}})
+                    self.workflows.find_one_and_update(wf_query,
+                                                       {"$unset": {"state_counts": ""}})
+                # keep refreshing the other workflows, and raise once they are all done
+                errors.append(traceback.format_exc())
+                continue
+            if refreshed is not None:
+                refreshed.update(group)
+        if errors:
+            raise RuntimeError("Error refreshing workflow. The full stack trace is: {}".format(
+                "\n".join(errors)))
+
+    def _refresh_wf_checkout(self, fw_id, state):
+        """
+        Update the workflow of a firework that was just checked out, i.e. went from READY or
+        RESERVED to the given state. Such a change never affects the children, so only the
+        fw_states entry, the state_counts and, if needed, the workflow state are updated in place.
+        If the workflow is locked, this falls back to a full _refresh_wf().
+
+        Args:
+            fw_id (int): the checked out fw_id
+            state (str): RESERVED or RUNNING, the new state of the firework
+        """
+        # a READY or RESERVED workflow only contains READY/RESERVED/WAITING fireworks, so the
+        # checkout promotes its state; any other workflow state is unaffected
+        promoted_states = ['READY', 'RESERVED'] if state == 'RUNNING' else ['READY']
+        m_set = {'fw_states.{}'.format(fw_id): state, 'updated_on': datetime.datetime.utcnow()}
+
+        for prev_state in promoted_states:
+            m_query = {'nodes': fw_id, 'locked': {'$exists': False},
+                       'fw_states.{}'.format(fw_id): prev_state,
+                       'state_counts': {'$exists': True}}
+            m_inc = {'state_counts.{}'.format(prev_state): -1, 'state_counts.{}'.format(state): 1,
+                     'version': 1}
+            if self.workflows.update_one(dict(m_query, state={'$in': promoted_states}),
+                                         {'$set': dict(m_set, state=state),
+                                          '$inc': m_inc}).matched_count:
+                return
+            if self.workflows.update_one(m_query, {'$set': m_set, '$inc': m_inc}).matched_count:
+                return
+
+        # with external links, the fw_states entry is in another document: lock the workflow
+        # while both are updated
+        lock = WFLock(self, fw_id)
+        links_dict = self.workflows.find_one_and_update(
+            dict(lock.query, locked={'$exists': False}, external_links=True,
+                 state_counts={'$exists': True}), {'$set': {'locked': lock.get_lease()}},
+            {'state': 1})
+        if links_dict:
+            node = self.workflow_nodes.find_one_and_update(
+                {'fw_id': fw_id, 'state': {'$in': promoted_states}}, {'$set': {'state': state}},
+                {'state': 1})
+            m_update = {'$unset': {'locked': True}}
+            if node:
+                m_update['$set'] = {'updated_on': m_set['updated_on']}
+                if links_dict['state'] in promoted_states:
+                    m_update['$set']['state'] = state
+                m_update['$inc'] = {'state_counts.{}'.format(node['state']): -1,
+                                    'state_counts.{}'.format(state): 1, 'version': 1}
+            self.workflows.update_one({'_id': links_dict['_id'], 'locked.owner': lock.owner},
+                                      m_update)
+            if node:
+                return
+        self._refresh_wf(fw_id)
+
+    def _modify_wf(self, fw_id, modify, max_tries=5, fw_ids=None):
+        """
+        Load the workflow of a firework, change it in memory and write the changes.
+
+        By default, the workflow is locked with a WFLock while it is loaded, changed and written.
+        With WF_OPTIMISTIC_UPDATES, it is loaded and changed without lock, and the changes are
+        only written if the version of the workflow document did not change in the meantime;
+        otherwise the change is redone on the new workflow. After max_tries conflicts, the change
+        is made under a WFLock.
+
+        Args:
+            fw_id (int): id of a firework of the workflow
+            modify (callable): changes the Workflow it is given and returns the ids of the updated
+                fireworks. It may be called more than once.
+            max_tries (int): number of optimistic attempts
+            fw_ids ([int]): if modify only refreshes these fireworks, only the part of a workflow
+                with external links around them is loaded, as long as modify does not need more
+        """
+        if WF_OPTIMISTIC_UPDATES:
+            backoff = WFLock.backoff_min_secs
+            for _ in range(max_tries):
+                wf, links_dict, updated_ids = self._load_and_modify_wf(fw_id, modify, fw_ids)
+                try:
+                    self._update_wf(wf, updated_ids, links_dict)
+                    return
+                except WorkflowVersionError:
+                    self.m_logger.debug("Workflow of fw_id {} changed, retrying".format(fw_id))
+                time.sleep(backoff * random.uniform(0.5, 1))
+                backoff = min(backoff * 2, WFLock.backoff_max_secs)
+        with WFLock(self, fw_id) as lock:
+            wf, links_dict, updated_ids = self._load_and_modify_wf(fw_id, modify, fw_ids)
+            # the workflow document cannot change while locked: no need to read it again
+            self._write_wf(wf, updated_ids, links_dict, check_version=False, lock=lock)
+
+    def _load_and_modify_wf(self, fw_id, modify, fw_ids=None):
+        """
+        Load the workflow of a firework and change it in memory, see _modify_wf. The part of a
+        workflow with external links around fw_ids is loaded first, if given, and the whole
+        workflow is loaded if the change reaches beyond it.
+
+        Returns:
+            (Workflow, dict, [int]): the changed workflow, the workflow document it was loaded
+                from and the ids of the updated fireworks
+        """
+        wf, links_dict = self._get_wf_by_fw_id_lzyfw(fw_id, fw_ids)
+        if isinstance(wf, _PartialWorkflow):
+            try:
+                return wf, links_dict, modify(wf)
+            except _PartialWorkflowError:
+                self.m_logger.debug("Loading the whole workflow of fw_id {}".format(fw_id))
+                wf, links_dict = self._get_wf_by_fw_id_lzyfw(fw_id)
+        return wf, links_dict, modify(wf)
+
+    def _update_wf(self, wf, updated_ids, links_dict=None, lock=None):
         """
         Update the workflow with the update firework ids.
-        Note: must be called within an enclosing WFLock
+        Note: must be called within an enclosing WFLock (lock), unless links_dict is given.
+
+        If the workflow was loaded without lock, links_dict is the workflow document it was loaded
+        from. Its version is then compared with the one in the DB: if the workflow only needs its
+        workflow document written, this is done with a single compare-and-swap. Otherwise, the
+        workflow is locked without waiting while the fireworks are written (WFLock.claim). A
+        WorkflowVersionError is raised if the version changed, before anything is written.
 
         Args:
             wf (Workflow)
             updated_ids ([int]): list of firework ids
+            links_dict (dict): the workflow document, if the workflow was loaded without lock
+            lock (WFLock): the enclosing WFLock, if links_dict is not given
+        """
+        if links_dict is None or not (
+                updated_ids or (links_dict.get('external_links') and wf.fw_states.changed)):
+            self._write_wf(wf, updated_ids, links_dict, lock=lock)
+            return
+        lock = WFLock(self, links_dict['nodes'][0])
+        if not lock.claim(links_dict.get('version')):
+            raise WorkflowVersionError("Workflow changed: {}".format(lock.fw_id))
+        try:
+            self._write_wf(wf, updated_ids, links_dict, check_version=False, lock=lock)
+        finally:
+            lock.__exit__(None, None, None)
+
+    def _write_wf(self, wf, updated_ids, links_dict=None, check_version=True, lock=None):
         """
+        Write the updated fireworks and the workflow document of a workflow.
+
+        Only the changes are written to the workflow document: the fw_states changed since the
+        workflow was loaded (see Workflow.fw_states), the state and updated_on. The links are rewritten only if FireWorks were
+        added to the workflow (e.g. by append_wf). For a workflow with external links, only the
+        workflow_nodes documents of the FireWorks whose state or children changed are written.
+        The version of the workflow document is incremented.
+
+        Args:
+            wf (Workflow)
+            updated_ids ([int]): list of firework ids
+            links_dict (dict): the workflow document the workflow was loaded from, read from the DB
+                if None
+            check_version (bool): if links_dict is given, only write the workflow document if it
+                is not locked and still has the version of links_dict
+            lock (WFLock): the WFLock held while writing, if any. A LockedWorkflowError is raised
+                if it was taken over before the workflow document was written.
+        """
+        changed_ids = set(wf.fw_states.changed)
         updated_fws = [wf.id_fw[fid] for fid in updated_ids]
         old_new = self._upsert_fws(updated_fws)
         wf._reassign_ids(old_new)
 
-        # find a node for which the id did not change, so we can query on it to get WF
-        query_node = None
-        for f in wf.id_fw:
-            if f not in old_new.values() or old_new.get(f, None) == f:
-                query_node = f
-                break
+        m_query = {'locked.owner': lock.owner} if lock is not None else {}
+        if links_dict is None:
+            # find a node for which the id did not change, so we can query on it to get WF
+            query_node = None
+            for f in wf.id_fw:
+                if f not in old_new.values() or old_new.get(f, None) == f:
+                    query_node = f
+                    break
+
+            assert query_node is not None
+            links_dict = self.workflows.find_one(self._get_wf_query(query_node),
+                                                 {'fw_states': 1, 'external_links': 1})
+            if not links_dict:
+                raise ValueError("BAD QUERY_NODE! {}".format(query_node))
+        elif check_version:
+            m_query.update(version=links_dict.get('version'), locked={'$exists': False})
+        db_fw_states = links_dict.get('fw_states', {})
+
+        # the lock is preserved since the 'locked' key is left alone
+        updates = {'updated_on': wf.updated_on}
+        if isinstance(wf, _PartialWorkflow):
+            updates['state_counts'] = wf.get_state_counts()
+        else:
+            updates['state'] = wf.state
+            updates['state_counts'] = dict(wf.fw_states.counts)
+        if links_dict.get('external_links'):
+            # the new FireWorks and their parents, whose children changed
+            link_ids = set(old_new.values())
+            link_ids.update(*[wf.links.parent_links.get(f, []) for f in old_new.values()])
+            changed_ids = set(old_new.get(f, f) for f in changed_ids).union(link_ids)
+            self._update_external_links(links_dict['_id'], wf, changed_ids, link_ids)
+            if isinstance(wf, _PartialWorkflow):
+                # from the workflow_nodes that were just written
+                updates['state'] = self._get_external_wf_state(links_dict['_id'],
+                                                               updates['state_counts'])
+        elif old_new or len(db_fw_states) != len(wf.fw_states) or \
+                not changed_ids.issubset(wf.fw_states):
+            # the graph changed: redo the links and fw_states
+            updates.update(wf.links.to_db_dict())
+            updates['fw_states'] = dict([(str(k), v) for (k, v) in wf.fw_states.items()])
+        else:
+            for fw_id in changed_ids:
+                updates['fw_states.{}'.format(fw_id)] = wf.fw_states[fw_id]
+        result = self.workflows.update_one(dict(m_query, _id=links_dict['_id']),
+                                           {'$set': updates, '$inc': {'version': 1}})
+        if lock is not None and not result.matched_count:
+            raise LockedWorkflowError("Lock lost before the workflow was written: {}".format(
+                lock.fw_id))
+        if m_query and not result.matched_count:
+            raise WorkflowVersionError("Workflow changed: {}".format(links_dict['nodes'][0]))
+        self._notify_ready([fw for fw in updated_fws if fw.state == 'READY'])
+
+    def _insert_wfs(self, wfs):
+        """
+        Insert the workflow documents of new workflows. Workflows with at least
+        WF_EXTERNAL_LINKS_MIN_FWS FireWorks keep their links and fw_states in the workflow_nodes
+        collection, one document per FireWork, so that they are not limited by the maximum size of
+        a document and can be updated FireWork by FireWork. The nodes of their workflow document
+        only hold the first FireWork: the workflow of the others is found from their workflow_nodes
+        document (see _get_wf_query).
+
+        Args:
+            wfs ([Workflow])
+        """
+        wf_dicts = []
+        for wf in wfs:
+            wf_dict = wf.to_db_dict()
+            if len(wf.id_fw) >= WF_EXTERNAL_LINKS_MIN_FWS:
+                for k in ('links', 'parent_links', 'fw_states'):
+                    del wf_dict[k]
+                wf_dict['nodes'] = wf_dict['nodes'][:1]
+                wf_dict['_id'] = ObjectId()
+                wf_dict['external_links'] = True
+                # insert the workflow_nodes first, so a workflow document is never without links
+                self.workflow_nodes.insert_many(
+                    {'fw_id': fw_id, 'wf_id': wf_dict['_id'], 'children': list(children),
+                     'state': wf.fw_states[fw_id]} for fw_id, children in wf.links.items())
+            wf_dicts.append(wf_dict)
+        self.workflows.insert_many(wf_dicts)
+
+    def _get_external_links(self, wf_id):
+        """
+        Get the links and fw_states of a workflow with external links.
+
+        Args:
+            wf_id (ObjectId): _id of the workflow document
+
+        Returns:
+            (dict, dict): links (fw_id: [child fw_ids]) and fw_states (fw_id: state)
+        """
+        links = {}
+        fw_states = {}
+        for node in self.workflow_nodes.find({'wf_id': wf_id},
+                                             {'_id': 0, 'fw_id': 1, 'children': 1, 'state': 1}):
+            links[node['fw_id']] = node['children']
+            fw_states[node['fw_id']] = node['state']
+        return links, fw_states
+
+    def _update_external_links(self, wf_id, wf, fw_ids, link_ids):
+        """
+        Write the state of the given FireWorks of a workflow with external links, and their
+        children if their links changed, deleting the ones that are not in the workflow anymore.
+
+        Args:
+            wf_id (ObjectId): _id of the workflow document
+            wf (Workflow)
+            fw_ids ([int])
+            link_ids (set(int)): the fw_ids whose children changed, e.g. the new FireWorks
+        """
+        requests = []
+        for fw_id in fw_ids:
+            if fw_id not in wf.links:
+                requests.append(DeleteOne({'fw_id': fw_id}))
+            elif fw_id in link_ids:
+                requests.append(UpdateOne({'fw_id': fw_id},
+                                          {'$set': {'wf_id': wf_id,
+                                                    'children': list(wf.links[fw_id]),
+                                                    'state': wf.fw_states[fw_id]}},
+                                          upsert=True))
+            else:
+                requests.append(UpdateOne({'fw_id': fw_id},
+                                          {'$set': {'state': wf.fw_states[fw_id]}}))
+        if requests:
+            self.workflow_nodes.bulk_write(requests, ordered=False)
+
+    def _get_external_wf_state(self, wf_id, counts):
+        """
+        Get the state of a workflow with external links from its state_counts and, if needed, its
+        workflow_nodes (see Workflow.get_state_from_counts).
+
+        Args:
+            wf_id (ObjectId): _id of the workflow document
+            counts (dict): number of FireWorks of the workflow in each state
+
+        Returns:
+            str: the state of the workflow
+        """
+        def leaves_completed():
+            return bool(counts.get('COMPLETED')) and not self.workflow_nodes.find_one(
+                {'wf_id': wf_id, 'state': {'$ne': 'COMPLETED'}, 'children': []}, {'_id': 1})
+
+        def fizzled_blocking():
+            for node in self.workflow_nodes.find({'wf_id': wf_id, 'state': 'FIZZLED'},
+                                                 {'children': 1}):
+                if not node['children']:
+                    return True
+                for fw in self.fireworks.find({'fw_id': {'$in': node['children']}},
+                                              {'spec._allow_fizzled_parents': 1}):
+                    if not fw.get('spec', {}).get('_allow_fizzled_parents', False):
+                        return True
+            return False
+
+        return Workflow.get_state_from_counts(counts, leaves_completed, fizzled_blocking)
+
+    def _get_ready_events(self):
+        """
+        Get the capped collection that launchers tail to learn about new READY FireWorks,
+        creating it if needed.
+        """
+        if self._ready_events is None:
+            try:
+                self.db.create_collection('ready_events', capped=True,
+                                          size=READY_EVENTS_MAX_BYTES)
+            except CollectionInvalid:
+                pass  # already exists
+            self._ready_events = self.db.ready_events
+            self._ready_events_capped = bool(self._ready_events.options().get('capped'))
+        return self._ready_events
+
+    def _add_lease(self, lock):
+        """
+        Renew the lease of a WFLock every third of WFLOCK_LEASE_SECS until it is released. A
+        single thread renews the leases of all the WFLocks of the LaunchPad (see _renew_leases).
+
+        Args:
+            lock (WFLock): a lock that was just acquired
+        """
+        with self._leases_cv:
+            self._leases[lock] = time.time() + WFLOCK_LEASE_SECS / 3.0
+            if not self._renewing:
+                self._renewing = True
+                renew_thread = threading.Thread(target=self._renew_leases)
+                renew_thread.daemon = True
+                renew_thread.start()
+            self._leases_cv.notify()
+
+    def _remove_lease(self, lock):
+        """
+        Stop renewing the lease of a WFLock that is released.
+
+        Args:
+            lock (WFLock)
+        """
+        with self._leases_cv:
+            self._leases.pop(lock, None)
+            self._leases_cv.notify()
+
+    def _renew_leases(self):
+        """
+        Renew the leases of the held WFLocks when they are due, until none is held anymore.
+        """
+        while True:
+            with self._leases_cv:
+                while True:
+                    if not self._leases:
+                        self._renewing = False
+                        return
+                    now = time.time()
+                    due = [lock for lock, renew_at in self._leases.items() if renew_at <= now]
+                    if due:
+                        break
+                    self._leases_cv.wait(min(self._leases.values()) - now)
+                for lock in due:
+                    self._leases[lock] = now + WFLOCK_LEASE_SECS / 3.0
+            for lock in due:
+                if not lock._renew():
+                    self._remove_lease(lock)
+
+    def _get_lock_stats(self):
+        """
+        Get the capped collection where the WFLocks are recorded, creating it if needed.
+        """
+        if self._lock_stats is None:
+            try:
+                self.db.create_collection('lock_stats', capped=True,
+                                          size=WFLOCK_STATS_MAX_BYTES)
+            except CollectionInvalid:
+                pass  # already exists
+            self._lock_stats = self.db.lock_stats
+        return self._lock_stats
+
+    def _notify_ready(self, fws):
+        """
+        Wake up the launchers waiting in wait_for_ready() that can run the FireWorks.
 
-        assert query_node is not None
-        if not self.workflows.find_one({'nodes': query_node}):
-            raise ValueError("BAD QUERY_NODE! {}".format(query_node))
-        # redo the links and fw_states
-        wf = wf.to_db_dict()
-        wf['locked'] = True  # preserve the lock!
-        self.workflows.find_one_and_replace({'nodes': query_node}, wf)
+        Args:
+            fws ([Firework]): the FireWorks that became READY
+        """
+        if fws:
+            routing = []
+            for fw in fws:
+                fw_routing = Firework.get_routing(fw.spec)
+                if fw_routing not in routing:
+                    routing.append(fw_routing)
+            self._get_ready_events().insert_one({'n_fws': len(fws), 'routing': routing,
+                                                 'created_on': datetime.datetime.utcnow()})
 
     def _steal_launches(self, thief_fw):
         """
@@ -1613,6 +3287,8 @@ class LaunchPad(FWSerializable):
             priority
         """
         self.fireworks.find_one_and_update({"fw_id": fw_id}, {'$set': {'spec._priority': priority}})
+        # the entry of a READY firework, if any, is sorted by the priority as well
+        self.ready_queue.update_one({"fw_id": fw_id}, {'$set': {'priority': priority}})
 
     def get_logdir(self):
         """
@@ -1678,7 +3354,7 @@ class LaunchPad(FWSerializable):
                     f = self.fireworks.find_one_and_update({'fw_id': fw_id},
                                                            {'$set':
                                                                 {'state': 'RUNNING',
-                                                                 'updated_on': datetime.datetime.utcnow()
+                                                                 'updated_on': to_db_date(datetime.datetime.utcnow())
                                                                  }
                                                             })
                     if f:
@@ -1946,6 +3622,81 @@ class LazyFirework(object):
         return getattr(fw, name)
 
 
+class _PartialWorkflowError(Exception):
+    """
+    Raised when a change of a _PartialWorkflow needs more of the workflow than was loaded.
+    """
+    pass
+
+
+class _PartialWorkflow(Workflow):
+    """
+    The part of a workflow with external links that is needed to refresh some of its FireWorks
+    (the focus): these FireWorks, their parents, their children and the parents of their children.
+    The children of the other FireWorks are limited to the loaded ones.
+
+    Refreshing the focus only needs this part of the workflow, unless a child of the focus
+    completes or fizzles, or an action defuses the workflow: a _PartialWorkflowError is then
+    raised, and the whole workflow must be loaded instead. The state of the workflow is computed
+    from the DB when it is written (see LaunchPad._get_external_wf_state).
+    """
+
+    def __init__(self, fireworks, links_dict, name, metadata, created_on, updated_on, fw_states,
+                 focus, refreshable, state_counts):
+        """
+        Args:
+            fireworks ([LazyFirework]): the loaded FireWorks
+            links_dict (dict): their links
+            name (str): name of workflow.
+            metadata (dict): metadata for this Workflow.
+            created_on (datetime): time of creation
+            updated_on (datetime): time of update
+            fw_states (dict): the states of the loaded FireWorks
+            focus (set(int)): the fw_ids whose children are all loaded
+            refreshable (set(int)): the fw_ids whose parents are all loaded
+            state_counts (dict): number of FireWorks of the whole workflow in each state, in the DB
+        """
+        super(_PartialWorkflow, self).__init__(fireworks, links_dict, name, metadata, created_on,
+                                               updated_on, fw_states)
+        self.focus = focus
+        self.refreshable = refreshable
+        self.db_state_counts = state_counts
+        self.db_fw_states = dict(self.fw_states)
+
+    @property
+    def state(self):
+        raise _PartialWorkflowError("The state of a partial workflow is only known in the DB")
+
+    def get_state_counts(self):
+        """
+        Returns:
+            dict: number of FireWorks of the whole workflow in each state
+        """
+        counts = dict(self.db_state_counts)
+        for fw_state in self.db_fw_states.values():
+            counts[fw_state] -= 1
+        for fw_state in self.fw_states.values():
+            counts[fw_state] = counts.get(fw_state, 0) + 1
+        return dict((k, v) for k, v in counts.items() if v)
+
+    def apply_action(self, action, fw_id):
+        # new FireWorks (negative fw_ids) are fully known
+        if (fw_id >= 0 and fw_id not in self.focus) or action.defuse_workflow:
+            raise _PartialWorkflowError("fw_id {}: action needs the whole workflow".format(fw_id))
+        return super(_PartialWorkflow, self).apply_action(action, fw_id)
+
+    def rerun_fw(self, fw_id, updated_ids=None):
+        raise _PartialWorkflowError("fw_id {}: rerun needs the whole workflow".format(fw_id))
+
+    def _refresh_fw(self, fw_id, updated_ids):
+        if fw_id >= 0 and fw_id not in self.refreshable:
+            raise _PartialWorkflowError("fw_id {}: parents not loaded".format(fw_id))
+        refresh_children = super(_PartialWorkflow, self)._refresh_fw(fw_id, updated_ids)
+        if refresh_children and fw_id >= 0 and fw_id not in self.focus:
+            raise _PartialWorkflowError("fw_id {}: children not loaded".format(fw_id))
+        return refresh_children
+
+
 def get_action_from_gridfs(action_dict, fallback_fs):
     """
     Helper function to obtain the correct dictionary of the FWAction associated
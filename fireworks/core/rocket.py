@@ -20,6 +20,8 @@ import errno
 import glob
 import shutil
 import pdb
+import sys
+import time
 import distutils.dir_util
 from monty.io import zopen
 from monty.serialization import loadfn, dumpfn
@@ -27,7 +29,7 @@ from monty.serialization import loadfn, dumpfn
 from fireworks.core.firework import FWAction, Firework
 from fireworks.fw_config import FWData, PING_TIME_SECS, REMOVE_USELESS_DIRS, \
     PRINT_FW_JSON, \
-    PRINT_FW_YAML, STORE_PACKING_INFO, ROCKET_STREAM_LOGLEVEL
+    PRINT_FW_YAML, STORE_PACKING_INFO, ROCKET_STREAM_LOGLEVEL, CHECKPOINT_INTERVAL_SECS
 from fireworks.utilities.dict_mods import apply_mod
 from fireworks.core.launchpad import LockedWorkflowError, LaunchPad
 from fireworks.utilities.fw_utilities import get_fw_logger
@@ -100,22 +102,103 @@ def start_background_task(btask, spec):
     return ping_stop
 
 
+def run_tasks(tasks, spec):
+    """
+    Run Firetasks, at the same time in separate threads if there are several of them.
+
+    Args:
+        tasks ([FiretaskBase])
+        spec (dict): spec given to every Firetask
+
+    Returns:
+        [(FWAction, tuple)]: for each Firetask, the FWAction it returned and the exc_info of the
+            exception it raised, if any
+    """
+    results = [(None, None)] * len(tasks)
+
+    def run(i):
+        try:
+            results[i] = (tasks[i].run_task(spec), None)
+        except BaseException:
+            results[i] = (None, sys.exc_info())
+
+    if len(tasks) == 1:
+        run(0)
+    else:
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(tasks))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+def get_task_group_end(task_n, n_tasks, task_parallelism):
+    """
+    Get the end of the group of Firetasks run at the same time that starts at task_n.
+
+    Args:
+        task_n (int): index of the first Firetask of the group
+        n_tasks (int): number of Firetasks of the Firework
+        task_parallelism (int or [int]): the _task_parallelism of the spec: the number of
+            consecutive Firetasks run at the same time, or the sizes of the successive groups of
+            Firetasks run at the same time. A group restarted from one of its Firetasks (e.g. by
+            a task-level rerun) only runs the Firetasks from this one.
+
+    Returns:
+        int: index after the last Firetask of the group
+    """
+    if isinstance(task_parallelism, list):
+        end = 0
+        for size in task_parallelism:
+            end += size
+            if end > task_n:
+                return min(end, n_tasks)
+        # the Firetasks after the groups are run one after the other
+        return task_n + 1
+    return min(task_n + task_parallelism, n_tasks)
+
+
+def _check_task_parallelism(task_parallelism):
+    """
+    Args:
+        task_parallelism: the _task_parallelism of the spec
+
+    Returns:
+        int or [int]: task_parallelism, 1 if not set
+
+    Raises:
+        ValueError: if task_parallelism is not a positive number or a list of them
+    """
+    if task_parallelism is None:
+        return 1
+    sizes = task_parallelism if isinstance(task_parallelism, list) else [task_parallelism]
+    if not sizes or not all(isinstance(size, int) and not isinstance(size, bool) and size > 0
+                            for size in sizes):
+        raise ValueError("_task_parallelism must be a positive integer or a list of positive "
+                         "integers, not {!r}".format(task_parallelism))
+    return task_parallelism
+
+
 class Rocket:
     """
     The Rocket fetches a workflow step from the FireWorks database and executes it.
     """
 
-    def __init__(self, launchpad, fworker, fw_id):
+    def __init__(self, launchpad, fworker, fw_id, launch_id=None):
         """
         Args:
         launchpad (LaunchPad): A LaunchPad object for interacting with the FW database.
             If none, reads FireWorks from FW.json and writes to FWAction.json
         fworker (FWorker): A FWorker object describing the computing resource
         fw_id (int): id of a specific Firework to run (quit if it cannot be found)
+        launch_id (int): with fw_id, the launch id of its reservation (quit if it was reserved
+            by another launch)
         """
         self.launchpad = launchpad
         self.fworker = fworker
         self.fw_id = fw_id
+        self.launch_id = launch_id
 
     def run(self, pdb_on_exception=False):
         """
@@ -137,7 +220,8 @@ class Rocket:
 
         # check a FW job out of the launchpad
         if lp:
-            m_fw, launch_id = lp.checkout_fw(self.fworker, launch_dir, self.fw_id)
+            m_fw, launch_id = lp.checkout_fw(self.fworker, launch_dir, self.fw_id,
+                                             launch_id=self.launch_id)
         else:  # offline mode
             m_fw = Firework.from_file(os.path.join(os.getcwd(), "FW.json"))
 
@@ -158,6 +242,8 @@ class Rocket:
         final_state = None
         ping_stop = None
         btask_stops = []
+        checkpoint = None  # latest checkpoint not yet written
+        last_checkpoint_time = None
 
         try:
             if '_launch_dir' in m_fw.spec and lp:
@@ -236,38 +322,121 @@ class Rocket:
                 for bt in my_spec['_background_tasks']:
                     btask_stops.append(start_background_task(bt, m_fw.spec))
 
-            # execute the Firetasks!
-            for t_counter, t in enumerate(m_fw.tasks[starting_task:], start=starting_task):
-                checkpoint = {'_task_n': t_counter,
-                              '_all_stored_data': all_stored_data,
-                              '_all_update_spec': all_update_spec,
-                              '_all_mod_spec': all_mod_spec}
-                Rocket.update_checkpoint(lp, launch_dir, launch_id, checkpoint)
- 
+            # execute the Firetasks! the groups of consecutive Firetasks set by
+            # _task_parallelism are run at the same time, on the spec left by the previous ones
+            try:
+                task_parallelism = _check_task_parallelism(my_spec.get('_task_parallelism'))
+            except ValueError as ex:
                 if lp:
-                   l_logger.log(logging.INFO, "Task started: %s." % t.fw_name)
-
-                if my_spec.get("_add_launchpad_and_fw_id"):
-                    t.fw_id = m_fw.fw_id
-                    if FWData().MULTIPROCESSING:
-                        # hack because AutoProxy manager can't access attributes
-                        t.launchpad = LaunchPad.from_dict(self.launchpad.to_dict())
-                    else:
-                        t.launchpad = self.launchpad
-
-                if my_spec.get("_add_fworker"):
-                    t.fworker = self.fworker
-
-                try:
-                    m_action = t.run_task(my_spec)
-                except BaseException as e:
-                    traceback.print_exc()
-                    tb = traceback.format_exc()
+                    l_logger.log(logging.WARNING, "%s; running the Firetasks one after the "
+                                                  "other" % ex)
+                task_parallelism = 1
+            t_counter = starting_task
+            while t_counter < len(m_fw.tasks):
+                tasks = m_fw.tasks[t_counter:get_task_group_end(t_counter, len(m_fw.tasks),
+                                                                task_parallelism)]
+                if last_checkpoint_time is None or \
+                        time.time() - last_checkpoint_time >= CHECKPOINT_INTERVAL_SECS:
+                    checkpoint = {'_task_n': t_counter,
+                                  '_all_stored_data': all_stored_data,
+                                  '_all_update_spec': all_update_spec,
+                                  '_all_mod_spec': all_mod_spec}
+                    Rocket.update_checkpoint(lp, launch_dir, launch_id, checkpoint)
+                    checkpoint = None
+                    last_checkpoint_time = time.time()
+                else:
+                    # the previous checkpoint is too recent: keep a copy of this one, which is
+                    # written if the Firework fizzles before the next one is due
+                    checkpoint = {'_task_n': t_counter,
+                                  '_all_stored_data': dict(all_stored_data),
+                                  '_all_update_spec': dict(all_update_spec),
+                                  '_all_mod_spec': list(all_mod_spec)}
+
+                for t in tasks:
+                    if lp:
+                       l_logger.log(logging.INFO, "Task started: %s." % t.fw_name)
+
+                    if my_spec.get("_add_launchpad_and_fw_id"):
+                        t.fw_id = m_fw.fw_id
+                        if FWData().MULTIPROCESSING:
+                            # hack because AutoProxy manager can't access attributes
+                            t.launchpad = LaunchPad.from_dict(self.launchpad.to_dict())
+                        else:
+                            t.launchpad = self.launchpad
+
+                    if my_spec.get("_add_fworker"):
+                        t.fworker = self.fworker
+
+                results = run_tasks(tasks, my_spec)
+                # the first Firetask that failed, if any, fizzles the Firework once the actions
+                # of the Firetasks before it are applied. The actions of the Firetasks after it
+                # are discarded: they are run again by a task-level rerun
+                n_done = next((i for i, (_, exc_info) in enumerate(results) if exc_info),
+                              len(tasks))
+                actions = [m_action for m_action, _ in results[:n_done]]
+                # read in a FWAction from a file, in case the task is not Python and cannot
+                # return it explicitly. The file is read once for the Firetasks run at the same
+                # time: its FWAction is the one of the last Firetask of the group that returned
+                # none. The FWAction returned by a Firetask run alone is replaced, as before
+                file_action = None
+                if n_done:
+                    if os.path.exists('FWAction.json'):
+                        file_action = FWAction.from_file('FWAction.json')
+                    elif os.path.exists('FWAction.yaml'):
+                        file_action = FWAction.from_file('FWAction.yaml')
+                if file_action is not None:
+                    no_action = [i for i, m_action in enumerate(actions) if not m_action]
+                    if len(tasks) == 1 or no_action:
+                        actions[(no_action or [0])[-1]] = file_action
+                    elif lp:
+                        l_logger.log(logging.WARNING, "All the Firetasks run at the same time "
+                                                      "returned a FWAction: ignoring the "
+                                                      "FWAction file")
+
+                # the FWActions are applied in the order of the Firetasks, whatever the order in
+                # which they finished
+                skip_remaining_tasks = False
+                for t, m_action in zip(tasks, actions):
+                    if not m_action:
+                        m_action = FWAction()
+
+                    # update the global stored data with the data to store and update from this
+                    # particular Task
+                    all_stored_data.update(m_action.stored_data)
+                    all_update_spec.update(m_action.update_spec)
+                    all_mod_spec.extend(m_action.mod_spec)
+
+                    # update spec for next task as well
+                    my_spec.update(m_action.update_spec)
+                    for mod in m_action.mod_spec:
+                        apply_mod(mod, my_spec)
+                    if lp:
+                        l_logger.log(logging.INFO, "Task completed: %s " % t.fw_name)
+                    if m_action.skip_remaining_tasks:
+                        skip_remaining_tasks = True
+                        break
+                if skip_remaining_tasks:
+                    break
+                if n_done < len(tasks):
+                    t, exc_info = tasks[n_done], results[n_done][1]
+                    e = exc_info[1]
+                    traceback.print_exception(*exc_info)
+                    tb = ''.join(traceback.format_exception(*exc_info))
+                    if n_done:
+                        # like for Firetasks run one after the other, a task-level rerun
+                        # restarts from the Firetask that failed
+                        checkpoint = {'_task_n': t_counter + n_done,
+                                      '_all_stored_data': all_stored_data,
+                                      '_all_update_spec': all_update_spec,
+                                      '_all_mod_spec': all_mod_spec}
+                    if checkpoint:
+                        Rocket.update_checkpoint(lp, launch_dir, launch_id, checkpoint)
+                        checkpoint = None
                     stop_backgrounds(ping_stop, btask_stops)
                     do_ping(lp, launch_id)  # one last ping, esp if there is a monitor
                     # If the exception is serializable, save its details
                     if pdb_on_exception:
-                        pdb.post_mortem()
+                        pdb.post_mortem(exc_info[2])
                     try:
                         exception_details = e.to_dict()
                     except AttributeError:
@@ -305,30 +474,7 @@ class Rocket:
 
                     return True
 
-                # read in a FWAction from a file, in case the task is not Python and cannot return
-                # it explicitly
-                if os.path.exists('FWAction.json'):
-                    m_action = FWAction.from_file('FWAction.json')
-                elif os.path.exists('FWAction.yaml'):
-                    m_action = FWAction.from_file('FWAction.yaml')
-
-                if not m_action:
-                    m_action = FWAction()
-
-                # update the global stored data with the data to store and update from this
-                # particular Task
-                all_stored_data.update(m_action.stored_data)
-                all_update_spec.update(m_action.update_spec)
-                all_mod_spec.extend(m_action.mod_spec)
-
-                # update spec for next task as well
-                my_spec.update(m_action.update_spec)
-                for mod in m_action.mod_spec:
-                    apply_mod(mod, my_spec)
-                if lp:
-                    l_logger.log(logging.INFO, "Task completed: %s " % t.fw_name)
-                if m_action.skip_remaining_tasks:
-                    break
+                t_counter += len(tasks)
 
             # add job packing info if this is needed
             if FWData().MULTIPROCESSING and STORE_PACKING_INFO:
@@ -384,6 +530,11 @@ class Rocket:
             # restore initial state to prevent the raise of further exceptions
             if lp:
                 lp.restore_backup_data(launch_id, m_fw.fw_id)
+            if checkpoint:
+                try:
+                    Rocket.update_checkpoint(lp, launch_dir, launch_id, checkpoint)
+                except:
+                    traceback.print_exc()
 
             do_ping(lp, launch_id)  # one last ping, esp if there is a monitor
             # the action produced by the task is discarded
@@ -432,7 +583,7 @@ class Rocket:
             checkpoint (dict): checkpoint data
         """
         if launchpad:
-            launchpad.ping_launch(launch_id, checkpoint=checkpoint)
+            launchpad.checkpoint_launch(launch_id, checkpoint)
         else:
             fpath = zpath("FW_offline.json")
             with zopen(fpath) as f_in:
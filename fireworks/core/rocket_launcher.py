@@ -7,10 +7,13 @@ This module contains methods for launching Rockets, both singly and in rapid-fir
 """
 
 import os
+import threading
 import time
+from collections import deque
 from datetime import datetime
 
-from fireworks.fw_config import RAPIDFIRE_SLEEP_SECS, FWORKER_LOC
+from fireworks.fw_config import RAPIDFIRE_SLEEP_SECS, FWORKER_LOC, PREFETCH_LEASE_SECS, \
+    PREFETCH_LEASE_MARGIN
 from fireworks.core.fworker import FWorker
 from fireworks.core.rocket import Rocket
 from fireworks.utilities.fw_utilities import get_fw_logger, create_datestamp_dir, log_multi, redirect_local
@@ -33,8 +36,123 @@ def get_fworker(fworker):
     return my_fwkr
 
 
+class ReservationPrefetcher(object):
+    """
+    Keeps a small local buffer of FireWorks that are already RESERVED for this launcher, so
+    that the next Rocket can start as soon as the previous one finishes. A background thread
+    refills the buffer with LaunchPad.checkout_fws() while the Rockets run.
+
+    Reservations that stay in the buffer for nearly lease_secs (see PREFETCH_LEASE_MARGIN), and
+    all reservations left over when the prefetcher is stopped, are given back with
+    LaunchPad.cancel_reservation(). The
+    lease is also recorded in the reserved Launches (see LaunchPad.checkout_fws): if the launcher
+    dies without stopping the prefetcher, its reservations are given back by the next
+    LaunchPad.detect_unreserved (e.g. "lpad admin maintain") once their lease expired, rather than
+    after RESERVATION_EXPIRATION_SECS.
+    """
+
+    def __init__(self, launchpad, fworker, launch_dir, size, lease_secs=PREFETCH_LEASE_SECS):
+        """
+        Args:
+            launchpad (LaunchPad)
+            fworker (FWorker)
+            launch_dir (str): directory recorded in the reserved Launches
+            size (int): max number of FireWorks to keep reserved ahead
+            lease_secs (int): give back reservations left unused for this many seconds
+        """
+        self.launchpad = launchpad
+        self.fworker = fworker
+        self.launch_dir = launch_dir
+        self.size = size
+        self.lease_secs = lease_secs
+        # measured with the local clock: stop short of the lease recorded in the DB
+        self.local_lease_secs = lease_secs * (1 - PREFETCH_LEASE_MARGIN)
+        self._buffer = deque()  # (fw_id, launch_id, reservation time)
+        self._exhausted = False  # the last refill did not find enough FireWorks
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._fill)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop refilling the buffer and cancel the reservations that were never used.
+        """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        with self._cond:
+            unused, self._buffer = list(self._buffer), deque()
+        for _, launch_id, _ in unused:
+            self.launchpad.cancel_reservation(launch_id)
+
+    def run_exists(self):
+        """
+        Wait until the buffer holds a reserved Firework or the background thread finds that
+        none are available.
+
+        Returns:
+            bool: True if a reserved Firework is available
+        """
+        with self._cond:
+            if not self._buffer:
+                self._exhausted = False  # ask for another try
+                self._cond.notify_all()
+                while not self._buffer and not self._exhausted and self._thread.is_alive():
+                    self._cond.wait(1)
+            return bool(self._buffer)
+
+    def pop(self):
+        """
+        Take the next reserved Firework out of the buffer, giving back expired reservations.
+
+        Returns:
+            (int, int): the fw_id of a Firework reserved for this launcher and the launch_id of
+                its reservation, or (None, None)
+        """
+        expired = []
+        fw_id, launch_id = None, None
+        with self._cond:
+            while self._buffer:
+                m_fw_id, m_launch_id, reserved_on = self._buffer.popleft()
+                if self.lease_secs and time.time() - reserved_on > self.local_lease_secs:
+                    expired.append(m_launch_id)
+                else:
+                    fw_id, launch_id = m_fw_id, m_launch_id
+                    break
+            self._exhausted = False  # refill what was taken
+            self._cond.notify_all()
+        for m_launch_id in expired:
+            self.launchpad.cancel_reservation(m_launch_id)
+        return fw_id, launch_id
+
+    def _fill(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set() and \
+                        (len(self._buffer) >= self.size or self._exhausted):
+                    self._cond.wait()
+                if self._stop.is_set():
+                    return
+                n = self.size - len(self._buffer)
+            reserved_on = time.time()  # no later than the start of the lease
+            reserved = self.launchpad.checkout_fws(self.fworker, self.launch_dir, n,
+                                                   lease_secs=self.lease_secs)
+            with self._cond:
+                self._buffer.extend((fw.fw_id, launch_id, reserved_on)
+                                    for fw, launch_id in reserved)
+                self._exhausted = len(reserved) < n
+                self._cond.notify_all()
+
+
 def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
-                  pdb_on_exception=False):
+                  pdb_on_exception=False, launch_id=None):
     """
     Run a single rocket in the current directory.
 
@@ -45,6 +163,7 @@ def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
         strm_lvl (str): level at which to output logs to stdout
         pdb_on_exception (bool): if set to True, python will start
             the debugger on a firework exception
+        launch_id (int): with fw_id, the launch id of its reservation, if it was reserved
 
     Returns:
         bool
@@ -54,14 +173,15 @@ def launch_rocket(launchpad, fworker=None, fw_id=None, strm_lvl='INFO',
     l_logger = get_fw_logger('rocket.launcher', l_dir=l_dir, stream_level=strm_lvl)
 
     log_multi(l_logger, 'Launching Rocket')
-    rocket = Rocket(launchpad, fworker, fw_id)
+    rocket = Rocket(launchpad, fworker, fw_id, launch_id=launch_id)
     rocket_ran = rocket.run(pdb_on_exception=pdb_on_exception)
     log_multi(l_logger, 'Rocket finished')
     return rocket_ran
 
 
 def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sleep_time=None,
-              strm_lvl='INFO', timeout=None, local_redirect=False, pdb_on_exception=False):
+              strm_lvl='INFO', timeout=None, local_redirect=False, pdb_on_exception=False,
+              batch_size=None, prefetch=None):
     """
     Keeps running Rockets in m_dir until we reach an error. Automatically creates subdirectories
     for each Rocket. Usually stops when we run out of FireWorks from the LaunchPad.
@@ -72,10 +192,18 @@ def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sl
         m_dir (str): the directory in which to loop Rocket running
         nlaunches (int): 0 means 'until completion', -1 or "infinite" means to loop until max_loops
         max_loops (int): maximum number of loops (default -1 is infinite)
-        sleep_time (int): secs to sleep between rapidfire loop iterations
+        sleep_time (int): max secs to sleep between rapidfire loop iterations; the sleep ends
+            early when new FireWorks become READY
         strm_lvl (str): level at which to output logs to stdout
         timeout (int): of seconds after which to stop the rapidfire process
         local_redirect (bool): redirect standard input and output to local file
+        pdb_on_exception (bool): if set to True, python will start
+            the debugger on a firework exception
+        batch_size (int): if set, reserve this many FireWorks at a time with a single
+            LaunchPad.checkout_fws() call and run them one after the other. Reservations left
+            unused when the rapidfire stops are cancelled.
+        prefetch (int): if set, keep this many FireWorks reserved ahead in a background thread
+            (see ReservationPrefetcher), so that Rockets start without waiting on the database.
     """
 
     sleep_time = sleep_time if sleep_time else RAPIDFIRE_SLEEP_SECS
@@ -93,41 +221,83 @@ def rapidfire(launchpad, fworker=None, m_dir=None, nlaunches=0, max_loops=-1, sl
         return (timeout is None or
                 (datetime.now() - start_time).total_seconds() < timeout)
 
-    while num_loops != max_loops and time_ok():
-        skip_check = False  # this is used to speed operation
-        while (skip_check or launchpad.run_exists(fworker)) and time_ok():
-            os.chdir(curdir)
-            launcher_dir = create_datestamp_dir(curdir, l_logger, prefix='launcher_')
-            os.chdir(launcher_dir)
-            if local_redirect:
-                with redirect_local():
-                    rocket_ran = launch_rocket(launchpad, fworker, strm_lvl=strm_lvl,
-                                               pdb_on_exception=pdb_on_exception)
-            else:
-                rocket_ran = launch_rocket(launchpad, fworker, strm_lvl=strm_lvl,
-                                           pdb_on_exception=pdb_on_exception)
-
-            if rocket_ran:
-                num_launched += 1
-            elif not os.listdir(launcher_dir):
-                # remove the empty shell of a directory
+    reserved = []  # (fw_id, launch_id) of FWs reserved in batch mode or being launched
+    prefetcher = None
+    if prefetch:
+        prefetcher = ReservationPrefetcher(launchpad, fworker, curdir, prefetch)
+        prefetcher.start()
+
+    def run_exists():
+        # FWs with a _dupefinder are never prefetched, so also check the LaunchPad
+        if prefetcher and prefetcher.run_exists():
+            return True
+        return launchpad.run_exists(fworker)
+
+    try:
+        while num_loops != max_loops and time_ok():
+            # wake up for the FWs that become READY from now on, even while they are checked for
+            ready_event_id = launchpad.get_ready_event_id()
+            skip_check = False  # this is used to speed operation
+            while (skip_check or run_exists()) and time_ok():
                 os.chdir(curdir)
-                os.rmdir(launcher_dir)
-            if nlaunches > 0 and num_launched == nlaunches:
-                break
-            if launchpad.run_exists(fworker):
-                skip_check = True  # don't wait, pull the next FW right away
-            else:
-                # add a small amount of buffer breathing time for DB to refresh in case we have a dynamic WF
-                time.sleep(0.15)
-                skip_check = False
-        if nlaunches == 0:
-            if not launchpad.future_run_exists(fworker):
+                launcher_dir = create_datestamp_dir(curdir, l_logger, prefix='launcher_')
+                os.chdir(launcher_dir)
+                # the FW to launch is kept in reserved until the Rocket returns: if the launch
+                # fails before the Rocket starts the FW, its reservation is cancelled as well
+                fw_id, launch_id = None, None
+                if prefetcher:
+                    fw_id, launch_id = prefetcher.pop()
+                    if fw_id is not None:
+                        reserved.append((fw_id, launch_id))
+                elif batch_size:
+                    if not reserved:
+                        reserved = [(fw.fw_id, launch_id) for fw, launch_id in
+                                    launchpad.checkout_fws(fworker, curdir, batch_size)]
+                    if reserved:
+                        fw_id, launch_id = reserved[0]
+                if local_redirect:
+                    with redirect_local():
+                        rocket_ran = launch_rocket(launchpad, fworker, fw_id=fw_id,
+                                                   strm_lvl=strm_lvl,
+                                                   pdb_on_exception=pdb_on_exception,
+                                                   launch_id=launch_id)
+                else:
+                    rocket_ran = launch_rocket(launchpad, fworker, fw_id=fw_id, strm_lvl=strm_lvl,
+                                               pdb_on_exception=pdb_on_exception,
+                                               launch_id=launch_id)
+                if reserved and reserved[0][0] == fw_id:
+                    reserved.pop(0)
+
+                if rocket_ran:
+                    num_launched += 1
+                elif not os.listdir(launcher_dir):
+                    # remove the empty shell of a directory
+                    os.chdir(curdir)
+                    os.rmdir(launcher_dir)
+                if nlaunches > 0 and num_launched == nlaunches:
+                    break
+                if reserved or run_exists():
+                    skip_check = True  # don't wait, pull the next FW right away
+                else:
+                    # add a small amount of buffer breathing time for DB to refresh in case we
+                    # have a dynamic WF
+                    time.sleep(0.15)
+                    skip_check = False
+            if nlaunches == 0:
+                if not launchpad.future_run_exists(fworker):
+                    break
+            elif num_launched == nlaunches:
                 break
-        elif num_launched == nlaunches:
-            break
-        log_multi(l_logger, 'Sleeping for {} secs'.format(sleep_time))
-        time.sleep(sleep_time)
-        num_loops += 1
-        log_multi(l_logger, 'Checking for FWs to run...')
-    os.chdir(curdir)
+            log_multi(l_logger, 'Sleeping for {} secs or until new FWs are READY'.format(sleep_time))
+            launchpad.wait_for_ready(sleep_time, fworker, ready_event_id)
+            num_loops += 1
+            log_multi(l_logger, 'Checking for FWs to run...')
+    finally:
+        # give back the FWs that were reserved but never launched, even if a launch failed;
+        # cancelling the reservation of a FW that is already running does nothing
+        if prefetcher:
+            prefetcher.stop()
+        for fw_id, launch_id in reserved:
+            log_multi(l_logger, 'Cancelling unused reservation of fw_id: {}'.format(fw_id))
+            launchpad.cancel_reservation(launch_id)
+        os.chdir(curdir)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark of the reconstitution of dates when loading a Firework whose spec holds many strings
+(file paths, labels) and few dates, with and without RECONSTITUTE_DATE_FIELDS_ONLY, compared to
+trying strptime() on every string. Usage:
+
+    python -m fireworks.core.tests.benchmark_dates [n_records]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import datetime
+import sys
+import time
+
+import six
+
+from fireworks.core.firework import Firework
+from fireworks.user_objects.firetasks.script_task import ScriptTask
+from fireworks.utilities import fw_serializers
+
+
+def strptime_dates(obj_dict):
+    """
+    Reference implementation, which tries strptime() on every string.
+    """
+    if isinstance(obj_dict, dict):
+        return {k: strptime_dates(v) for k, v in obj_dict.items()}
+    if isinstance(obj_dict, (list, tuple)):
+        return [strptime_dates(v) for v in obj_dict]
+    if isinstance(obj_dict, six.string_types):
+        try:
+            return datetime.datetime.strptime(obj_dict, "%Y-%m-%dT%H:%M:%S.%f")
+        except ValueError:
+            try:
+                return datetime.datetime.strptime(obj_dict, "%Y-%m-%dT%H:%M:%S")
+            except ValueError:
+                pass
+    return obj_dict
+
+
+def get_fw_dict(n):
+    """
+    Returns:
+        dict: the DB dict of a Firework with n records of paths, labels and one date each
+    """
+    now = datetime.datetime.utcnow()
+    records = [{'path': '/scratch/block_2017-01-01/launcher_{}/OUTCAR.gz'.format(i),
+                'files': ['INCAR', 'POSCAR', 'KPOINTS', 'POTCAR'], 'label': 'relax',
+                'created_on': now, 'energy': -1.5} for i in range(n)]
+    fw = Firework(ScriptTask.from_str('echo "lorem ipsum"'), spec={'records': records})
+    return fw.to_db_dict()
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def benchmark(n):
+    """
+    Returns:
+        [(str, float, float)]: for each method, secs to run reconstitute_dates and
+            Firework.from_dict (None for strptime) on a Firework with n records
+    """
+    fw_dict = get_fw_dict(n)
+    fields_only = fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY
+    results = []
+    try:
+        # monkey-patch the module constant, as from_dict and to_db_dict use it
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = False
+        results.append(('strptime', timed(strptime_dates, fw_dict), None))
+        results.append(('regex', timed(fw_serializers.reconstitute_dates, fw_dict),
+                        timed(Firework.from_dict, fw_dict)))
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = True
+        results.append(('date fields only', timed(fw_serializers.reconstitute_dates, fw_dict),
+                        timed(Firework.from_dict, fw_dict)))
+    finally:
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = fields_only
+    return results
+
+
+if __name__ == '__main__':
+    n_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('{:>24} {:>18} {:>10}'.format('{} records'.format(n_records), 'reconstitute_dates',
+                                        'from_dict'))
+    for name, t_dates, t_load in benchmark(n_records):
+        print('{:>24} {:>17.3f}s {:>10}'.format(
+            name, t_dates, '-' if t_load is None else '{:.3f}s'.format(t_load)))
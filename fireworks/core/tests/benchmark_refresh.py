@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark of Workflow.refresh() on chain, fan-out and diamond workflows.
+
+Every Firework is given a COMPLETED Launch and the root is refreshed, which completes the
+whole workflow. The root is then rerun, which resets the whole workflow. The time to build the
+workflow and to serialize it for the DB are reported as well. Usage:
+
+    python -m fireworks.core.tests.benchmark_refresh [n_nodes ...]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+
+from fireworks.core.firework import Firework, Workflow, Launch, FWAction
+
+
+def get_links(shape, n):
+    """
+    Args:
+        shape (str): 'chain', 'fanout' or 'diamond'
+        n (int): number of Fireworks
+
+    Returns:
+        dict: links of a workflow with Fireworks 1 to n, rooted at 1
+    """
+    if shape == 'chain':
+        links = {i: [i + 1] for i in range(1, n)}
+    elif shape == 'fanout':
+        links = {1: list(range(2, n + 1))}
+    elif shape == 'diamond':
+        links = {1: list(range(2, n))}
+        links.update({i: [n] for i in range(2, n)})
+    else:
+        raise ValueError('Unknown shape: {}'.format(shape))
+    links[n] = []
+    return links
+
+
+def benchmark(shape, n):
+    """
+    Returns:
+        (float, float, float, float): secs to build, refresh, rerun and serialize the workflow
+    """
+    fws = [Firework([], fw_id=i) for i in range(1, n + 1)]
+    start = time.time()
+    wf = Workflow(fws, get_links(shape, n))
+    t_build = time.time() - start
+
+    for fw in fws:
+        fw.launches = [Launch('COMPLETED', '.', host='localhost', ip='127.0.0.1',
+                              action=FWAction(), fw_id=fw.fw_id)]
+    start = time.time()
+    wf.refresh(1)
+    t_refresh = time.time() - start
+    assert wf.state == 'COMPLETED'
+
+    start = time.time()
+    wf.rerun_fw(1)
+    t_rerun = time.time() - start
+
+    start = time.time()
+    wf.to_db_dict()
+    t_serialize = time.time() - start
+    return t_build, t_refresh, t_rerun, t_serialize
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+    print('{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('shape', 'n', 'build', 'refresh',
+                                                        'rerun', 'serialize'))
+    for shape in ('chain', 'fanout', 'diamond'):
+        for n in sizes:
+            print('{:>8} {:>8} {:>9.3f}s {:>9.3f}s {:>9.3f}s {:>9.3f}s'.format(
+                shape, n, *benchmark(shape, n)))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark of the serialization of a Firework with a large spec and of a workflow with many
+Fireworks. Usage:
+
+    python -m fireworks.core.tests.benchmark_serialize [spec_mb [n_fws]]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import datetime
+import json
+import sys
+import time
+
+from fireworks.core.firework import Firework, Workflow
+from fireworks.user_objects.firetasks.script_task import ScriptTask
+
+
+def get_spec(mb):
+    """
+    Returns:
+        dict: a spec of nested dicts, lists, strings, numbers and dates of about mb MB in JSON
+    """
+    now = datetime.datetime.utcnow()
+    record = {'energy': -1.5, 'converged': True, 'label': 'structure', 'created_on': now,
+              'forces': [[0.1, 0.2, 0.3]] * 4, 'params': {'encut': 520, 'kpoints': (4, 4, 4)}}
+    size = len(json.dumps(record, default=str))
+    return {'records': [dict(record, index=i) for i in range(int(mb * 1e6 / size))]}
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def benchmark_spec(mb):
+    """
+    Returns:
+        (float, float): secs to serialize and to load a Firework with a spec of mb MB
+    """
+    fw = Firework(ScriptTask.from_str('echo "lorem ipsum"'), spec=get_spec(mb))
+    fw_dict, t_dict = timed(fw.to_db_dict)
+    _, t_load = timed(Firework.from_dict, fw_dict)
+    return t_dict, t_load
+
+
+def benchmark_wf(n):
+    """
+    Returns:
+        (float, float): secs to serialize and to load a workflow of n Fireworks
+    """
+    fws = [Firework(ScriptTask.from_str('echo "lorem ipsum"'), spec={'index': i}, fw_id=i)
+           for i in range(1, n + 1)]
+    wf = Workflow(fws, {i: [i + 1] for i in range(1, n)})
+    wf_dict, t_dict = timed(wf.to_dict)
+    _, t_load = timed(Workflow.from_dict, wf_dict)
+    return t_dict, t_load
+
+
+if __name__ == '__main__':
+    spec_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    n_fws = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    print('{:>24} {:>10} {:>10}'.format('', 'to_dict', 'from_dict'))
+    print('{:>24} {:>9.3f}s {:>9.3f}s'.format('{} MB spec'.format(spec_mb),
+                                            *benchmark_spec(spec_mb)))
+    print('{:>24} {:>9.3f}s {:>9.3f}s'.format('{} FWs workflow'.format(n_fws),
+                                            *benchmark_wf(n_fws)))
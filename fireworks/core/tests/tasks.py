@@ -28,6 +28,20 @@ class ExecutionCounterTask(FiretaskBase):
     def run_task(self, fw_spec):
         ExecutionCounterTask.exec_counter += 1
 
+@explicit_serialize
+class SleepStoreTask(FiretaskBase):
+    def run_task(self, fw_spec):
+        time.sleep(self.get('seconds', 0))
+        return FWAction(stored_data={self['name']: fw_spec.get('last')},
+                        update_spec={'last': self['name']},
+                        mod_spec=[{'_push': {'names': self['name']}}])
+
+@explicit_serialize
+class FWActionFileTask(FiretaskBase):
+    def run_task(self, fw_spec):
+        # like a script, which cannot return a FWAction
+        FWAction(update_spec=self['update_spec']).to_file('FWAction.json')
+
 @explicit_serialize
 class MalformedAdditionTask(FiretaskBase):
     def run_task(self, fw_spec):
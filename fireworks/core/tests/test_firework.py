@@ -14,9 +14,11 @@ __maintainer__ = "Shyue Ping Ong"
 __email__ = "shyuep@gmail.com"
 __date__ = "2/26/14"
 
+import sys
 import unittest
+import pickle
 
-from fireworks.core.firework import Firework, Workflow, FiretaskBase, FWAction
+from fireworks.core.firework import Firework, Workflow, FiretaskBase, FWAction, Launch
 from fireworks.user_objects.firetasks.script_task import PyTask
 from fireworks.utilities.fw_utilities import explicit_serialize
 
@@ -133,6 +135,59 @@ class WorkflowTest(unittest.TestCase):
             for child_id, orig_child_id in zip(children, orig_children):
                 self.assertEqual(orig_child_id, wf_copy.id_fw[child_id].name)
 
+    def test_links(self):
+        links = Workflow.Links({'0': [1, 2], 1: [3], 2: 3})
+        self.assertEqual(links.parent_links, {1: [0], 2: [0], 3: [1, 2]})
+        self.assertEqual(sorted(links.nodes), [0, 1, 2, 3])
+
+        # the reverse links and nodes follow changes to the links
+        links[3] = []
+        links[1].append(4)
+        links[2].remove(3)
+        self.assertEqual(links.parent_links, {1: [0], 2: [0], 3: [1], 4: [1]})
+        self.assertEqual(sorted(links.nodes), [0, 1, 2, 3, 4])
+        del links[0]
+        self.assertEqual(links.parent_links, {3: [1], 4: [1]})
+        self.assertEqual(sorted(links.nodes), [1, 2, 3, 4])
+
+        self.assertEqual(links.to_db_dict()['parent_links'], {'3': [1], '4': [1]})
+        copied = pickle.loads(pickle.dumps(links))
+        self.assertEqual(copied.parent_links, links.parent_links)
+
+    def test_state_counts(self):
+        fw4 = Firework(Task1(), parents=[self.fw2, self.fw3])
+        wflow = Workflow([self.fw1, self.fw2, self.fw3, fw4])
+        self.assertEqual(wflow.fw_states.counts, {'WAITING': 4})
+        self.assertEqual(wflow.state, 'READY')
+        self.assertEqual(sorted(wflow.leaf_fw_ids), [fw4.fw_id])
+
+        wflow.fw_states[self.fw1.fw_id] = 'COMPLETED'
+        wflow.fw_states[self.fw2.fw_id] = 'RUNNING'
+        self.assertEqual(wflow.fw_states.counts, {'COMPLETED': 1, 'RUNNING': 1, 'WAITING': 2})
+        self.assertEqual(wflow.state, 'RUNNING')
+        self.assertEqual(wflow.to_db_dict()['state_counts'],
+                         {'COMPLETED': 1, 'RUNNING': 1, 'WAITING': 2})
+
+        # only the leaves need to be COMPLETED
+        wflow.fw_states[self.fw2.fw_id] = 'FIZZLED'
+        wflow.fw_states[fw4.fw_id] = 'COMPLETED'
+        self.assertEqual(wflow.state, 'COMPLETED')
+
+    def test_refresh_deep_chain(self):
+        # deeper than the default recursion limit
+        n = sys.getrecursionlimit() + 1000
+        fws = [Firework(Task1(), fw_id=i) for i in range(1, n + 1)]
+        wflow = Workflow(fws, {i: [i + 1] for i in range(1, n)})
+        for fw in fws:
+            fw.launches = [Launch('COMPLETED', '.', host='localhost', ip='127.0.0.1',
+                                  action=FWAction(), fw_id=fw.fw_id)]
+        self.assertEqual(wflow.refresh(1), set(range(1, n + 1)))
+        self.assertEqual(wflow.state, 'COMPLETED')
+
+        self.assertEqual(wflow.rerun_fw(1), set(range(1, n + 1)))
+        self.assertEqual(wflow.fw_states[1], 'READY')
+        self.assertEqual(wflow.fw_states.counts, {'READY': 1, 'WAITING': n - 1})
+
     def test_remove_leaf_fws(self):
         fw4 = Firework(Task1(), parents=[self.fw2, self.fw3])
         fws = [self.fw1, self.fw2, self.fw3, fw4]
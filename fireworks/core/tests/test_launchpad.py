@@ -16,18 +16,27 @@ import glob
 import shutil
 import datetime
 from multiprocessing import Process
+from threading import Timer, Thread
+import threading
 import filecmp
 
 from pymongo import MongoClient
 from pymongo.errors import OperationFailure
 
-from fireworks import Firework, Workflow, LaunchPad, FWorker
+from fireworks import Firework, Workflow, LaunchPad, FWorker, FWAction, Tracker
+from fireworks.core.launchpad import WFLock, LockedWorkflowError, BackupStore, WFLockStats
+from fireworks.features.lock_report import LockReport
 from fireworks.core.rocket_launcher import rapidfire, launch_rocket
 from fireworks.queue.queue_launcher import setup_offline_job
 from fireworks.user_objects.firetasks.script_task import ScriptTask, PyTask
+from fireworks.user_objects.dupefinders.dupefinder_exact import DupeFinderExact
 from fireworks.core.tests.tasks import ExceptionTestTask, ExecutionCounterTask, SlowAdditionTask, WaitWFLockTask
 from fireworks.core.tests.tasks import DetoursTask
 import fireworks.fw_config
+import fireworks.core.launchpad
+import fireworks.core.rocket
+import fireworks.core.rocket_launcher
+import fireworks.utilities.fw_serializers as fw_serializers
 from monty.os import cd
 
 TESTDB_NAME = 'fireworks_unittest'
@@ -174,6 +183,830 @@ class LaunchPadTest(unittest.TestCase):
         num_wfs_in_db = len(self.lp.get_wf_ids({"name": "lorem wf"}))
         self.assertEqual(num_wfs_in_db, len(wfs))
 
+    def test_checkout_fws(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fws = [Firework(ftask, name='lorem') for _ in range(5)]
+        self.lp.add_wf(Workflow(fws, name='lorem wf'))
+        self.lp.add_wf(Firework(ftask, name='ipsum'))
+
+        reserved = self.lp.checkout_fws(self.fworker, MODULE_DIR, 4)
+        self.assertEqual(len(reserved), 4)
+        self.assertEqual(len(set(l_id for _, l_id in reserved)), 4)
+        for fw, launch_id in reserved:
+            self.assertEqual(fw.state, 'RESERVED')
+            self.assertEqual(fw.launches[0].launch_id, launch_id)
+            self.assertEqual(self.lp.get_fw_by_id(fw.fw_id).state, 'RESERVED')
+            self.assertEqual(self.lp.get_launch_by_id(launch_id).state, 'RESERVED')
+            wf = self.lp.get_wf_by_fw_id_lzyfw(fw.fw_id)
+            self.assertEqual(wf.fw_states[fw.fw_id], 'RESERVED')
+
+        # only the remaining two FWs are left to check out
+        self.assertEqual(len(self.lp.checkout_fws(self.fworker, MODULE_DIR, 4)), 2)
+        self.assertEqual(self.lp.checkout_fws(self.fworker, MODULE_DIR, 4), [])
+
+        # a reserved FW can be launched by its id
+        fw, launch_id = reserved[0]
+        launch_rocket(self.lp, self.fworker, fw_id=fw.fw_id)
+        self.assertEqual(self.lp.get_fw_by_id(fw.fw_id).state, 'COMPLETED')
+        self.assertEqual(self.lp.get_launch_by_id(launch_id).state, 'COMPLETED')
+
+    def test_checkout_fw_wf_state(self):
+        fw1 = Firework(ScriptTask.from_str('echo "hello"'), name="hello")
+        fw2 = Firework(ScriptTask.from_str('echo "goodbye"'), name="goodbye", parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+        fw_id, child_id = fw1.fw_id, fw2.fw_id
+        spec = self.lp.fireworks.find_one({'fw_id': fw_id})['spec']
+
+        fw, launch_id = self.lp.reserve_fw(self.fworker, MODULE_DIR)
+        self.assertEqual(fw.fw_id, fw_id)
+        wf = self.lp.workflows.find_one({'nodes': fw_id})
+        self.assertEqual(wf['state'], 'RESERVED')
+        self.assertEqual(wf['fw_states'], {str(fw_id): 'RESERVED', str(child_id): 'WAITING'})
+        self.assertEqual(wf['state_counts'], {'READY': 0, 'RESERVED': 1, 'WAITING': 1})
+        self.assertNotIn('locked', wf)
+
+        fw, launch_id2 = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw_id)
+        self.assertEqual(launch_id, launch_id2)
+        fw_dict = self.lp.fireworks.find_one({'fw_id': fw_id})
+        self.assertEqual(fw_dict['state'], 'RUNNING')
+        self.assertEqual(fw_dict['launches'], [launch_id])
+        self.assertEqual(fw_dict['spec'], spec)
+        wf = self.lp.workflows.find_one({'nodes': fw_id})
+        self.assertEqual(wf['state'], 'RUNNING')
+        self.assertEqual(wf['fw_states'], {str(fw_id): 'RUNNING', str(child_id): 'WAITING'})
+        self.assertEqual(wf['state_counts'],
+                         {'READY': 0, 'RESERVED': 0, 'RUNNING': 1, 'WAITING': 1})
+        self.assertEqual(self.lp.get_wf_by_fw_id(fw_id).state, 'RUNNING')
+
+    def test_rapidfire_batch_size(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask, name='lorem') for _ in range(5)]))
+        with cd(MODULE_DIR):
+            rapidfire(self.lp, self.fworker, nlaunches=3, batch_size=2)
+        states = [self.lp.get_fw_by_id(i).state for i in self.lp.get_fw_ids()]
+        self.assertEqual(states.count('COMPLETED'), 3)
+        # the unused reservation is given back
+        self.assertEqual(states.count('READY'), 2)
+
+    def test_rapidfire_batch_size_failed_launch(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask, name='lorem') for _ in range(5)]))
+        launch_rocket = fireworks.core.rocket_launcher.launch_rocket
+        launched = []
+
+        def failing_launch_rocket(*args, **kwargs):
+            launched.append(kwargs['fw_id'])
+            if len(launched) == 2:
+                raise RuntimeError('launch failed')
+            return launch_rocket(*args, **kwargs)
+
+        fireworks.core.rocket_launcher.launch_rocket = failing_launch_rocket
+        try:
+            with cd(MODULE_DIR):
+                self.assertRaises(RuntimeError, rapidfire, self.lp, self.fworker, nlaunches=3,
+                                  batch_size=3)
+        finally:
+            fireworks.core.rocket_launcher.launch_rocket = launch_rocket
+        states = [self.lp.get_fw_by_id(i).state for i in self.lp.get_fw_ids()]
+        # the reservations of the failed launch and of the FW after it are given back
+        self.assertEqual(states.count('COMPLETED'), 1)
+        self.assertEqual(states.count('READY'), 4)
+
+    def test_rapidfire_prefetch(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask, name='lorem') for _ in range(5)]))
+        with cd(MODULE_DIR):
+            rapidfire(self.lp, self.fworker, nlaunches=3, prefetch=2)
+        states = [self.lp.get_fw_by_id(i).state for i in self.lp.get_fw_ids()]
+        self.assertEqual(states.count('COMPLETED'), 3)
+        # the prefetched FWs left over are given back
+        self.assertEqual(states.count('READY'), 2)
+
+    def test_rapidfire_prefetch_failed_launch(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask, name='lorem') for _ in range(5)]))
+        launch_rocket = fireworks.core.rocket_launcher.launch_rocket
+
+        def failing_launch_rocket(*args, **kwargs):
+            raise KeyboardInterrupt
+
+        fireworks.core.rocket_launcher.launch_rocket = failing_launch_rocket
+        try:
+            with cd(MODULE_DIR):
+                self.assertRaises(KeyboardInterrupt, rapidfire, self.lp, self.fworker,
+                                  nlaunches=3, prefetch=2)
+        finally:
+            fireworks.core.rocket_launcher.launch_rocket = launch_rocket
+        states = [self.lp.get_fw_by_id(i).state for i in self.lp.get_fw_ids()]
+        self.assertEqual(states.count('READY'), 5)
+
+    def test_reservation_lease(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask, name='lorem') for _ in range(2)]))
+        leased = self.lp.checkout_fws(self.fworker, MODULE_DIR, 1, lease_secs=1)
+        self.lp.checkout_fws(self.fworker, MODULE_DIR, 1)
+        self.assertEqual(self.lp.detect_unreserved(), [])
+        time.sleep(1.5)
+        # only the reservation whose lease expired is given back
+        self.assertEqual(self.lp.detect_unreserved(rerun=True), [leased[0][1]])
+        self.assertEqual(self.lp.get_fw_by_id(leased[0][0].fw_id).state, 'READY')
+
+        # once reserved by another launch, it is not run under the old reservation
+        fw_id, old_launch_id = leased[0][0].fw_id, leased[0][1]
+        new_launch_id = self.lp.checkout_fws(self.fworker, MODULE_DIR, 1)[0][1]
+        self.assertEqual(self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id,
+                                             launch_id=old_launch_id), (None, None))
+        m_fw, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id,
+                                              launch_id=new_launch_id)
+        self.assertEqual((m_fw.fw_id, launch_id), (fw_id, new_launch_id))
+
+    def test_wait_for_ready(self):
+        # nothing new: wait until the timeout
+        self.assertFalse(self.lp.wait_for_ready(0.5))
+
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        wf = Workflow([Firework(ftask, name='lorem')])
+        t = Timer(0.5, self.lp.add_wf, args=(wf,))
+        t.start()
+        start = time.time()
+        self.assertTrue(self.lp.wait_for_ready(30))
+        self.assertLess(time.time() - start, 10)
+        t.join()
+
+        # FWs that became READY before the wait, but after the check for FWs to run
+        since = self.lp.get_ready_event_id()
+        self.lp.add_wf(Workflow([Firework(ftask, spec={'_category': 'cat'})]))
+        self.assertTrue(self.lp.wait_for_ready(0.5, since=since))
+        # only the FWs that the FWorker can run wake it up
+        self.assertFalse(self.lp.wait_for_ready(0.5, FWorker(category='dog'), since))
+        self.assertTrue(self.lp.wait_for_ready(0.5, FWorker(category='cat'), since))
+
+    def test_ready_queue(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask, spec={'_category': 'cat', '_priority': 2})
+        fw2 = Firework(ftask, parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+        entries = list(self.lp.ready_queue.find())
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['fw_id'], fw1.fw_id)
+        self.assertEqual(entries[0]['category'], 'cat')
+        self.assertEqual(entries[0]['priority'], 2)
+        self.assertIsNone(entries[0]['fworker'])
+
+        self.assertIsNone(LaunchPad._get_ready_queue_query({'spec.foo': 1}))
+        self.assertFalse(self.lp.run_exists(FWorker(category='dog')))
+        self.assertTrue(self.lp.run_exists(FWorker(category='cat')))
+
+        # the complete ready_queue is trusted, and entries lost e.g. in a crash are restored by
+        # tuneup
+        self.lp.ready_queue.delete_many({})
+        self.assertFalse(self.lp.run_exists(FWorker(category='cat')))
+        self.lp.tuneup()
+        self.assertTrue(self.lp.run_exists(FWorker(category='cat')))
+
+        # stale entries are dropped
+        self.lp.fireworks.update_one({'fw_id': fw1.fw_id}, {'$set': {'state': 'PAUSED'}})
+        self.assertFalse(self.lp.run_exists(FWorker(category='cat')))
+        self.assertEqual(self.lp.ready_queue.count(), 0)
+        self.lp.fireworks.update_one({'fw_id': fw1.fw_id}, {'$set': {'state': 'READY'}})
+        self.lp._sync_ready_queue([self.lp.get_fw_by_id(fw1.fw_id)])
+
+        launch_rocket(self.lp, FWorker(category='cat'))
+        self.assertEqual(self.lp.get_fw_by_id(fw1.fw_id).state, 'COMPLETED')
+        self.assertEqual([e['fw_id'] for e in self.lp.ready_queue.find()], [fw2.fw_id])
+
+        # a Firework checked out by id leaves the ready_queue, and checkout_fws looks past
+        # stale entries
+        fw3 = Firework(ftask)
+        self.lp.add_wf(fw3)
+        self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw2.fw_id)
+        self.assertEqual([e['fw_id'] for e in self.lp.ready_queue.find()], [fw3.fw_id])
+        self.lp.ready_queue.insert_one({'fw_id': fw2.fw_id, 'priority': 100})
+        reserved = self.lp.checkout_fws(self.fworker, MODULE_DIR, 1)
+        self.assertEqual([m_fw.fw_id for m_fw, _ in reserved], [fw3.fw_id])
+
+    def test_ready_queue_priority(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw_a = Firework(ftask, spec={'_priority': 1})
+        fw_b = Firework(ftask, spec={'_priority': 2})
+        fw_c = Firework(ftask, spec={'_dupefinder': DupeFinderExact()})
+        self.lp.add_wf(Workflow([fw_a, fw_b, fw_c]))
+        self.lp.set_priority(fw_a.fw_id, 10)
+        self.assertEqual(self.lp.ready_queue.find_one({'fw_id': fw_a.fw_id})['priority'], 10)
+
+        # checkout_fws uses the ready_queue, skipping the FWs with a _dupefinder
+        self.lp.fireworks.update_many({}, {'$set': {'spec._priority': 0}})
+        reserved = self.lp.checkout_fws(self.fworker, MODULE_DIR, 3)
+        self.assertEqual([fw.fw_id for fw, _ in reserved], [fw_a.fw_id, fw_b.fw_id])
+        self.assertEqual([e['fw_id'] for e in self.lp.ready_queue.find()], [fw_c.fw_id])
+        self.assertEqual(self.lp.checkout_fw(self.fworker, MODULE_DIR)[0].fw_id, fw_c.fw_id)
+
+        # the routing refresh stores a missing priority like the ready_queue entries
+        fw_d = Firework(ftask)
+        self.lp.add_wf(fw_d)
+        entry = self.lp.ready_queue.find_one({'fw_id': fw_d.fw_id}, {'_id': 0})
+        self.lp._refresh_routing({'fw_id': fw_d.fw_id})
+        self.assertEqual(self.lp.ready_queue.find_one({'fw_id': fw_d.fw_id}, {'_id': 0}), entry)
+
+    def test_ready_queue_transitions(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw = Firework(ftask)
+        self.lp.add_wf(fw)
+
+        def queued():
+            return [e['fw_id'] for e in self.lp.ready_queue.find()]
+
+        self.lp.pause_fw(fw.fw_id)
+        self.assertEqual(queued(), [])
+        self.lp.resume_fw(fw.fw_id)
+        self.assertEqual(queued(), [fw.fw_id])
+        self.lp.defuse_fw(fw.fw_id)
+        self.assertEqual(queued(), [])
+        self.lp.reignite_fw(fw.fw_id)
+        self.assertEqual(queued(), [fw.fw_id])
+        launch_id = self.lp.reserve_fw(self.fworker, MODULE_DIR)[1]
+        self.assertEqual(queued(), [])
+        self.lp.cancel_reservation(launch_id)
+        self.assertEqual(queued(), [fw.fw_id])
+        self.lp.checkout_fw(self.fworker, MODULE_DIR)
+        self.assertEqual(queued(), [])
+        self.lp.rerun_fw(fw.fw_id)
+        self.assertEqual(queued(), [fw.fw_id])
+
+    def test_ready_queue_backfill(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        old_fw = Firework(ftask, spec={'_priority': 2})
+        self.lp.add_wf(old_fw)
+        # a database written before the ready_queue existed
+        self.lp.ready_queue.delete_many({})
+        self.lp.fw_id_assigner.update_one({}, {'$unset': {'ready_queue_complete': 1}})
+        self.lp._ready_queue_complete = False
+        self.lp.add_wf(Firework(ftask, spec={'_priority': 1}))
+
+        # the READY FW missing from the ready_queue is not skipped
+        calls = []
+        get_fw_by_id = self.lp.get_fw_by_id
+        self.lp.get_fw_by_id = lambda fw_id: calls.append(fw_id) or get_fw_by_id(fw_id)
+        try:
+            self.assertTrue(self.lp.run_exists(self.fworker))
+        finally:
+            del self.lp.get_fw_by_id
+        # FWs without _dupefinder are not loaded to check that they can run
+        self.assertEqual(calls, [])
+        self.assertEqual(self.lp.checkout_fw(self.fworker, MODULE_DIR)[0].fw_id, old_fw.fw_id)
+        self.lp.rerun_fw(old_fw.fw_id)
+        self.lp.ready_queue.delete_many({'fw_id': old_fw.fw_id})
+
+        self.lp.tuneup()
+        self.assertTrue(self.lp._is_ready_queue_complete())
+        self.assertEqual(len(list(self.lp.ready_queue.find())), 2)
+        self.assertEqual(self.lp.checkout_fw(self.fworker, MODULE_DIR)[0].fw_id, old_fw.fw_id)
+
+    def test_future_run_exists(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask)
+        fw2 = Firework(ftask, parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+        self.lp.checkout_fw(self.fworker, MODULE_DIR)
+        self.assertFalse(self.lp.run_exists(self.fworker))
+        self.assertTrue(self.lp.future_run_exists(self.fworker))
+
+        self.lp.defuse_fw(fw2.fw_id)
+        # the answer is cached for a few seconds
+        self.assertTrue(self.lp.future_run_exists(self.fworker))
+        self.lp._future_run_cache.clear()
+        self.assertFalse(self.lp.future_run_exists(self.fworker))
+
+    def test_update_wf_delta(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask)
+        fw2 = Firework(ftask, parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+        # a field the workflow object does not know about survives updates
+        self.lp.workflows.update_one({'nodes': fw1.fw_id}, {'$set': {'foo': 'bar'}})
+
+        # only the changed fw_states are written, without reading the workflow document again
+        find_ones, updates = [], []
+        find_one, update_one = self.lp.workflows.find_one, self.lp.workflows.update_one
+        self.lp.workflows.find_one = lambda *args, **kwargs: \
+            find_ones.append(args) or find_one(*args, **kwargs)
+        self.lp.workflows.update_one = lambda *args, **kwargs: \
+            updates.append(args[1]) or update_one(*args, **kwargs)
+        try:
+            self.lp.defuse_fw(fw2.fw_id)
+        finally:
+            del self.lp.workflows.find_one, self.lp.workflows.update_one
+        # (the other calls are made by the WFLock)
+        self.assertEqual([args for args in find_ones if 'locked' not in str(args)],
+                         [({'nodes': fw2.fw_id},)])
+        self.assertEqual([k for k in updates[-1]['$set'] if k.startswith('fw_states')],
+                         ['fw_states.{}'.format(fw2.fw_id)])
+        wf = self.lp.workflows.find_one({'nodes': fw1.fw_id})
+        self.assertEqual(wf['foo'], 'bar')
+        self.assertEqual(wf['fw_states'][str(fw2.fw_id)], 'DEFUSED')
+        self.assertEqual(wf['state'], 'DEFUSED')
+
+        # the links are rewritten when FWs are added
+        self.lp.append_wf(Workflow([Firework(ftask, fw_id=-1)]), [fw2.fw_id])
+        wf = self.lp.workflows.find_one({'nodes': fw1.fw_id})
+        self.assertEqual(wf['foo'], 'bar')
+        self.assertEqual(len(wf['nodes']), 3)
+        self.assertEqual(len(wf['fw_states']), 3)
+        new_id = [n for n in wf['nodes'] if n not in (fw1.fw_id, fw2.fw_id)][0]
+        self.assertEqual(wf['links'][str(fw2.fw_id)], [new_id])
+        self.assertEqual(wf['parent_links'][str(new_id)], [fw2.fw_id])
+
+    def test_external_links(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask)
+        fw2 = Firework(ftask, parents=[fw1])
+        fw3 = Firework(ftask, parents=[fw1])
+        fw4 = Firework(ftask, parents=[fw2, fw3])
+        min_fws = fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS
+        fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS = 4
+        try:
+            self.lp.add_wf(Workflow([fw1, fw2, fw3, fw4]))
+        finally:
+            fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS = min_fws
+        node = self.lp.workflow_nodes.find_one({'fw_id': fw1.fw_id})
+        self.assertEqual(sorted(node['children']), sorted([fw2.fw_id, fw3.fw_id]))
+        self.assertEqual(node['state'], 'READY')
+        wf_query = {'_id': node['wf_id']}
+        wf = self.lp.workflows.find_one(wf_query)
+        self.assertTrue(wf['external_links'])
+        self.assertNotIn('links', wf)
+        self.assertNotIn('fw_states', wf)
+        # only the first FW is kept in the nodes
+        self.assertEqual(len(wf['nodes']), 1)
+        self.assertEqual(self.lp.get_wf_ids({'nodes': wf['nodes'][0]}), wf['nodes'])
+        wf = self.lp.get_wf_by_fw_id_lzyfw(fw4.fw_id)
+        self.assertEqual(sorted(wf.links.parent_links[fw4.fw_id]), sorted([fw2.fw_id, fw3.fw_id]))
+        self.assertEqual(wf.fw_states[fw4.fw_id], 'WAITING')
+
+        launch_rocket(self.lp, self.fworker)
+        self.assertEqual(self.lp.workflow_nodes.find_one({'fw_id': fw2.fw_id})['state'], 'READY')
+        launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR)[1] for _ in range(2)]
+        self.assertEqual(self.lp.workflow_nodes.find_one({'fw_id': fw2.fw_id})['state'],
+                         'RUNNING')
+        wf = self.lp.workflows.find_one(wf_query)
+        self.assertEqual(wf['state'], 'RUNNING')
+        self.assertEqual(wf['state_counts'],
+                         {'COMPLETED': 1, 'READY': 0, 'RUNNING': 2, 'WAITING': 1})
+        self.assertNotIn('locked', wf)
+        self.assertTrue(self.lp.future_run_exists(self.fworker))
+
+        # the refreshes only load the FWs around the completed ones
+        def get_external_links(wf_id):
+            raise AssertionError("the whole workflow was loaded")
+        self.lp._get_external_links = get_external_links
+        try:
+            for launch_id in launch_ids:
+                self.lp.complete_launch(launch_id, FWAction())
+            launch_rocket(self.lp, self.fworker)
+        finally:
+            del self.lp._get_external_links
+        wf = self.lp.workflows.find_one(wf_query)
+        self.assertEqual(wf['state'], 'COMPLETED')
+        self.assertEqual(wf['state_counts'], {'COMPLETED': 4})
+        self.assertEqual(self.lp.workflow_nodes.find({'state': 'COMPLETED'}).count(), 4)
+
+        # the FWs added are stored in workflow_nodes too
+        self.lp.append_wf(Workflow([Firework(ftask, fw_id=-1)]), [fw4.fw_id])
+        wf = self.lp.workflows.find_one(wf_query)
+        self.assertEqual(wf['state'], 'RUNNING')
+        new_id = self.lp.workflow_nodes.find_one({'fw_id': fw4.fw_id})['children'][0]
+        self.assertEqual(self.lp.workflow_nodes.find_one({'fw_id': new_id})['state'], 'READY')
+        self.assertEqual(self.lp.get_wf_by_fw_id(new_id).fw_states[fw1.fw_id], 'COMPLETED')
+        summary = self.lp.get_wf_summary_dict(fw1.fw_id, mode='all')
+        self.assertEqual(len(summary['links']), 5)
+        self.assertEqual(len(summary['parent_links']), 4)
+
+        self.lp.delete_wf(new_id)
+        self.assertEqual(self.lp.workflow_nodes.count(), 0)
+        self.assertEqual(self.lp.workflows.count(), 0)
+
+    def test_external_links_defuse_workflow(self):
+        # an action that changes FWs that are not around the completed FW loads the whole workflow
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask)
+        fw2 = Firework(ftask, parents=[fw1])
+        fw3 = Firework(ftask, parents=[fw1])
+        fw4 = Firework(ftask, parents=[fw2])
+        fw5 = Firework(ftask, parents=[fw3])
+        min_fws = fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS
+        fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS = 4
+        try:
+            self.lp.add_wf(Workflow([fw1, fw2, fw3, fw4, fw5]))
+        finally:
+            fireworks.core.launchpad.WF_EXTERNAL_LINKS_MIN_FWS = min_fws
+        launch_rocket(self.lp, self.fworker)
+        _, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw2.fw_id)
+        self.lp.complete_launch(launch_id, FWAction(defuse_workflow=True))
+        for fw in (fw3, fw4, fw5):
+            self.assertEqual(self.lp.workflow_nodes.find_one({'fw_id': fw.fw_id})['state'],
+                             'DEFUSED')
+        wf = self.lp.workflows.find_one({'nodes': fw1.fw_id})
+        self.assertEqual(wf['state'], 'DEFUSED')
+        self.assertEqual(wf['state_counts'], {'COMPLETED': 2, 'DEFUSED': 3})
+
+    def test_complete_launches_refresh_error(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fws = [Firework(ftask) for _ in range(2)]
+        children = [Firework(ftask, parents=[fw]) for fw in fws]
+        for fw, child in zip(fws, children):
+            self.lp.add_wf(Workflow([fw, child]))
+        launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw.fw_id)[1]
+                      for fw in fws]
+
+        refresh = Workflow.refresh
+
+        def failing_refresh(wf, fw_id, *args, **kwargs):
+            if fw_id == fws[0].fw_id:
+                raise ValueError('refresh failed')
+            return refresh(wf, fw_id, *args, **kwargs)
+
+        Workflow.refresh = failing_refresh
+        # the first launch is queued by another thread, and written in a batch by complete_launch
+        other = {'launch': (launch_ids[0], FWAction(), 'COMPLETED')}
+        self.lp._completions.append(other)
+        batches = []
+        complete_launches = self.lp.complete_launches
+        self.lp.complete_launches = lambda launches, completed=None: \
+            batches.append([l[0] for l in launches]) or complete_launches(launches, completed)
+        try:
+            launch = self.lp.complete_launch(launch_ids[1], FWAction())
+        finally:
+            Workflow.refresh = refresh
+            del self.lp.complete_launches
+        # the failure of the first workflow does not prevent refreshing the second one
+        self.assertEqual(self.lp.get_fw_by_id(fws[0].fw_id).state, 'FIZZLED')
+        self.assertEqual(self.lp.get_fw_by_id(children[1].fw_id).state, 'READY')
+        # the second launch is done: it is not completed again alone, unlike the first one
+        self.assertEqual(batches, [launch_ids])
+        self.assertEqual(launch['state'], 'COMPLETED')
+        self.assertIsNone(other['result'])
+        self.assertIn(launch_ids[0], self.lp.backup_launch_data)
+        self.assertNotIn(launch_ids[1], self.lp.backup_launch_data)
+
+    def test_complete_launches(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask)
+        fw2 = Firework(ftask)
+        fw3 = Firework(ftask, parents=[fw1, fw2])
+        self.lp.add_wf(Workflow([fw1, fw2, fw3]))
+        launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR)[1] for _ in range(2)]
+
+        loaded = []
+        get_wf = self.lp._get_wf_by_fw_id_lzyfw
+        self.lp._get_wf_by_fw_id_lzyfw = lambda fw_id, fw_ids=None: (loaded.append(fw_id) or
+                                                                     get_wf(fw_id, fw_ids))
+        try:
+            launches = self.lp.complete_launches([(l, FWAction(), 'COMPLETED')
+                                                  for l in launch_ids])
+        finally:
+            del self.lp._get_wf_by_fw_id_lzyfw
+        self.assertEqual([l['launch_id'] for l in launches], launch_ids)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(self.lp.get_launch_by_id(launch_ids[0]).state, 'COMPLETED')
+        self.assertEqual(self.lp.get_fw_by_id(fw3.fw_id).state, 'READY')
+        self.assertRaises(ValueError, self.lp.complete_launches, [(1000, None, 'COMPLETED')])
+
+        # launches completed by concurrent threads
+        launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR)[1]
+        fw = Firework(ftask)
+        self.lp.add_wf(fw)
+        launch_ids = [launch_id, self.lp.checkout_fw(self.fworker, MODULE_DIR)[1]]
+        threads = [Thread(target=self.lp.complete_launch, args=(l, FWAction(), 'COMPLETED'))
+                   for l in launch_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.lp.get_fw_by_id(fw3.fw_id).state, 'COMPLETED')
+        self.assertEqual(self.lp.get_fw_by_id(fw.fw_id).state, 'COMPLETED')
+
+    def test_wflock_lease(self):
+        fw = Firework(ScriptTask.from_str('echo "lorem ipsum"'))
+        self.lp.add_wf(fw)
+        with WFLock(self.lp, fw.fw_id) as lock:
+            lease = self.lp.workflows.find_one({'nodes': fw.fw_id})['locked']
+            self.assertEqual(lease['owner'], lock.owner)
+            self.assertEqual(lease['pid'], os.getpid())
+            self.assertGreater(lease['expires'], datetime.datetime.utcnow())
+            start = time.time()
+            with self.assertRaises(LockedWorkflowError):
+                with WFLock(self.lp, fw.fw_id, expire_secs=0.5, kill=False):
+                    pass
+            self.assertLess(time.time() - start, 5)
+        self.assertNotIn('locked', self.lp.workflows.find_one({'nodes': fw.fw_id}))
+
+        # the lease of a dead holder is taken over
+        self.lp.workflows.update_one({'nodes': fw.fw_id}, {'$set': {'locked': {
+            'owner': 'dead', 'host': 'nowhere', 'pid': 1,
+            'expires': datetime.datetime.utcnow() - datetime.timedelta(seconds=1)}}})
+        with WFLock(self.lp, fw.fw_id, expire_secs=0, kill=False) as lock:
+            # the lock is only released by its owner
+            self.lp.workflows.update_one({'nodes': fw.fw_id}, {'$set': {'locked.owner': 'other'}})
+        self.assertEqual(self.lp.workflows.find_one({'nodes': fw.fw_id})['locked']['owner'],
+                         'other')
+        with WFLock(self.lp, fw.fw_id, expire_secs=0, kill=True) as lock:
+            self.assertEqual(self.lp.workflows.find_one({'nodes': fw.fw_id})['locked']['owner'],
+                             lock.owner)
+
+        # the leases are renewed while the locks are held, by a single thread
+        fw2 = Firework(ScriptTask.from_str('echo "lorem ipsum"'))
+        self.lp.add_wf(fw2)
+        lease_secs = fireworks.core.launchpad.WFLOCK_LEASE_SECS
+        fireworks.core.launchpad.WFLOCK_LEASE_SECS = 0.3
+        time.sleep(0.1)
+        self.assertFalse(self.lp._renewing)
+        n_threads = threading.active_count()
+        try:
+            with WFLock(self.lp, fw.fw_id), WFLock(self.lp, fw2.fw_id):
+                time.sleep(0.6)
+                self.assertEqual(threading.active_count(), n_threads + 1)
+                for fw_id in (fw.fw_id, fw2.fw_id):
+                    with self.assertRaises(LockedWorkflowError):
+                        with WFLock(self.lp, fw_id, expire_secs=0, kill=False):
+                            pass
+        finally:
+            fireworks.core.launchpad.WFLOCK_LEASE_SECS = lease_secs
+        time.sleep(0.2)
+        self.assertFalse(self.lp._renewing)
+
+        # a holder whose lock was taken over can't write the workflow
+        def take_over(wf):
+            self.lp.workflows.update_one({'nodes': fw.fw_id}, {'$set': {'locked.owner': 'other'}})
+            return wf.refresh(fw.fw_id)
+        self.assertRaises(LockedWorkflowError, self.lp._modify_wf, fw.fw_id, take_over)
+        self.lp.workflows.update_one({'nodes': fw.fw_id}, {'$unset': {'locked': True}})
+
+    def test_wflock_stats(self):
+        fw = Firework(ScriptTask.from_str('echo "lorem ipsum"'))
+        self.lp.add_wf(fw)
+        wf_id = self.lp.workflows.find_one({'nodes': fw.fw_id})['_id']
+        WFLock.stats.reset()
+        stats_max_bytes = fireworks.core.launchpad.WFLOCK_STATS_MAX_BYTES
+        fireworks.core.launchpad.WFLOCK_STATS_MAX_BYTES = 100000
+        try:
+            with WFLock(self.lp, fw.fw_id):
+                time.sleep(0.1)
+                with self.assertRaises(LockedWorkflowError):
+                    with WFLock(self.lp, fw.fw_id, expire_secs=0.2, kill=False):
+                        pass
+                with WFLock(self.lp, fw.fw_id, expire_secs=0.2, kill=True) as lock:
+                    self.assertTrue(lock.killed)
+        finally:
+            fireworks.core.launchpad.WFLOCK_STATS_MAX_BYTES = stats_max_bytes
+
+        stats = WFLock.stats.get_stats()[wf_id]
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['kills'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['retries'], 0)
+        self.assertGreaterEqual(stats['max_hold_secs'], 0.1)
+        self.assertGreaterEqual(stats['max_wait_secs'], 0.1)
+        self.assertEqual(self.lp.db.lock_stats.count(), 3)
+
+        lr = LockReport(self.lp)
+        hot_wfs = lr.get_hot_workflows()
+        self.assertEqual(len(hot_wfs), 1)
+        self.assertEqual(hot_wfs[0]['wf_id'], str(wf_id))
+        self.assertEqual(hot_wfs[0]['count'], 3)
+        self.assertEqual(hot_wfs[0]['kills'], 1)
+        percentiles = lr.get_wait_percentiles(interval='days', num_intervals=1)
+        self.assertEqual(len(percentiles), 1)
+        self.assertEqual(percentiles[0]['count'], 3)
+        self.assertEqual(percentiles[0]['p50'], sorted(
+            s['wait_secs'] for s in self.lp.db.lock_stats.find())[1])
+
+        # only the workflows locked most recently are kept
+        lock_stats = WFLockStats(max_wfs=2)
+        sample = {'fw_id': 1, 'wait_secs': 0, 'hold_secs': 0, 'retries': 0, 'killed': False,
+                  'took_over': False, 'timed_out': False}
+        for wf_id in ('a', 'b', 'a', 'c'):
+            lock_stats.record(dict(sample, wf_id=wf_id))
+        self.assertEqual(sorted(lock_stats.get_stats()), ['a', 'c'])
+        self.assertEqual(lock_stats.get_stats()['a']['count'], 2)
+
+    def test_optimistic_updates(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw1 = Firework(ftask, fw_id=1)
+        fw2 = Firework(ftask, fw_id=2, parents=[fw1])
+        self.lp.add_wf(Workflow([fw1, fw2]))
+
+        def get_version():
+            return self.lp.workflows.find_one({'nodes': fw1.fw_id}).get('version', 0)
+
+        loads = []
+
+        def load_and_change(fw_id, fw_ids=None):
+            # another process updates the workflow right after each of the first conflicts loads
+            loads.append(fw_id)
+            wf_and_dict = LaunchPad._get_wf_by_fw_id_lzyfw(self.lp, fw_id, fw_ids)
+            if len(loads) <= conflicts:
+                self.lp.workflows.update_one({'nodes': fw_id}, {'$inc': {'version': 1}})
+            return wf_and_dict
+
+        self.lp._get_wf_by_fw_id_lzyfw = load_and_change
+        fireworks.core.launchpad.WF_OPTIMISTIC_UPDATES = True
+        try:
+            # nothing to write but the workflow document: a single compare-and-swap
+            conflicts = 0
+            version = get_version()
+            self.lp._refresh_wf(fw1.fw_id)
+            self.assertEqual(get_version(), version + 1)
+            self.assertEqual(len(loads), 1)
+
+            # fireworks written: the workflow is locked while they are
+            version = get_version()
+            self.assertEqual(self.lp.rerun_fw(fw1.fw_id), [fw1.fw_id])
+            self.assertEqual(get_version(), version + 2)
+            self.assertNotIn('locked', self.lp.workflows.find_one({'nodes': fw1.fw_id}))
+
+            # the change is redone on the new workflow after a conflict
+            del loads[:]
+            conflicts = 1
+            self.lp.defuse_fw(fw2.fw_id)
+            self.assertEqual(len(loads), 2)
+            self.assertEqual(self.lp.workflows.find_one({'nodes': fw1.fw_id})['fw_states'],
+                             {'1': 'READY', '2': 'DEFUSED'})
+
+            # a workflow that keeps changing is updated under a WFLock
+            del loads[:]
+            conflicts = 100
+            self.lp.pause_fw(fw1.fw_id)
+            self.assertEqual(len(loads), 6)
+            self.assertEqual(self.lp.get_fw_by_id(fw1.fw_id).state, 'PAUSED')
+            self.assertEqual(self.lp.workflows.find_one({'nodes': fw1.fw_id})['fw_states'],
+                             {'1': 'PAUSED', '2': 'DEFUSED'})
+        finally:
+            fireworks.core.launchpad.WF_OPTIMISTIC_UPDATES = False
+            del self.lp._get_wf_by_fw_id_lzyfw
+
+    def test_bson_dates(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        self.lp.add_wf(Workflow([Firework(ftask), Firework(ftask)]))
+        str_launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR)[1]
+        self.assertNotIsInstance(self.lp.launches.find_one()['time_start'], datetime.datetime)
+        # migrating without BSON_DATES would leave new documents with string dates
+        self.assertRaises(ValueError, self.lp.migrate_dates)
+
+        fw_serializers.BSON_DATES = True
+        try:
+            fw = Firework(ftask)
+            self.lp.add_wf(fw)
+            self.assertIsInstance(self.lp.fireworks.find_one({'fw_id': fw.fw_id})['created_on'],
+                                  datetime.datetime)
+            fw, launch_id = self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw.fw_id)
+            launch = self.lp.launches.find_one({'launch_id': launch_id})
+            self.assertIsInstance(launch['time_start'], datetime.datetime)
+            self.assertIsInstance(launch['state_history'][-1]['updated_on'], datetime.datetime)
+
+            # string and BSON dates are both found while the dates are migrated
+            lost_launch_ids = self.lp.detect_lostruns(expiration_secs=-1)[0]
+            self.assertEqual(sorted(lost_launch_ids), [str_launch_id, launch_id])
+
+            self.assertEqual(self.lp.migrate_dates(batch_size=1)['launches'], 1)
+            for coll, field in (('fireworks', 'created_on'), ('fireworks', 'updated_on'),
+                                ('launches', 'time_start'),
+                                ('launches', 'state_history.updated_on')):
+                self.assertFalse(self.lp.db[coll].find_one({field: {'$type': 'string'}}))
+            self.assertEqual(self.lp.migrate_dates(), {'fireworks': 0, 'launches': 0,
+                                                       'ready_queue': 0})
+            self.assertIsInstance(self.lp.get_launch_by_id(str_launch_id).time_start,
+                                  datetime.datetime)
+            self.assertEqual(sorted(self.lp.detect_lostruns(expiration_secs=-1)[0]),
+                             [str_launch_id, launch_id])
+        finally:
+            fw_serializers.BSON_DATES = False
+
+    def test_ping_launches(self):
+        tracked_file = os.path.join(MODULE_DIR, 'tracked.txt')
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fws = [Firework(ftask, spec={'_trackers': [Tracker(tracked_file)]}), Firework(ftask)]
+        self.lp.add_wf(Workflow(fws))
+        launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw.fw_id)[1]
+                      for fw in fws]
+        sets = []
+        update_one = self.lp.launches.update_one
+        self.lp.launches.update_one = lambda query, update: \
+            sets.append(sorted(update['$set'])) or update_one(query, update)
+        try:
+            with open(tracked_file, 'w') as f:
+                f.write('1\n2\n')
+            self.lp.ping_launch(launch_ids[0])
+            self.lp.ping_launch(launch_ids[0])
+            content = Tracker(tracked_file).track_file()
+        finally:
+            del self.lp.launches.update_one
+            os.remove(tracked_file)
+        # the tracker is only uploaded when its content changes
+        self.assertEqual(sets, [['state_history.$.updated_on', 'trackers.0.content'],
+                                ['state_history.$.updated_on']])
+        self.assertEqual(self.lp.get_launch_by_id(launch_ids[0]).trackers[0].content, content)
+
+        ptime = datetime.datetime(2100, 1, 1)
+        self.lp.ping_launches(launch_ids, ptime)
+        for launch_id in launch_ids:
+            m_launch = self.lp.get_launch_by_id(launch_id)
+            self.assertEqual(m_launch.state_history[-1]['state'], 'RUNNING')
+            self.assertEqual(m_launch.last_pinged, ptime)
+        self.assertEqual(sorted(self.lp._pinged_trackers), sorted(launch_ids))
+
+        # the trackers of the Launches that are lost or not running anymore are forgotten
+        self.lp.launches.update_one({'launch_id': launch_ids[1]}, {'$set': {'state': 'FIZZLED'}})
+        self.lp.ping_launches(launch_ids)
+        self.assertEqual(list(self.lp._pinged_trackers), [launch_ids[0]])
+        self.lp.detect_lostruns(expiration_secs=-1)
+        self.assertEqual(self.lp._pinged_trackers, {})
+
+    def test_backup_data(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fws = [Firework(ftask, spec={'data': 'x' * 1000}), Firework(ftask)]
+        self.lp.add_wf(Workflow(fws))
+        self.lp.backup_fw_data.spill_bytes = 500
+        try:
+            launch_ids = [self.lp.checkout_fw(self.fworker, MODULE_DIR, fw_id=fw.fw_id)[1]
+                          for fw in fws]
+            self.assertEqual(self.lp.backup_fw_data[fws[0].fw_id]['spec']['data'], 'x' * 1000)
+            self.lp.fireworks.update_one({'fw_id': fws[0].fw_id}, {'$set': {'spec.data': 'y'}})
+
+            # backups are discarded when restored or when the launch completes
+            self.lp.restore_backup_data(launch_ids[0], fws[0].fw_id)
+            self.assertEqual(self.lp.get_fw_by_id(fws[0].fw_id).spec['data'], 'x' * 1000)
+            self.lp.complete_launch(launch_ids[1], FWAction())
+            for launch_id, fw in zip(launch_ids, fws):
+                self.assertNotIn(launch_id, self.lp.backup_launch_data)
+                self.assertNotIn(fw.fw_id, self.lp.backup_fw_data)
+        finally:
+            self.lp.backup_fw_data.spill_bytes = fireworks.fw_config.BACKUP_SPILL_BYTES
+
+    def test_backup_data_cancel_reservation(self):
+        fw = Firework(ScriptTask.from_str('echo "lorem ipsum"'))
+        self.lp.add_wf(fw)
+        launch_id = self.lp.checkout_fws(self.fworker, MODULE_DIR, 1)[0][1]
+        self.assertIn(launch_id, self.lp.backup_launch_data)
+        self.lp.cancel_reservation(launch_id)
+        self.assertNotIn(launch_id, self.lp.backup_launch_data)
+        self.assertNotIn(fw.fw_id, self.lp.backup_fw_data)
+
+    def test_backup_store(self):
+        store = BackupStore(max_entries=2, spill_bytes=100)
+        store[1] = {'a': 1}
+        store[2] = {'b': 'x' * 200}
+        path = store._entries[2][1]
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(store[2], {'b': 'x' * 200})
+        store[3] = {'c': 3}
+        store[4] = {'d': 4}
+        # the oldest entry kept in memory is moved to a file, not dropped
+        self.assertEqual(len(store), 4)
+        self.assertIsNotNone(store._entries[1][1])
+        self.assertEqual(store[1], {'a': 1})
+        self.assertEqual(store.pop(2), {'b': 'x' * 200})
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(store.pop(2))
+
+        # discarded without being read, and the files left are removed at exit
+        path = store._entries[1][1]
+        store.discard(1)
+        self.assertNotIn(1, store)
+        self.assertFalse(os.path.exists(path))
+        store[5] = {'e': 'x' * 200}
+        path = store._entries[5][1]
+        BackupStore._remove_all_spilled()
+        self.assertFalse(os.path.exists(path))
+
+    def test_routing(self):
+        ftask = ScriptTask.from_str('echo "lorem ipsum"')
+        fw = Firework(ftask, spec={'_category': 'cat'})
+        self.lp.add_wf(fw)
+        self.assertEqual(self.lp.fireworks.find_one({'fw_id': fw.fw_id})['routing'],
+                         {'fworker': None, 'category': 'cat'})
+        self.assertTrue(self.lp.run_exists(FWorker(category=['dog', 'cat'])))
+        self.assertFalse(self.lp.run_exists(FWorker(category='__none__')))
+
+        self.lp.update_spec([fw.fw_id], {'_category': 'dog', '_fworker': 'rex'})
+        self.assertFalse(self.lp.run_exists(FWorker(name='felix', category='dog')))
+        self.assertTrue(self.lp.run_exists(FWorker(name='rex', category='dog')))
+
+        # FWs created before routing keys existed get them on the first FWorker query
+        self.lp.fireworks.update_many({}, {'$unset': {'routing': 1}})
+        self.lp.fw_id_assigner.update_one({}, {'$unset': {'routing_complete': 1}})
+        lp = LaunchPad(name=TESTDB_NAME, strm_lvl='ERROR')
+        self.assertFalse(lp.run_exists(FWorker(name='felix', category='dog')))
+        self.assertEqual(lp.fireworks.find_one({'fw_id': fw.fw_id})['routing'],
+                         {'fworker': 'rex', 'category': 'dog'})
+        self.assertTrue(lp.fw_id_assigner.find_one()['routing_complete'])
+
+        # or in tuneup
+        self.lp.fireworks.update_many({}, {'$unset': {'routing': 1}})
+        self.lp.fw_id_assigner.update_one({}, {'$unset': {'routing_complete': 1}})
+        LaunchPad(name=TESTDB_NAME, strm_lvl='ERROR').tuneup()
+        self.assertEqual(self.lp.fireworks.find_one({'fw_id': fw.fw_id})['routing'],
+                         {'fworker': 'rex', 'category': 'dog'})
+
 
 class LaunchPadDefuseReigniteRerunArchiveDeleteTest(unittest.TestCase):
 
@@ -1007,6 +1840,53 @@ class LaunchPadRerunExceptionTest(unittest.TestCase):
         fw = self.lp.get_fw_by_id(1)
         self.assertFalse("_recovery" in fw.spec)
 
+    def test_task_level_rerun_coalesced_checkpoints(self):
+        checkpoints = []
+        checkpoint_launch = self.lp.checkpoint_launch
+        self.lp.checkpoint_launch = lambda launch_id, checkpoint: \
+            checkpoints.append(checkpoint['_task_n']) or checkpoint_launch(launch_id, checkpoint)
+        checkpoint_interval = fireworks.core.rocket.CHECKPOINT_INTERVAL_SECS
+        fireworks.core.rocket.CHECKPOINT_INTERVAL_SECS = 3600
+        try:
+            rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
+            # the checkpoint of the first Firetask, then the last one when the Firework fizzles
+            self.assertEqual(checkpoints, [0, 2])
+            self.lp.rerun_fw(1, recover_launch='last')
+            self.lp.update_spec([1], {'skip_exception': True})
+            rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
+            self.assertEqual(self.lp.get_fw_by_id(1).state, 'COMPLETED')
+            self.assertEqual(ExecutionCounterTask.exec_counter, 1)
+            self.assertEqual(ExceptionTestTask.exec_counter, 2)
+
+            # a Firework that completes does not need its latest checkpoint
+            del checkpoints[:]
+            self.lp.rerun_fw(1)
+            rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
+            self.assertEqual(self.lp.get_fw_by_id(1).state, 'COMPLETED')
+            self.assertEqual(checkpoints, [0])
+        finally:
+            fireworks.core.rocket.CHECKPOINT_INTERVAL_SECS = checkpoint_interval
+            del self.lp.checkpoint_launch
+
+    def test_task_level_rerun_task_parallelism(self):
+        checkpoints = []
+        checkpoint_launch = self.lp.checkpoint_launch
+        self.lp.checkpoint_launch = lambda launch_id, checkpoint: \
+            checkpoints.append(checkpoint['_task_n']) or checkpoint_launch(launch_id, checkpoint)
+        self.lp.update_spec([1], {'_task_parallelism': 2})
+        try:
+            rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
+        finally:
+            del self.lp.checkpoint_launch
+        # one checkpoint per group of Firetasks
+        self.assertEqual(checkpoints, [0, 2])
+        self.lp.rerun_fw(1, recover_launch='last')
+        self.lp.update_spec([1], {'skip_exception': True})
+        rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
+        self.assertEqual(self.lp.get_fw_by_id(1).state, 'COMPLETED')
+        self.assertEqual(ExecutionCounterTask.exec_counter, 1)
+        self.assertEqual(ExceptionTestTask.exec_counter, 2)
+
     def test_task_level_rerun_cp(self):
         rapidfire(self.lp, self.fworker, m_dir=MODULE_DIR)
         self.assertEqual(os.getcwd(), MODULE_DIR)
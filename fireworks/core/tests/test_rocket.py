@@ -2,10 +2,12 @@ from __future__ import unicode_literals, division
 
 import unittest
 import os
+import time
 
 from fireworks import Firework, LaunchPad, FWorker
 from fireworks.core.rocket_launcher import launch_rocket
-from fireworks.core.tests.tasks import ExceptionTestTask, MalformedAdditionTask
+from fireworks.core.tests.tasks import ExceptionTestTask, MalformedAdditionTask, SleepStoreTask, \
+    FWActionFileTask
 
 
 TESTDB_NAME = 'fireworks_unittest'
@@ -35,8 +37,9 @@ class RocketTest(unittest.TestCase):
     def tearDown(self):
         self.lp.reset(password=None, require_password=False)
         # Delete launch locations
-        if os.path.exists(os.path.join('FW.json')):
-            os.remove('FW.json')
+        for f in ['FW.json', 'FWAction.json']:
+            if os.path.exists(f):
+                os.remove(f)
 
     def test_serializable_exception(self):
         error_test_dict = {'error': 'description', 'error_code': 1}
@@ -57,6 +60,68 @@ class RocketTest(unittest.TestCase):
 
         self.assertEqual(fw.state, 'FIZZLED')
 
+    def test_task_parallelism(self):
+        tasks = [SleepStoreTask(name=name, seconds=seconds)
+                 for name, seconds in [('a', 1), ('b', 0), ('c', 1), ('d', 0)]]
+        self.lp.add_wf(Firework(tasks, spec={'_task_parallelism': 3}))
+        start = time.time()
+        launch_rocket(self.lp, self.fworker)
+        self.assertLess(time.time() - start, 2)
+
+        fw = self.lp.get_fw_by_id(1)
+        self.assertEqual(fw.state, 'COMPLETED')
+        action = fw.launches[0].action
+        # the tasks of a group see the spec of the previous group, and their actions are
+        # applied in the order of the tasks
+        self.assertEqual(action.stored_data, {'a': None, 'b': None, 'c': None, 'd': 'c'})
+        self.assertEqual(action.update_spec, {'last': 'd'})
+        self.assertEqual([mod['_push']['names'] for mod in action.mod_spec], ['a', 'b', 'c', 'd'])
+
+    def test_task_parallelism_groups(self):
+        tasks = [SleepStoreTask(name=name, seconds=seconds)
+                 for name, seconds in [('a', 0), ('b', 1), ('c', 1)]]
+        self.lp.add_wf(Firework(tasks, spec={'_task_parallelism': [1, 2]}))
+        start = time.time()
+        launch_rocket(self.lp, self.fworker)
+        self.assertLess(time.time() - start, 2)
+
+        action = self.lp.get_fw_by_id(1).launches[0].action
+        self.assertEqual(action.stored_data, {'a': None, 'b': 'a', 'c': 'a'})
+
+    def test_task_parallelism_fwaction_file(self):
+        tasks = [SleepStoreTask(name='a'), FWActionFileTask(update_spec={'file': True}),
+                 SleepStoreTask(name='b')]
+        self.lp.add_wf(Firework(tasks, spec={'_task_parallelism': 3}))
+        launch_rocket(self.lp, self.fworker)
+
+        # the FWAction file is the action of the task that returned none only
+        action = self.lp.get_fw_by_id(1).launches[0].action
+        self.assertEqual(action.stored_data, {'a': None, 'b': None})
+        self.assertEqual(action.update_spec, {'last': 'b', 'file': True})
+
+    def test_task_parallelism_failure(self):
+        tasks = [SleepStoreTask(name='a'), SleepStoreTask(name='b'),
+                 ExceptionTestTask(exc_details={'error': 'description'}), SleepStoreTask(name='c')]
+        self.lp.add_wf(Firework(tasks, spec={'_task_parallelism': 4}))
+        launch_rocket(self.lp, self.fworker)
+
+        fw = self.lp.get_fw_by_id(1)
+        self.assertEqual(fw.state, 'FIZZLED')
+        # the actions of the tasks before the failed one are kept for a task-level rerun
+        checkpoint = fw.launches[0].state_history[-2]['checkpoint']
+        self.assertEqual(checkpoint['_task_n'], 2)
+        self.assertEqual(checkpoint['_all_stored_data'], {'a': None, 'b': None})
+        self.assertEqual(checkpoint['_all_update_spec'], {'last': 'b'})
+
+    def test_task_parallelism_invalid(self):
+        self.lp.add_wf(Firework([SleepStoreTask(name='a'), SleepStoreTask(name='b')],
+                                spec={'_task_parallelism': 'all'}))
+        launch_rocket(self.lp, self.fworker)
+
+        fw = self.lp.get_fw_by_id(1)
+        self.assertEqual(fw.state, 'COMPLETED')
+        self.assertEqual(fw.launches[0].action.stored_data, {'a': None, 'b': 'a'})
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -169,6 +169,53 @@ class TrackerTest(unittest.TestCase):
             for ldir in glob.glob(os.path.join(pwd,'launcher_*')):
                 shutil.rmtree(ldir)
 
+    def test_track_file_incremental(self):
+        """
+        Track a file that is appended to, rotated and truncated
+        """
+        self._teardown([self.dest1])
+        try:
+            with open(self.dest1, 'w') as f:
+                f.write('1\n2\n3')
+            self.assertEqual('2\n3', self.tracker1.track_file())
+            with open(self.dest1, 'a') as f:
+                f.write('4\n5\n')
+            self.assertEqual('34\n5', self.tracker1.track_file())
+            self.assertEqual(os.path.getsize(self.dest1), self.tracker1._offset)
+
+            # rotated
+            os.rename(self.dest1, self.dest2)
+            with open(self.dest1, 'w') as f:
+                f.write('6\n')
+            self.assertEqual('6', self.tracker1.track_file())
+
+            # truncated
+            with open(self.dest2, 'w') as f:
+                f.write('7\n8\n9\n')
+            self.assertEqual('8\n9', self.tracker2.track_file())
+            with open(self.dest2, 'w') as f:
+                f.write('10\n')
+            self.assertEqual('10', self.tracker2.track_file())
+
+            # rewritten in place and grown past the offset
+            with open(self.dest2, 'w') as f:
+                f.write('11\n12\n13\n')
+            self.assertEqual('12\n13', self.tracker2.track_file())
+
+            # a line that never completes is capped
+            with open(self.dest2, 'a') as f:
+                f.write('x' * (3 * Tracker.MAX_LINE_BYTES))
+            self.assertEqual('13\n' + 'x' * (2 * Tracker.MAX_LINE_BYTES),
+                             self.tracker2.track_file())
+            self.assertEqual(len(self.tracker2._partial), 2 * Tracker.MAX_LINE_BYTES)
+
+            # Windows line endings
+            with open(self.dest2, 'wb') as f:
+                f.write(b'14\r\n15\r\n16\r')
+            self.assertEqual('15\n16', self.tracker2.track_file())
+        finally:
+            self._teardown([self.dest1, self.dest2])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,6 +5,7 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 from fireworks import Firework
+from fireworks.utilities.fw_serializers import date_query, date_prefix
 
 __author__ = 'Anubhav Jain <ajain@lbl.gov>'
 
@@ -54,8 +55,6 @@ class FWReport:
         else:
             raise ValueError("Unrecognized collection!")
 
-        # whether the collection uses String or Date time dates
-        string_type_dates = True if coll in ["fireworks", "launches"] else False
         time_field = "updated_on" if coll in ["fireworks", "workflows"] else "time_end"
 
         coll = self.db[coll]
@@ -65,12 +64,12 @@ class FWReport:
         if num_intervals:
             now_time = datetime.utcnow()
             start_time = now_time - relativedelta(**{interval:num_intervals})
-            date_q = {"$gte": start_time.isoformat()} if string_type_dates else {"$gte": start_time}
-            match_q.update({time_field: date_q})
+            # the dates of fireworks and launches are strings or BSON dates (see BSON_DATES)
+            match_q = {"$and": [match_q, date_query(time_field, "$gte", start_time)]}
 
         pipeline.append({"$match": match_q})
         pipeline.append({"$project": {"state": 1, "_id": 0,
-                                      "date_key": {"$substr": ["$"+time_field, 0, date_key_idx]}}})
+                                      "date_key": date_prefix(time_field, date_key_idx)}})
         pipeline.append({"$group": {"_id": {"state:": "$state", "date_key": "$date_key"},
                                     "count": {"$sum": 1}, "state": {"$first": "$state"}}})
         pipeline.append({"$group": {"_id": {"_id_date_key": "$_id.date_key"},
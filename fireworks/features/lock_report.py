@@ -0,0 +1,100 @@
+# coding: utf-8
+
+from __future__ import division
+
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+from fireworks.features.fw_report import DATE_KEYS
+
+__author__ = 'Anubhav Jain <ajain@lbl.gov>'
+
+
+class LockReport:
+    """
+    Report on the WFLocks recorded in the lock_stats collection (see WFLOCK_STATS_MAX_BYTES).
+    """
+
+    def __init__(self, lpad):
+        """
+        Args:
+        lpad (LaunchPad)
+        """
+        self.db = lpad.db
+
+    def get_hot_workflows(self, limit=10, interval="days", num_intervals=5):
+        """
+        Get the workflows that spent the most time waiting for their WFLock in the past
+        <num_intervals> <interval>.
+
+        Args:
+            limit (int): max number of workflows
+            interval (str): one of "minutes", "hours", "days", "months", "years"
+            num_intervals (int): number of intervals to go back in time from present moment
+
+        Returns:
+            [dict]: lock statistics of each workflow, by decreasing total wait
+        """
+        pipeline = [{"$match": self._get_time_query(interval, num_intervals)},
+                    {"$group": {"_id": "$wf_id", "fw_id": {"$last": "$fw_id"},
+                                "count": {"$sum": 1},
+                                "wait_secs": {"$sum": "$wait_secs"},
+                                "max_wait_secs": {"$max": "$wait_secs"},
+                                "hold_secs": {"$sum": "$hold_secs"},
+                                "max_hold_secs": {"$max": "$hold_secs"},
+                                "retries": {"$sum": "$retries"},
+                                "kills": {"$sum": {"$cond": ["$killed", 1, 0]}},
+                                "timeouts": {"$sum": {"$cond": ["$timed_out", 1, 0]}}}},
+                    {"$sort": {"wait_secs": -1}},
+                    {"$limit": limit}]
+        hot_wfs = list(self.db.lock_stats.aggregate(pipeline))
+        names = dict((wf["_id"], wf["name"]) for wf in self.db.workflows.find(
+            {"_id": {"$in": [wf["_id"] for wf in hot_wfs]}}, {"name": 1}))
+        for wf in hot_wfs:
+            wf["name"] = names.get(wf["_id"])
+            wf["wf_id"] = str(wf.pop("_id"))
+        return hot_wfs
+
+    def get_wait_percentiles(self, interval="days", num_intervals=5, percentiles=(50, 90, 99)):
+        """
+        Compute the percentiles of the WFLock wait times for each of the past <num_intervals>
+        <interval>, e.g. each of the past 5 days.
+
+        Args:
+            interval (str): one of "minutes", "hours", "days", "months", "years"
+            num_intervals (int): number of intervals to go back in time from present moment
+            percentiles ([int]): percentiles to compute
+
+        Returns:
+            [dict]: for each interval, most recent first, the number of locks, the percentiles
+                ("p50", ...) and the max of the wait times in seconds
+        """
+        time_query = self._get_time_query(interval, num_intervals)
+        date_key_idx = DATE_KEYS[interval]
+        waits = defaultdict(list)
+        for sample in self.db.lock_stats.find(time_query, {"created_on": 1, "wait_secs": 1}):
+            waits[sample["created_on"].isoformat()[:date_key_idx]].append(sample["wait_secs"])
+
+        stats = []
+        for date_key in sorted(waits, reverse=True):
+            m_waits = sorted(waits[date_key])
+            stat = {"date_key": date_key, "count": len(m_waits), "max": m_waits[-1]}
+            for p in percentiles:
+                # nearest-rank percentile
+                stat["p{}".format(p)] = m_waits[max(int(math.ceil(p / 100 * len(m_waits))) - 1, 0)]
+            stats.append(stat)
+        return stats
+
+    @staticmethod
+    def _get_time_query(interval, num_intervals):
+        if interval not in DATE_KEYS.keys():
+            raise ValueError(
+                "Specified interval ({}) is not in list of allowed intervals({})".format(
+                    interval, DATE_KEYS.keys()))
+        if not num_intervals:
+            return {}
+        start_time = datetime.utcnow() - relativedelta(**{interval: num_intervals})
+        return {"created_on": {"$gte": start_time}}
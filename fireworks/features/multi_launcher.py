@@ -37,19 +37,22 @@ def ping_multilaunch(port, stop_event):
 
     lp = ds.LaunchPad()
     while not stop_event.is_set():
+        running_ids = []
         for pid, lid in fd.Running_IDs.items():
             if lid:
                 try:
                     os.kill(pid, 0)  # throws OSError if the process is dead
-                    lp.ping_launch(lid)
+                    running_ids.append(lid)
                 except OSError:  # means this process is dead!
                     fd.Running_IDs[pid] = None
+        if running_ids:
+            lp.ping_launches(running_ids)
 
         stop_event.wait(PING_TIME_SECS)
 
 
 def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_nproc, timeout,
-                      running_ids_dict, local_redirect):
+                      running_ids_dict, local_redirect, batch_size=None):
     """
     Initializes shared data with multiprocessing parameters and starts a rapidfire.
 
@@ -64,6 +67,7 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
         sub_nproc (int): number of processors of the sub job
         timeout (int): # of seconds after which to stop the rapidfire process
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks to reserve at a time (see rapidfire)
     """
     ds = DataServer(address=('127.0.0.1', port), authkey=DS_PASSWORD)
     ds.connect()
@@ -78,7 +82,7 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
     l_logger = get_fw_logger('rocket.launcher', l_dir=l_dir, stream_level=loglvl)
     rapidfire(launchpad, fworker=fworker, m_dir=None, nlaunches=nlaunches,
               max_loops=-1, sleep_time=sleep, strm_lvl=loglvl, timeout=timeout,
-              local_redirect=local_redirect)
+              local_redirect=local_redirect, batch_size=batch_size)
     while nlaunches == 0:
         time.sleep(1.5) # wait for LaunchPad to be initialized
         launch_ids = FWData().Running_IDs.values()
@@ -90,14 +94,14 @@ def rapidfire_process(fworker, nlaunches, sleep, loglvl, port, node_list, sub_np
             log_multi(l_logger, 'Resubmit sub job')
             rapidfire(launchpad, fworker=fworker, m_dir=None, nlaunches=nlaunches,
                       max_loops=-1, sleep_time=sleep, strm_lvl=loglvl, timeout=timeout,
-                      local_redirect=local_redirect)
+                      local_redirect=local_redirect, batch_size=batch_size)
         else:
             break
     log_multi(l_logger, 'Sub job finished')
 
 
 def start_rockets(fworker, nlaunches, sleep, loglvl, port, node_lists, sub_nproc_list, timeout=None,
-                  running_ids_dict=None, local_redirect=False):
+                  running_ids_dict=None, local_redirect=False, batch_size=None):
     """
     Create each sub job and start a rocket launch in each one
 
@@ -112,12 +116,13 @@ def start_rockets(fworker, nlaunches, sleep, loglvl, port, node_lists, sub_nproc
         timeout (int): # of seconds after which to stop the rapidfire process
         running_ids_dict (dict): Shared dict between process to record IDs
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks each sub job reserves at a time (see rapidfire)
     Returns:
         ([multiprocessing.Process]) all the created processes
     """
     processes = [Process(target=rapidfire_process,
                          args=(fworker, nlaunches, sleep, loglvl, port, nl, sub_nproc, timeout,
-                               running_ids_dict, local_redirect))
+                               running_ids_dict, local_redirect, batch_size))
                  for nl, sub_nproc in zip(node_lists, sub_nproc_list)]
     for p in processes:
         p.start()
@@ -155,7 +160,7 @@ def split_node_lists(num_jobs, total_node_list=None, ppn=24):
 # TODO: why is loglvl a required parameter??? Also nlaunches and sleep_time could have a sensible default??
 def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_time,
                         total_node_list=None, ppn=1, timeout=None, exclude_current_node=False,
-                        local_redirect=False):
+                        local_redirect=False, batch_size=None):
     """
     Launch the jobs in the job packing mode.
 
@@ -171,6 +176,7 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
         timeout (int): # of seconds after which to stop the rapidfire process
         exclude_current_node: Don't use the script launching node as a compute node
         local_redirect (bool): redirect standard input and output to local file
+        batch_size (int): number of FireWorks each sub job reserves at a time (see rapidfire)
     """
     # parse node file contents
     if exclude_current_node:
@@ -184,7 +190,8 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
             log_multi(l_logger, "The current node is not in the node list, keep the node list as is")
     node_lists, sub_nproc_list = split_node_lists(num_jobs, total_node_list, ppn)
 
-    # create shared dataserver
+    # create shared dataserver. The launches that the sub jobs complete at the same time go
+    # through the shared LaunchPad together, see LaunchPad.complete_launch
     ds = DataServer.setup(launchpad)
     port = ds.address[1]
 
@@ -193,7 +200,7 @@ def launch_multiprocess(launchpad, fworker, loglvl, nlaunches, num_jobs, sleep_t
     # launch rapidfire processes
     processes = start_rockets(fworker, nlaunches, sleep_time, loglvl, port, node_lists,
                               sub_nproc_list, timeout=timeout, running_ids_dict=running_ids_dict,
-                              local_redirect=local_redirect)
+                              local_redirect=local_redirect, batch_size=batch_size)
     FWData().Running_IDs = running_ids_dict
 
     # start pinging service
@@ -12,6 +12,8 @@ from bson.son import SON
 from collections import defaultdict
 
 from fireworks import LaunchPad
+from fireworks.fw_config import BSON_DATES
+from fireworks.utilities.fw_serializers import date_query, date_prefix
 
 __author__ = 'Wei Chen'
 __copyright__ = 'Copyright 2014, The Material Project'
@@ -130,7 +132,7 @@ class FWStats:
             match_launch_id={"launch_id":{"$in":launch_id}}
             summary_query = self._get_summary(coll=self._launches, query_start=query_start, query_end=query_end,
                               query=match_launch_id, return_query_only=True, **args)
-        summary_query[1]["$project"][time_field]={"$substr":["$"+time_field, 0, 10]}
+        summary_query[1]["$project"][time_field]=date_prefix(time_field, 10)
         summary_query[2]["$group"]["_id"] = {time_field:"$"+time_field, "state":"$state"}
         re_aggregate_query = [summary_query[0], summary_query[1], summary_query[2],
                               {"$group":{"_id":"$_id."+time_field, "run_counts":{"$push":{"state":"$_id.state", "count":"$count"}}}},
@@ -156,8 +158,9 @@ class FWStats:
         project_query = {"key":"$"+group_by, "_id":0}
         group_query = {"_id":"$key",
                        "count":{"$sum":1}}
-        match_query = {"state":"FIZZLED", "created_on":self._query_datetime_range(start_time=query_start,
-                                                                                  end_time=query_end, **args)}
+        match_query = self._query_datetime_field("created_on", start_time=query_start, end_time=query_end,
+                                                 **args)
+        match_query["state"] = "FIZZLED"
         if include_ids:
             project_query.update({"fw_id":1})
             group_query.update({"fw_id":{"$push":"$fw_id"}})
@@ -197,13 +200,17 @@ class FWStats:
             return bad_dates
         id_dict=defaultdict(list)
         for d in bad_dates:
-            for fizzled_id in self._launches.find({time_field:{"$regex":d}, "state":"FIZZLED"}, {"fw_id":1}):
+            day = parser.parse(d)
+            day_query = {"$and":[date_query(time_field, "$gte", day),
+                                 date_query(time_field, "$lt", day+timedelta(days=1))]}
+            day_query["state"] = "FIZZLED"
+            for fizzled_id in self._launches.find(day_query, {"fw_id":1}):
                 id_dict[d].append(fizzled_id["fw_id"])
         return id_dict
 
     def _get_summary(self, coll, query_start=None, query_end=None, query=None, time_field="time_end",
                      runtime_stats=False, include_ids=False, id_field="fw_id", return_query_only=False,
-                     allow_null_time=True, isoformat=True, **args):
+                     allow_null_time=True, isoformat=None, **args):
         """
         Get a summary of Fireworks stats with a specified time range.
         :param coll: (Pymongo Collection) A PyMongo Collection instance.
@@ -218,7 +225,7 @@ class FWStats:
         :param id_field: (str) The ids returned when include_ids is True. Default is "fw_id".
         :param return_query_only: (bool) If only return the query expression for aggregation. Default is False.
         :param allow_null_time: (bool) If count entries with time_field is null. Default is True.
-        :param isoformat:(bool) If use isoformat time for query. Default is True.
+        :param isoformat:(bool) If use isoformat time for query. Default is to match both isoformat and BSON dates.
         :param args: (dict) Time difference to calculate query_start from query_end. Accepts arguments in python
         datetime.timedelta function. args and query_start can not be given at the same time. Default is 30 days.
         :return: (list) A summary of Fireworks stats with the specified time range.
@@ -227,13 +234,10 @@ class FWStats:
             query={}
         project_query = {"state":1, "_id":0}
         group_query = {"count":{"$sum":1}}
+        match_query = self._query_datetime_field(time_field, start_time=query_start, end_time=query_end,
+                                                 isoformat=isoformat, **args)
         if allow_null_time:
-            match_query = {"$or":[{time_field:self._query_datetime_range(start_time=query_start, end_time=query_end,
-                                                                         isoformat=isoformat, **args)},
-                                  {time_field:None}]}
-        else:
-            match_query = {time_field:self._query_datetime_range(start_time=query_start, end_time=query_end,
-                                                                 isoformat=isoformat, **args)}
+            match_query = {"$or":[match_query, {time_field:None}]}
         match_query.update(query)
         if runtime_stats:
             project_query.update({"runtime_secs":1})
@@ -288,14 +292,33 @@ class FWStats:
         return list(coll.aggregate(query))
 
     @staticmethod
-    def _query_datetime_range(start_time=None, end_time=None, isoformat=True, **time_delta):
+    def _query_datetime_field(time_field, start_time=None, end_time=None, isoformat=None, **time_delta):
+        """
+        Get a PyMongo query for the documents whose time_field is in a datetime range
+        (see _query_datetime_range).
+        :param time_field: (str) The field to query time range.
+        :param isoformat: (bool) If the query matches isoformat or BSON dates. Default is to match
+        both, e.g. while the dates of fireworks and launches are migrated (see LaunchPad.migrate_dates).
+        :return: (dict) A Mongodb query.
+        """
+        if isoformat is not None:
+            return {time_field:FWStats._query_datetime_range(start_time=start_time, end_time=end_time,
+                                                             isoformat=isoformat, **time_delta)}
+        time_range = FWStats._query_datetime_range(start_time=start_time, end_time=end_time,
+                                                   isoformat=False, **time_delta)
+        return {"$and":[date_query(time_field, "$gte", time_range["$gte"]),
+                        date_query(time_field, "$lt", time_range["$lt"])]}
+
+    @staticmethod
+    def _query_datetime_range(start_time=None, end_time=None, isoformat=None, **time_delta):
         """
         Get a PyMongo query expression for datetime
         :param start_time: (str) Query start time (inclusive) in isoformat (YYYY-MM-DDTHH:MM:SS.mmmmmm).
         Default is 30 days before current time.
         :param end_time: (str) Query end time (exclusive) in isoformat (YYYY-MM-DDTHH:MM:SS.mmmmmm).
         Default is current time.
-        :param isoformat: (bool) If ruturned Pymongo query uses isoformat for datetime. Default is True.
+        :param isoformat: (bool) If ruturned Pymongo query uses isoformat for datetime. Default is not
+        BSON_DATES, i.e. the format of the dates of fireworks and launches.
         :param time_delta: (dict) Time difference to calculate start_time from end_time. Accepts arguments in python
         datetime.timedelta function. time_delta and start_time can not be given at the same time. Default is 30 days.
         :return: (dict) A Mongodb query expression for a datetime range.
@@ -314,6 +337,8 @@ class FWStats:
             start_time = parser.parse(start_time)
         if start_time > end_time:
             raise ValueError("query_start should be earlier than query_end!")
+        if isoformat is None:
+            isoformat = not BSON_DATES
         if isoformat:
             return {"$gte":start_time.isoformat(), "$lt":end_time.isoformat()}
         else:
@@ -133,7 +133,7 @@ def home():
             "name": item['name'],
             "state": item['state'],
             "fireworks": list(
-                app.lp.fireworks.find({"fw_id": {"$in": item["nodes"]}},
+                app.lp.fireworks.find({"fw_id": {"$in": app.lp._get_wf_nodes(item)}},
                                   limit=PER_PAGE, sort=[('fw_id', DESCENDING)],
                                   projection=["state", "name", "fw_id"]))
         })
@@ -194,9 +194,12 @@ def workflow_json(wf_id):
                       "PAUSED": "#FFCFCA"
                       }
 
-    wf = app.lp.workflows.find_one({'nodes': wf_id})
-    fireworks = list(app.lp.fireworks.find({"fw_id": {"$in": wf["nodes"]}},
+    wf = app.lp.workflows.find_one(app.lp._get_wf_query(wf_id))
+    fireworks = list(app.lp.fireworks.find({"fw_id": {"$in": app.lp._get_wf_nodes(wf)}},
                                        projection=["name", "fw_id", "state"]))
+    if wf.get("external_links"):
+        links = app.lp._get_external_links(wf["_id"])[0]
+        wf["links"] = {str(k): v for k, v in links.items()}
     nodes_and_edges = {'nodes': list(), 'edges': list()}
     for fw in fireworks:
         fw_id = fw['fw_id']
@@ -9,8 +9,8 @@ def get_totals(states, lp):
 
 def fw_filt_given_wf_filt(filt, lp):
     fw_ids = set()
-    for doc in lp.workflows.find(filt, {'_id': 0, 'nodes': 1}):
-        fw_ids |= set(doc['nodes'])
+    for doc in lp.workflows.find(filt, {'nodes': 1, 'external_links': 1}):
+        fw_ids |= set(lp._get_wf_nodes(doc))
     return {"fw_id": {"$in": list(fw_ids)}}
 
 
@@ -18,7 +18,10 @@ def wf_filt_given_fw_filt(filt, lp):
     wf_ids = set()
     for doc in lp.fireworks.find(filt, {'_id': 0, 'fw_id': 1}):
         wf_ids.add(doc['fw_id'])
-    return {"nodes": {"$in": list(wf_ids)}}
+    # workflows with external links only have their first FW in nodes
+    ext_wf_ids = set(doc['wf_id'] for doc in lp.workflow_nodes.find(
+        {'fw_id': {'$in': list(wf_ids)}}, {'_id': 0, 'wf_id': 1}))
+    return {"$or": [{"nodes": {"$in": list(wf_ids)}}, {"_id": {"$in": list(ext_wf_ids)}}]}
 
 def uses_index(filt, coll):
     ii = coll.index_information()
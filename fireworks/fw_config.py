@@ -23,12 +23,21 @@ NEGATIVE_FWID_CTR = 0
 USER_PACKAGES = ['fireworks.user_objects', 'fireworks.utilities.tests',
                  'fw_tutorials', 'fireworks.features']
 
+# file where load_object() caches the module of every _fw_name in USER_PACKAGES (None to disable)
+FW_NAME_REGISTRY = os.path.join(os.path.expanduser('~'), '.fireworks', 'fw_name_registry.json')
+
 # if you update a _fw_name, you can use this to record the change and maintain deserialization
 FW_NAME_UPDATES = {'Transfer Task': 'FileTransferTask',
                    'Script Task': 'ScriptTask',
                    'Template Writer Task': 'TemplateWriterTask',
                    'Dupe Finder Exact': 'DupeFinderExact'}
 
+BSON_DATES = False  # store the dates of FireWorks and Launches as BSON dates rather than isoformat
+# strings. Run "lpad admin migrate_dates" to convert the dates of existing documents.
+
+RECONSTITUTE_DATE_FIELDS_ONLY = False  # when loading documents, only convert the known date fields
+# (created_on, updated_on, ...) to datetimes, rather than every string that looks like a date
+
 YAML_STYLE = False  # controls whether YAML documents will be nested as braces or blocks (False = blocks)
 
 FW_BLOCK_FORMAT = '%Y-%m-%d-%H-%M-%S-%f'  # date format for writing block directories in "rapid-fire" mode
@@ -45,6 +54,15 @@ PRINT_FW_JSON = True
 PRINT_FW_YAML = False
 
 PING_TIME_SECS = 3600  # while Running a job, how often to ping back the server that we're still alive
+
+CHECKPOINT_INTERVAL_SECS = 0  # min interval between two checkpoints written by a Rocket before its
+# Firetasks; the latest checkpoint is written when the Firework fizzles (0 = every Firetask)
+
+BACKUP_MAX_ENTRIES = 1000  # max number of backup copies of the Launches (and of the FireWorks) a
+# LaunchPad keeps in memory while they run, to restore them if a Rocket fails; the oldest ones are
+# moved to temporary files first (0 = unbounded)
+BACKUP_SPILL_BYTES = 0  # if > 0, backup copies larger than this are always kept in temporary files
+
 RUN_EXPIRATION_SECS = PING_TIME_SECS * 4  # mark job as FIZZLED if not pinged in this time
 
 MAINTAIN_INTERVAL = 120  # seconds between maintenance intervals when running infinite maintenance
@@ -54,9 +72,25 @@ RESERVATION_EXPIRATION_SECS = 60 * 60 * 24 * 14  # a job can stay in a queue thi
 
 WFLOCK_EXPIRATION_SECS = 60 * 5  # wait this long for a WFLock before expiring
 WFLOCK_EXPIRATION_KILL = False  # kill WFLock on expiration (or give a warning)
+WFLOCK_LEASE_SECS = 30  # a WFLock not renewed by its holder for this long is taken over
+WF_OPTIMISTIC_UPDATES = False  # update workflows with a compare-and-swap on their version number
+# instead of holding a WFLock while they are loaded and refreshed
+WFLOCK_STATS_MAX_BYTES = 0  # if > 0, size of the capped lock_stats collection where every WFLock
+# is recorded, for "lpad admin lock_report"
+WFLOCK_STATS_MAX_WFS = 10000  # max number of workflows whose WFLock statistics are kept in memory
 
 RAPIDFIRE_SLEEP_SECS = 60  # seconds to sleep between rapidfire loops
 
+READY_EVENTS_MAX_BYTES = 1024 * 1024  # size of the capped collection that wakes up idle launchers
+FUTURE_RUN_CACHE_SECS = 5  # how long a LaunchPad reuses the answer of future_run_exists()
+
+WF_EXTERNAL_LINKS_MIN_FWS = 10000  # workflows with this many FWs store their links and FW states
+# in the workflow_nodes collection rather than in the workflow document
+
+PREFETCH_LEASE_SECS = 60 * 10  # prefetched reservations unused for this long are given back
+PREFETCH_LEASE_MARGIN = 0.1  # fraction of PREFETCH_LEASE_SECS before the lease recorded in the DB
+# expires at which the launcher stops using a prefetched reservation, to make up for clock skew
+
 LAUNCHPAD_LOC = None  # where to find the my_launchpad.yaml file
 FWORKER_LOC = None  # where to find the my_fworker.yaml file
 QUEUEADAPTER_LOC = None  # where to find the my_qadapter.yaml file
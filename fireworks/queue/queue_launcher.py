@@ -171,7 +171,8 @@ def rapidfire(launchpad, fworker, qadapter, launch_dir='.', nlaunches=0, njobs_q
         nlaunches (int): total number of launches desired; "infinite" for loop, 0 for one round
         njobs_queue (int): stops submitting jobs when njobs_queue jobs are in the queue, 0 for no limit
         njobs_block (int): automatically write a new block when njobs_block jobs are in a single block
-        sleep_time (int): secs to sleep between rapidfire loop iterations
+        sleep_time (int): max secs to sleep between rapidfire loop iterations; the sleep ends
+            early when new FireWorks become READY, unless the queue is full
         reserve (bool): Whether to queue in reservation mode
         strm_lvl (str): level at which to stream log messages
         timeout (int): # of seconds after which to stop the rapidfire process
@@ -205,6 +206,9 @@ def rapidfire(launchpad, fworker, qadapter, launch_dir='.', nlaunches=0, njobs_q
             # get number of jobs in queue
             jobs_in_queue = _get_number_of_jobs_in_queue(qadapter, njobs_queue, l_logger)
             job_counter = 0  # this is for QSTAT_FREQUENCY option
+            queue_full = False
+            # wake up for the FWs that become READY from now on, even while they are checked for
+            ready_event_id = launchpad.get_ready_event_id()
 
             while (launchpad.run_exists(fworker) or
                    (fill_mode and not reserve)):
@@ -217,6 +221,7 @@ def rapidfire(launchpad, fworker, qadapter, launch_dir='.', nlaunches=0, njobs_q
                     l_logger.info("Jobs in queue ({}) meets/exceeds "
                                   "maximum allowed ({})".format(jobs_in_queue,
                                                                 njobs_queue))
+                    queue_full = True
                     break
 
                 l_logger.info('Launching a rocket!')
@@ -254,7 +259,10 @@ def rapidfire(launchpad, fworker, qadapter, launch_dir='.', nlaunches=0, njobs_q
                 break
 
             l_logger.info('Finished a round of launches, sleeping for {} secs'.format(sleep_time))
-            time.sleep(sleep_time)
+            if queue_full:
+                time.sleep(sleep_time)
+            else:
+                launchpad.wait_for_ready(sleep_time, fworker, ready_event_id)
             l_logger.info('Checking for Rockets to run...')
 
     except:
@@ -26,6 +26,7 @@ from fireworks.fw_config import RESERVATION_EXPIRATION_SECS, \
     LAUNCHPAD_LOC, FWORKER_LOC, WEBSERVER_PORT, WEBSERVER_HOST
 from fireworks.features.fw_report import FWReport
 from fireworks.features.introspect import Introspector
+from fireworks.features.lock_report import LockReport
 from fireworks.core.launchpad import LaunchPad, WFLock
 from fireworks.core.firework import Workflow, Firework
 from fireworks.core.fworker import FWorker
@@ -279,7 +280,7 @@ def get_wfs(args):
         args.display_format = args.display_format if args.display_format else 'more'
 
     if args.fw_id:
-        query = {'nodes': {"$in": args.fw_id}}
+        query = {'$or': [lp._get_wf_query(fw_id) for fw_id in args.fw_id]}
     elif args.name:
         query = {'name': args.name}
     elif args.state:
@@ -367,6 +368,13 @@ def tuneup(args):
     lp.tuneup(bkground=not args.full)
 
 
+def explain_checkout(args):
+    lp = get_lp(args)
+    fworker = FWorker.from_file(args.fworker_file) if args.fworker_file else FWorker()
+    plan = lp.explain_checkout(fworker)
+    print(args.output(plan.get('queryPlanner', plan)))
+
+
 def defuse_wfs(args):
     lp = get_lp(args)
     fw_ids = parse_helper(lp, args, wf_mode=True)
@@ -476,6 +484,24 @@ def unlock(args):
     lp.m_logger.info('Finished unlocking {} Workflows'.format(len(fw_ids)))
 
 
+def lock_report(args):
+    lp = get_lp(args)
+    lr = LockReport(lp)
+    hot_wfs = lr.get_hot_workflows(args.max, args.interval, args.num_intervals)
+    if not hot_wfs:
+        print("No WFLocks were recorded in the chosen time period. Set WFLOCK_STATS_MAX_BYTES to "
+              "record them.")
+        return
+    print(args.output({"hottest_workflows": hot_wfs,
+                       "wait_percentiles": lr.get_wait_percentiles(args.interval,
+                                                                   args.num_intervals)}))
+
+
+def migrate_dates(args):
+    lp = get_lp(args)
+    print(args.output(lp.migrate_dates(args.batch_size)))
+
+
 def get_qid(args):
     lp = get_lp(args)
     for f in args.fw_id:
@@ -1073,6 +1099,13 @@ def lpad():
                                               'DB downtime only)', action='store_true')
     tuneup_parser.set_defaults(func=tuneup)
 
+    explain_parser = admin_subparser.add_parser('explain_checkout',
+                                                help='Print the MongoDB query plan used to check '
+                                                     'out FireWorks for a FWorker')
+    explain_parser.add_argument('-w', '--fworker_file', help='path to fworker file',
+                                default=FWORKER_LOC)
+    explain_parser.set_defaults(func=explain_checkout)
+
     refresh_parser = admin_subparser.add_parser('refresh', help='manually force a workflow refresh '
                                                                 '(not usually needed)')
     refresh_parser.add_argument(*fw_id_args, **fw_id_kwargs)
@@ -1096,6 +1129,32 @@ def lpad():
                                                   "required when modifying more than {} entries.".format(PW_CHECK_NUM))
     unlock_parser.set_defaults(func=unlock)
 
+    lock_report_parser = admin_subparser.add_parser('lock_report',
+                                                    help='Show the workflows with the most WFLock '
+                                                         'contention and the percentiles of the '
+                                                         'lock waiting times')
+    lock_report_parser.add_argument('-m', '--max', help='max number of workflows to show',
+                                    default=10, type=int)
+    lock_report_parser.add_argument('-i', '--interval', help="Interval on which to split the "
+                                                             "report. Choose from 'minutes', "
+                                                             "'hours' (default), 'days', "
+                                                             "'months', or 'years'.",
+                                    default="hours")
+    lock_report_parser.add_argument('-n', '--num_intervals', help="The number of intervals on "
+                                                                  "which to report (default=24)",
+                                    type=int, default=24)
+    lock_report_parser.set_defaults(func=lock_report)
+
+    migrate_dates_parser = admin_subparser.add_parser('migrate_dates',
+                                                      help='Convert the dates of FireWorks and '
+                                                           'Launches stored as strings to BSON '
+                                                           'dates (see BSON_DATES); can be '
+                                                           'interrupted and resumed')
+    migrate_dates_parser.add_argument('-b', '--batch_size', help='number of documents updated '
+                                                                 'at a time (default=1000)',
+                                      type=int, default=1000)
+    migrate_dates_parser.set_defaults(func=migrate_dates)
+
     report_parser = subparsers.add_parser('report', help='Compile a report of runtime stats, '
                                                          'type "lpad report -h" for more options.')
     report_parser.add_argument("-c", "--collection", help="The collection to report on; "
@@ -61,6 +61,12 @@ def rlaunch():
                               type=int)
     rapid_parser.add_argument('--local_redirect', help="Redirect stdout and stderr to the launch directory",
                               action="store_true")
+    rapid_parser.add_argument('--batch_size', help='reserve this many FireWorks at a time '
+                                                   '(default None reserves them one by one)',
+                              default=None, type=int)
+    rapid_parser.add_argument('--prefetch', help='keep this many FireWorks reserved ahead in a '
+                                                 'background thread (default None)',
+                              default=None, type=int)
 
     multi_parser.add_argument('num_jobs', help='the number of jobs to run in parallel', type=int)
     multi_parser.add_argument('--nlaunches', help='number of FireWorks to run in series per '
@@ -83,6 +89,9 @@ def rlaunch():
                               action="store_true")
     multi_parser.add_argument('--local_redirect', help="Redirect stdout and stderr to the launch directory",
                               action="store_true")
+    multi_parser.add_argument('--batch_size', help='number of FireWorks each parallel job reserves '
+                                                   'at a time (default None reserves them one by one)',
+                              default=None, type=int)
 
     parser.add_argument('-l', '--launchpad_file', help='path to launchpad file')
     parser.add_argument('-w', '--fworker_file', help='path to fworker file')
@@ -139,7 +148,8 @@ def rlaunch():
     if args.command == 'rapidfire':
         rapidfire(launchpad, fworker=fworker, m_dir=None, nlaunches=args.nlaunches,
                   max_loops=args.max_loops, sleep_time=args.sleep, strm_lvl=args.loglvl,
-                  timeout=args.timeout,local_redirect=args.local_redirect)
+                  timeout=args.timeout,local_redirect=args.local_redirect,
+                  batch_size=args.batch_size, prefetch=args.prefetch)
     elif args.command == 'multi':
         total_node_list = None
         if args.nodefile:
@@ -150,7 +160,7 @@ def rlaunch():
         launch_multiprocess(launchpad, fworker, args.loglvl, args.nlaunches, args.num_jobs,
                             args.sleep, total_node_list, args.ppn, timeout=args.timeout,
                             exclude_current_node=args.exclude_current_node,
-                            local_redirect=args.local_redirect)
+                            local_redirect=args.local_redirect, batch_size=args.batch_size)
     else:
         launch_rocket(launchpad, fworker, args.fw_id, args.loglvl, pdb_on_exception=args.pdb)
 
@@ -1,6 +1,7 @@
 # coding: utf-8
 
 from __future__ import unicode_literals
+import datetime
 import json
 
 from multiprocessing import Pool
@@ -589,6 +590,10 @@ class MongoTests(unittest.TestCase):
         s=FWStats(self.lp)
         launch_results=s.get_launch_summary(time_field="updated_on")[0]
         self.assertEqual((launch_results["_id"],launch_results["count"]), ("COMPLETED", 2))
+        # isoformat and BSON dates are both matched, e.g. while the dates are migrated
+        self.lp.launches.update_one({}, {'$set': {'time_end': datetime.datetime.utcnow()}})
+        launch_results=s.get_launch_summary()[0]
+        self.assertEqual((launch_results["_id"],launch_results["count"]), ("COMPLETED", 2))
         self.lp.add_wf(fw)
         fireworks_results=s.get_fireworks_summary(time_field="updated_on")
         self.assertEqual((fireworks_results[1]["_id"], fireworks_results[1]["count"]), ("READY", 1))
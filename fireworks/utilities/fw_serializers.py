@@ -30,18 +30,23 @@ Some advantages:
 
 """
 
-import traceback
+import os
+import re
 import pkgutil
 import inspect
 import json  # note that ujson is faster, but at this time does not support "default" in dumps()
 import importlib
 import datetime
 import abc
+import hashlib
 import sys
+import tempfile
+import warnings
 import six
 import ruamel.yaml as yaml
 from monty.json import MontyDecoder, MSONable
-from fireworks.fw_config import FW_NAME_UPDATES, YAML_STYLE, USER_PACKAGES, DECODE_MONTY, ENCODE_MONTY
+from fireworks.fw_config import FW_NAME_UPDATES, YAML_STYLE, USER_PACKAGES, DECODE_MONTY, \
+    ENCODE_MONTY, FW_NAME_REGISTRY, RECONSTITUTE_DATE_FIELDS_ONLY, BSON_DATES
 
 
 __author__ = 'Anubhav Jain'
@@ -54,8 +59,24 @@ __date__ = 'Dec 13, 2012'
 # TODO: consider *somehow* switching FireWorks to monty serialization. e.g., numpy serialization is better handled.
 
 SAVED_FW_MODULES = {}
+FW_NAME_ENTRY_POINTS = 'fireworks.fw_names'  # setuptools entry points of classes outside USER_PACKAGES
+_FW_NAME_REGISTRY = None  # registry of USER_PACKAGES loaded by _get_fw_name_registry()
 DATETIME_HANDLER = lambda obj: obj.isoformat() if isinstance(obj, datetime.datetime) else None
 
+# keys of the dates of Firework, Launch (and its state_history) and Workflow documents, the only
+# strings converted to dates when loading with RECONSTITUTE_DATE_FIELDS_ONLY
+DATE_FIELDS = frozenset(['created_on', 'updated_on', 'time_start', 'time_end'])
+
+# the strings accepted by strptime() with the formats "%Y-%m-%dT%H:%M:%S.%f" and
+# "%Y-%m-%dT%H:%M:%S" (the regexes of the directives are the ones of the _strptime module)
+_DATE_RE = re.compile(r'(\d\d\d\d)-(1[0-2]|0[1-9]|[1-9])-(3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])'
+                      r'[Tt](2[0-3]|[0-1]\d|\d):([0-5]\d|\d):(6[0-1]|[0-5]\d|\d)'
+                      r'(?:\.([0-9]{1,6}))?\Z')
+
+# the formats of $dateToString matching the prefixes of the isoformat strings, by length
+_DATE_PREFIX_FORMATS = {4: '%Y', 7: '%Y-%m', 10: '%Y-%m-%d', 13: '%Y-%m-%dT%H',
+                        16: '%Y-%m-%dT%H:%M'}
+
 if sys.version_info > (3, 0, 0):
     ENCODING_PARAMS = {"encoding": "utf-8"}
 else:
@@ -69,21 +90,40 @@ except:
 
 
 def recursive_dict(obj, preserve_unicode=True):
+    """
+    Convert an object to plain dicts, lists, strings and numbers. The conversion of the common
+    types is looked up by exact type in _TO_PLAIN; other objects go through _object_to_plain().
+    """
+    to_plain = _TO_PLAIN.get(type(obj))
+    if to_plain is None:
+        return _object_to_plain(obj, preserve_unicode)
+    return to_plain(obj, preserve_unicode)
+
+
+def _object_to_plain(obj, preserve_unicode):
     if obj is None:
         return None
 
     if ENCODE_MONTY and hasattr(obj, 'as_dict'):  # compatible with new monty JSONEncoder (MontyEncoder)
-        return recursive_dict(obj.as_dict(), preserve_unicode)
-
-    if hasattr(obj, 'to_dict'):
-        return recursive_dict(obj.to_dict(), preserve_unicode)
+        to_dict = obj.as_dict
+        if isinstance(obj, FWSerializable) and type(obj).as_dict == FWSerializable.as_dict:
+            to_dict = obj.to_dict
+    elif hasattr(obj, 'to_dict'):
+        to_dict = obj.to_dict
+    else:
+        to_dict = None
+    if to_dict is not None:
+        m_dict = to_dict()
+        # the output of a @recursive_serialize to_dict() is already plain
+        if preserve_unicode and getattr(to_dict, 'recursive_serialized', False):
+            return m_dict
+        return recursive_dict(m_dict, preserve_unicode)
 
     if isinstance(obj, dict):
-        return {recursive_dict(k, preserve_unicode): recursive_dict(v, preserve_unicode)
-                for k, v in obj.items()}
+        return _dict_to_plain(obj, preserve_unicode)
 
     if isinstance(obj, (list, tuple)):
-        return [recursive_dict(v, preserve_unicode) for v in obj]
+        return _list_to_plain(obj, preserve_unicode)
 
     if isinstance(obj, int) or isinstance(obj, float):
         return obj
@@ -95,13 +135,57 @@ def recursive_dict(obj, preserve_unicode=True):
         return obj
 
     if NUMPY_INSTALLED and isinstance(obj, np.ndarray):
-        return [recursive_dict(v, preserve_unicode) for v in obj.tolist()]
+        return _list_to_plain(obj.tolist(), preserve_unicode)
 
     return str(obj)
 
 
+def _dict_to_plain(obj, preserve_unicode):
+    return {(k if type(k) in _PLAIN_TYPES else recursive_dict(k, preserve_unicode)):
+            (v if type(v) in _PLAIN_TYPES else recursive_dict(v, preserve_unicode))
+            for k, v in obj.items()}
+
+
+def _list_to_plain(obj, preserve_unicode):
+    return [v if type(v) in _PLAIN_TYPES else recursive_dict(v, preserve_unicode) for v in obj]
+
+
+def _text_to_plain(obj, preserve_unicode):
+    if preserve_unicode and obj != obj.encode('ascii', 'ignore'):
+        return obj
+    return str(obj)
+
+
+def _ndarray_to_plain(obj, preserve_unicode):
+    if obj.dtype.kind in 'biuf':  # booleans and numbers are plain once converted to lists
+        return obj.tolist()
+    return _list_to_plain(obj.tolist(), preserve_unicode)
+
+
+# types that recursive_dict() returns as is
+_PLAIN_TYPES = frozenset([type(None), bool, int, float, str])
+
+_TO_PLAIN = {dict: _dict_to_plain, list: _list_to_plain, tuple: _list_to_plain,
+             datetime.datetime: lambda obj, preserve_unicode: obj.isoformat(),
+             six.text_type: _text_to_plain}
+_TO_PLAIN.update((t, lambda obj, preserve_unicode: obj) for t in _PLAIN_TYPES)
+if NUMPY_INSTALLED:
+    _TO_PLAIN[np.ndarray] = _ndarray_to_plain
+
+
 # TODO: is reconstitute_dates really needed? Can this method just do everything?
 def _recursive_load(obj):
+    """
+    Load the FireWorks objects and dates of plain dicts, lists and strings. The loading of the
+    common types is looked up by exact type in _LOADERS; other objects go through _load_other().
+    """
+    load = _LOADERS.get(type(obj))
+    if load is None:
+        return _load_other(obj)
+    return load(obj)
+
+
+def _load_other(obj):
     if obj is None:
         return None
 
@@ -109,29 +193,57 @@ def _recursive_load(obj):
         return obj
 
     if isinstance(obj, dict):
-        if '_fw_name' in obj:
-            return load_object(obj)
-
-        if DECODE_MONTY and '@module' in obj and '@class' in obj:  # MontyDecoder compatibility
-            return json.loads(json.dumps(obj), cls=MontyDecoder)
-
-        return {k: _recursive_load(v) for k, v in obj.items()}
+        return _load_dict(obj)
 
     if isinstance(obj, (list, tuple)):
-        return [_recursive_load(v) for v in obj]
+        return _load_list(obj)
 
     if isinstance(obj, six.string_types):
-        try:
-            # convert String to datetime if really datetime
-            return reconstitute_dates(obj)
-        except:
-            # convert unicode to ASCII if not really unicode
-            if obj == obj.encode('ascii', 'ignore'):
-                return str(obj)
+        return _load_str(obj)
 
     return obj
 
 
+def _load_dict(obj):
+    if '_fw_name' in obj:
+        return load_object(obj)
+
+    if DECODE_MONTY and '@module' in obj and '@class' in obj:  # MontyDecoder compatibility
+        return json.loads(json.dumps(obj), cls=MontyDecoder)
+
+    return _load_items(obj)
+
+
+def _load_items(obj):
+    """
+    Load the values of a dict.
+    """
+    if RECONSTITUTE_DATE_FIELDS_ONLY:
+        return {k: (_parse_date(v) if k in DATE_FIELDS and isinstance(v, six.string_types)
+                    else v if type(v) in _LOADED_TYPES else _recursive_load(v))
+                for k, v in obj.items()}
+    return {k: (v if type(v) in _LOADED_TYPES else _recursive_load(v)) for k, v in obj.items()}
+
+
+def _load_list(obj):
+    return [v if type(v) in _LOADED_TYPES else _recursive_load(v) for v in obj]
+
+
+def _load_str(obj):
+    # convert String to datetime if really datetime
+    if RECONSTITUTE_DATE_FIELDS_ONLY:
+        return obj
+    return _parse_date(obj)
+
+
+# types that _recursive_load() returns as is
+_LOADED_TYPES = frozenset([type(None), bool, int, float])
+
+_LOADERS = {dict: _load_dict, list: _load_list, tuple: _load_list}
+_LOADERS.update((t, lambda obj: obj) for t in _LOADED_TYPES)
+_LOADERS.update((t, _load_str) for t in set([str, six.text_type]))
+
+
 def recursive_serialize(func):
     """
     a decorator to add FW serializations keys
@@ -142,6 +254,7 @@ def recursive_serialize(func):
         m_dict = recursive_dict(m_dict)
         return m_dict
 
+    _decorator.recursive_serialized = True  # recursive_dict() needs not walk the output again
     return _decorator
 
 
@@ -152,7 +265,7 @@ def recursive_deserialize(func):
     """
     def _decorator(self, *args, **kwargs):
         new_args = [a for a in args]
-        new_args[0] = {k: _recursive_load(v) for k, v in args[0].items()}
+        new_args[0] = _load_items(args[0])
         m_dict = func(self, *new_args, **kwargs)
         return m_dict
 
@@ -169,6 +282,7 @@ def serialize_fw(func):
         m_dict['_fw_name'] = self.fw_name
         return m_dict
 
+    _decorator.recursive_serialized = getattr(func, 'recursive_serialized', False)
     return _decorator
 
 
@@ -294,7 +408,6 @@ class FWSerializable(object):
             self.__dict__[k] = v
 
 
-# TODO: make this quicker the first time around
 def load_object(obj_dict):
     """
     Creates an instantiation of a class based on a dictionary representation. We implicitly
@@ -303,7 +416,11 @@ def load_object(obj_dict):
     We search for a class with the _fw_name property equal to obj_dict['_fw_name']
     If the @module key is set, that module is checked first for a matching class
     to improve speed of lookup.
-    Afterwards, the modules in the USER_PACKAGES global parameter are checked.
+    Afterwards, the modules in the USER_PACKAGES global parameter are checked. The module of every
+    _fw_name in USER_PACKAGES is found once and cached in the FW_NAME_REGISTRY file, which is
+    rebuilt when one of the packages is upgraded or when an _fw_name is not found. Classes
+    outside of USER_PACKAGES can be registered by their _fw_name as 'fireworks.fw_names'
+    setuptools entry points.
 
     Refactoring class names, module names, etc. will not break object loading
     as long as:
@@ -338,25 +455,14 @@ def load_object(obj_dict):
         if m_object is not None:
             return m_object
 
-    # failing that, look for the object within all of USER_PACKAGES
-    # this will be slow, but only needed the first time
-
-    found_objects = [] # used to make sure we don't find multiple hits
-    for package in USER_PACKAGES:
-        root_module = importlib.import_module(package)
-        for _, mod_name, is_pkg in pkgutil.walk_packages(
-                root_module.__path__, package + '.'):
-            try:
-                m_module = importlib.import_module(mod_name)
-                m_object = _search_module_for_obj(m_module, obj_dict)
-                if m_object is not None:
-                    found_objects.append((m_object, mod_name))
-            except ImportError as ex:
-                import warnings
-                warnings.warn(
-                    "%s in %s cannot be loaded because of %s. Skipping.."
-                    % (m_object, mod_name, str(ex)))
-                traceback.print_exc(ex)
+    # failing that, look for the object in the modules of USER_PACKAGES that define this fw_name.
+    # The registry misses classes added or moved since it was built, so it is rebuilt on a miss,
+    # at most once per process
+    found_objects = _search_modules_for_obj(
+        _get_fw_name_registry().get(fw_name) or _get_entry_point_modules(fw_name), obj_dict)
+    if not found_objects and _rebuild_fw_name_registry():
+        found_objects = _search_modules_for_obj(_get_fw_name_registry().get(fw_name, []),
+                                                obj_dict)
 
     if len(found_objects) == 1:
         SAVED_FW_MODULES[fw_name] = found_objects[0][1]
@@ -366,7 +472,201 @@ def load_object(obj_dict):
             'load_object() found multiple objects with cls._fw_name {} -- {}'
             .format(fw_name, found_objects))
 
-    raise ValueError('load_object() could not find a class with cls._fw_name {}'.format(fw_name))
+    raise ValueError("load_object() could not find a class with cls._fw_name {} in USER_PACKAGES "
+                     "{} or the '{}' entry points. Add the package of the class to "
+                     "ADD_USER_PACKAGES in the FW_config.yaml file, or record its new name in "
+                     "FW_NAME_UPDATES if it was renamed.".format(fw_name, USER_PACKAGES,
+                                                                 FW_NAME_ENTRY_POINTS))
+
+
+def _get_fw_name_registry():
+    """
+    Get the modules that define each _fw_name in USER_PACKAGES. The registry is read from the
+    FW_NAME_REGISTRY file if it is up to date with the packages, otherwise it is built by
+    importing all the modules of the packages and written to the file.
+
+    Returns:
+        dict: fw_name: [module names]
+    """
+    global _FW_NAME_REGISTRY
+    packages = list(USER_PACKAGES)
+    if _FW_NAME_REGISTRY is not None and _FW_NAME_REGISTRY['packages'] == packages:
+        return _FW_NAME_REGISTRY['fw_names']
+
+    stamps = [_get_package_stamp(package) for package in packages]
+    registry = None
+    registry_path = _get_fw_name_registry_path()
+    if registry_path and os.path.exists(registry_path):
+        try:
+            with open(registry_path) as f:
+                registry = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass  # unreadable or partially written, rebuild it
+    if not registry or registry.get('packages') != packages or registry.get('stamps') != stamps:
+        registry = {'packages': packages, 'stamps': stamps,
+                    'fw_names': _build_fw_name_registry(packages)}
+        if FW_NAME_REGISTRY:
+            _write_fw_name_registry(registry)
+        registry = dict(registry, built=True)
+    _FW_NAME_REGISTRY = registry
+    return registry['fw_names']
+
+
+def _get_fw_name_registry_path():
+    """
+    Get the registry file of the current Python environment: the FW_NAME_REGISTRY file name is
+    suffixed with a hash of sys.prefix, so that the virtualenvs of a user keep separate
+    registries instead of rebuilding each other's.
+
+    Returns:
+        str: path of the registry file, None if FW_NAME_REGISTRY is not set
+    """
+    if not FW_NAME_REGISTRY:
+        return None
+    root, ext = os.path.splitext(FW_NAME_REGISTRY)
+    return '{}-{}{}'.format(root, hashlib.md5(sys.prefix.encode('utf-8')).hexdigest()[:8], ext)
+
+
+def _rebuild_fw_name_registry():
+    """
+    Rebuild the registry, unless it was already built by this process.
+
+    Returns:
+        bool: whether the registry was rebuilt
+    """
+    global _FW_NAME_REGISTRY
+    _get_fw_name_registry()
+    if _FW_NAME_REGISTRY.get('built'):
+        return False
+    packages = _FW_NAME_REGISTRY['packages']
+    registry = {'packages': packages,
+                'stamps': [_get_package_stamp(package) for package in packages],
+                'fw_names': _build_fw_name_registry(packages)}
+    if FW_NAME_REGISTRY:
+        _write_fw_name_registry(registry)
+    _FW_NAME_REGISTRY = dict(registry, built=True)
+    return True
+
+
+def _build_fw_name_registry(packages):
+    """
+    Import all the modules of the packages to find the _fw_name of each class.
+
+    Args:
+        packages ([str]): names of packages
+
+    Returns:
+        dict: fw_name: [module names]
+    """
+    fw_names = {}
+    for package in packages:
+        try:
+            root_module = importlib.import_module(package)
+        except ImportError as ex:
+            warnings.warn("Package {} in USER_PACKAGES cannot be loaded because of {}. "
+                          "Skipping..".format(package, ex))
+            continue
+        for _, mod_name, is_pkg in pkgutil.walk_packages(
+                root_module.__path__, package + '.'):
+            try:
+                m_module = importlib.import_module(mod_name)
+            except ImportError as ex:
+                warnings.warn("{} cannot be loaded because of {}. Skipping..".format(mod_name, ex))
+                continue
+            for _, obj in inspect.getmembers(m_module):
+                if inspect.isclass(obj) and obj.__module__ == mod_name:
+                    fw_name = getattr(obj, '_fw_name', get_default_serialization(obj))
+                    if isinstance(fw_name, six.string_types):
+                        fw_names.setdefault(fw_name, []).append(mod_name)
+    return fw_names
+
+
+def _write_fw_name_registry(registry):
+    """
+    Write the registry to the FW_NAME_REGISTRY file, atomically so that concurrent processes
+    never read a partial file. Failures are ignored: the registry is then rebuilt by the next
+    process.
+    """
+    registry_path = _get_fw_name_registry_path()
+    try:
+        registry_dir = os.path.dirname(os.path.abspath(registry_path))
+        if not os.path.exists(registry_dir):
+            os.makedirs(registry_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=registry_dir, prefix='.fw_name_registry')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(registry, f)
+        # os.rename cannot replace an existing file on Windows
+        getattr(os, 'replace', os.rename)(tmp_path, registry_path)
+    except (IOError, OSError) as ex:
+        warnings.warn("Cannot write FW_NAME_REGISTRY {}: {}".format(registry_path, ex))
+
+
+def _get_package_stamp(package):
+    """
+    Get what changes when a package is upgraded, installed elsewhere, or a module is added to or
+    removed from its top-level directory: the version of its distribution, the last modification
+    time of its top-level directories and __init__ module, and its paths. The package is not
+    walked, so that checking the
+    registry stays cheap on slow filesystems; changes deeper in the package are caught by
+    load_object, which rebuilds the registry when a _fw_name is not found.
+
+    Args:
+        package (str): name of the package
+
+    Returns:
+        list: version, modification time and paths, None if the package cannot be imported
+    """
+    try:
+        root_module = importlib.import_module(package)
+    except ImportError:
+        return None
+    paths = [os.path.abspath(path) for path in
+             list(getattr(root_module, '__path__', [])) + [getattr(root_module, '__file__', None)]
+             if path and os.path.exists(path)]
+    mtime = max([os.path.getmtime(path) for path in paths] or [0])
+    return [str(getattr(sys.modules[package.split('.')[0]], '__version__', None)), mtime, paths]
+
+
+def _search_modules_for_obj(mod_names, obj_dict):
+    """
+    Search the modules for a class that matches the obj_dict. Modules that cannot be imported
+    anymore, e.g. removed since the registry was built, are skipped.
+
+    Args:
+        mod_names ([str]): module names
+        obj_dict (dict): the dict representation of the class
+
+    Returns:
+        [(object, str)]: the objects found and their module names
+    """
+    found_objects = []  # used to make sure we don't find multiple hits
+    for mod_name in mod_names:
+        try:
+            m_module = importlib.import_module(mod_name)
+        except ImportError:
+            continue
+        m_object = _search_module_for_obj(m_module, obj_dict)
+        if m_object is not None:
+            found_objects.append((m_object, mod_name))
+    return found_objects
+
+
+def _get_entry_point_modules(fw_name):
+    """
+    Get the modules of the classes registered with the given fw_name as FW_NAME_ENTRY_POINTS
+    setuptools entry points, e.g. in setup.py:
+
+        entry_points={'fireworks.fw_names': ['MyTask = my_package.my_module:MyTask']}
+
+    Returns:
+        [str]: module names
+    """
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+    return [ep.module_name for ep in pkg_resources.iter_entry_points(FW_NAME_ENTRY_POINTS,
+                                                                     fw_name)]
 
 
 def load_object_from_file(filename, f_format=None):
@@ -408,26 +708,108 @@ def _search_module_for_obj(m_module, obj_dict):
 
 
 def reconstitute_dates(obj_dict):
+    """
+    Convert the strings of an object that are dates in isoformat to datetimes. With
+    RECONSTITUTE_DATE_FIELDS_ONLY, only the strings of dicts under a key of DATE_FIELDS are
+    converted, unless obj_dict itself is a string.
+    """
     if obj_dict is None:
         return None
 
     if isinstance(obj_dict, dict):
+        if RECONSTITUTE_DATE_FIELDS_ONLY:
+            return {k: (v if k not in DATE_FIELDS and isinstance(v, six.string_types)
+                        else reconstitute_dates(v)) for k, v in obj_dict.items()}
         return {k: reconstitute_dates(v) for k, v in obj_dict.items()}
 
     if isinstance(obj_dict, (list, tuple)):
+        if RECONSTITUTE_DATE_FIELDS_ONLY:
+            return [v if isinstance(v, six.string_types) else reconstitute_dates(v)
+                    for v in obj_dict]
         return [reconstitute_dates(v) for v in obj_dict]
 
     if isinstance(obj_dict, six.string_types):
-        try:
-            return datetime.datetime.strptime(obj_dict, "%Y-%m-%dT%H:%M:%S.%f")
-        except:
-            try:
-                return datetime.datetime.strptime(obj_dict, "%Y-%m-%dT%H:%M:%S")
-            except:
-                pass
+        return _parse_date(obj_dict)
     return obj_dict
 
 
+def to_db_date(date):
+    """
+    Convert a date to its type in the fireworks and launches collections: a datetime (BSON date)
+    with BSON_DATES, an isoformat string otherwise.
+
+    Args:
+        date (datetime, str or None)
+
+    Returns:
+        datetime, str or None
+    """
+    if BSON_DATES:
+        return _parse_date(date) if isinstance(date, six.string_types) else date
+    return date.isoformat() if isinstance(date, datetime.datetime) else date
+
+
+def date_query(field, operator, date):
+    """
+    Query comparing a date field of the fireworks or launches collections to a date, whether the
+    field is stored as a BSON date or as an isoformat string (e.g. during migrate_dates).
+
+    Args:
+        field (str): e.g. "updated_on"
+        operator (str): e.g. "$lte"
+        date (datetime)
+
+    Returns:
+        dict
+    """
+    return {'$or': [{field: {operator: date}}, {field: {operator: date.isoformat()}}]}
+
+
+def date_prefix(field, length):
+    """
+    Aggregation expression of the first characters of the isoformat string of a date field of
+    the fireworks or launches collections, e.g. "2015-09-28" for a length of 10, to group
+    documents by year, month, day, hour or minute. With BSON_DATES, the field may be stored as a
+    BSON date or as an isoformat string (e.g. during migrate_dates), which requires MongoDB 3.4.
+
+    Args:
+        field (str): e.g. "updated_on"
+        length (int): one of 4, 7, 10, 13 or 16
+
+    Returns:
+        dict
+    """
+    substr = {'$substr': ['$' + field, 0, length]}
+    if not BSON_DATES:
+        return substr
+    return {'$cond': [{'$eq': [{'$type': '$' + field}, 'date']},
+                      {'$dateToString': {'format': _DATE_PREFIX_FORMATS[length],
+                                         'date': '$' + field}},
+                      substr]}
+
+
+def _parse_date(date_str):
+    """
+    Convert a date string written by datetime.isoformat() to a datetime. The strings are only
+    parsed if they match _DATE_RE, rather than trying strptime() on every string.
+
+    Returns:
+        datetime, or date_str if it is not a date
+    """
+    # from '2012-12-13T1:2:3' to '2012-12-13T12:30:15.123456'
+    if not 14 <= len(date_str) <= 26:
+        return date_str
+    m = _DATE_RE.match(date_str)
+    if m is None:
+        return date_str
+    year, month, day, hour, minute, second, fraction = m.groups()
+    try:
+        return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                 int(second), int(fraction.ljust(6, '0')) if fraction else 0)
+    except ValueError:
+        return date_str
+
+
 def get_default_serialization(cls):
     root_mod = cls.__module__.split('.')[0]
     if root_mod == '__main__':
@@ -5,6 +5,8 @@
 import sys
 from fireworks.user_objects.firetasks.unittest_tasks import TestSerializer, ExportTestSerializer
 from fireworks.utilities.fw_serializers import load_object, FWSerializable, recursive_dict
+import fireworks.user_objects
+import fireworks.utilities.fw_serializers as fw_serializers
 from fireworks.utilities.fw_utilities import explicit_serialize
 
 
@@ -19,6 +21,8 @@ import unittest
 import datetime
 import os
 import json
+import shutil
+import tempfile
 
 
 if sys.version_info > (3, 0, 0):
@@ -132,6 +136,20 @@ class SerializationTest(unittest.TestCase):
     def test_as_dict(self):
         self.assertEqual(self.obj_1.as_dict(), self.obj_1.to_dict())
 
+    def test_recursive_dict(self):
+        date = datetime.datetime(2013, 1, 26, 12, 30, 15, 123456)
+        obj = {"t": (1, 2.5, None, True), 3: [date], date: u'\xe4', "o": self.obj_4,
+               "s": set([1])}
+        self.assertEqual(recursive_dict(obj),
+                         {"t": [1, 2.5, None, True], 3: ["2013-01-26T12:30:15.123456"],
+                          "2013-01-26T12:30:15.123456": u'\xe4', "o": self.obj_4.to_dict(),
+                          "s": "{1}" if sys.version_info > (3, 0, 0) else "set([1])"})
+        # the output of a @recursive_serialize to_dict() is not copied again
+        m_dict = self.obj_4.to_dict()
+        self.obj_4.to_dict = lambda: m_dict
+        self.obj_4.to_dict.recursive_serialized = True
+        self.assertIs(recursive_dict(self.obj_4), m_dict)
+
     def test_numpy_array(self):
         try:
             import numpy as np
@@ -141,6 +159,54 @@ class SerializationTest(unittest.TestCase):
         x = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
         x = recursive_dict(x)
         self.assertEqual(x, [[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        date = datetime.datetime(2013, 1, 26)
+        self.assertEqual(recursive_dict(np.array([date, 1.5], dtype=object)),
+                         ["2013-01-26T00:00:00", 1.5])
+
+
+class ReconstituteDatesTest(unittest.TestCase):
+
+    def tearDown(self):
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = False
+        fw_serializers.BSON_DATES = False
+
+    def test_dates(self):
+        now = datetime.datetime(2017, 1, 2, 3, 4, 5, 123456)
+        for date in (now, now.replace(microsecond=0), now.replace(microsecond=100000)):
+            self.assertEqual(fw_serializers.reconstitute_dates(date.isoformat()), date)
+        self.assertEqual(fw_serializers.reconstitute_dates("2017-1-2T3:4:5.12"),
+                         datetime.datetime(2017, 1, 2, 3, 4, 5, 120000))
+        for not_date in ("2017-02-30T00:00:00", "2017-01-02T03:04:05+00:00",
+                         "2017-01-02 03:04:05", "2017-01-02T03:04:05.1234567",
+                         "/tmp/launcher_2017-01-02-03-04-05-123456", "2017", ""):
+            self.assertEqual(fw_serializers.reconstitute_dates(not_date), not_date)
+
+    def test_date_prefix(self):
+        self.assertEqual(fw_serializers.date_prefix("time_end", 10),
+                         {"$substr": ["$time_end", 0, 10]})
+        fw_serializers.BSON_DATES = True
+        date = datetime.datetime(2017, 1, 2, 3, 4, 5, 123456)
+        for length in (4, 7, 10, 13, 16):
+            expr = fw_serializers.date_prefix("time_end", length)["$cond"]
+            # BSON dates are formatted like the prefix of the string dates
+            self.assertEqual(date.strftime(expr[1]["$dateToString"]["format"]),
+                             date.isoformat()[:length])
+            self.assertEqual(expr[2], {"$substr": ["$time_end", 0, length]})
+
+    def test_date_fields_only(self):
+        date_str = "2017-01-02T03:04:05.123456"
+        date = datetime.datetime(2017, 1, 2, 3, 4, 5, 123456)
+        obj_dict = {"created_on": date_str, "spec": {"label": date_str, "dates": [date_str]},
+                    "state_history": [{"updated_on": date_str}]}
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = True
+        for loaded in (fw_serializers.reconstitute_dates(obj_dict),
+                       fw_serializers._recursive_load(obj_dict)):
+            self.assertEqual(loaded, {"created_on": date,
+                                      "spec": {"label": date_str, "dates": [date_str]},
+                                      "state_history": [{"updated_on": date}]})
+        fw_serializers.RECONSTITUTE_DATE_FIELDS_ONLY = False
+        self.assertEqual(fw_serializers._recursive_load(obj_dict)["spec"],
+                         {"label": date, "dates": [date]})
 
 
 class ExplicitSerializationTest(unittest.TestCase):
@@ -151,5 +217,80 @@ class ExplicitSerializationTest(unittest.TestCase):
     def test_explicit_serialization(self):
         self.assertEqual(load_object(self.s_dict), self.s_obj)
 
+class FWNameRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_registry_path = fw_serializers.FW_NAME_REGISTRY
+        fw_serializers.FW_NAME_REGISTRY = os.path.join(self.tmp_dir, "registry", "fw_names.json")
+        self.registry_path = fw_serializers._get_fw_name_registry_path()
+        self._reset_process()
+        self.builds = 0
+        self.build = fw_serializers._build_fw_name_registry
+
+        def count_builds(packages):
+            self.builds += 1
+            return self.build(packages)
+
+        fw_serializers._build_fw_name_registry = count_builds
+
+    def tearDown(self):
+        fw_serializers._build_fw_name_registry = self.build
+        fw_serializers.FW_NAME_REGISTRY = self.old_registry_path
+        self._reset_process()
+        shutil.rmtree(self.tmp_dir)
+
+    def _reset_process(self):
+        # as if in a new process
+        fw_serializers._FW_NAME_REGISTRY = None
+        fw_serializers.SAVED_FW_MODULES.clear()
+
+    def test_registry(self):
+        obj_dict = {"a": {"p1": {"p2": 3}}, "_fw_name": "TestSerializer Export Name"}
+        obj = ExportTestSerializer({"p1": {"p2": 3}})
+        self.assertEqual(load_object(dict(obj_dict)), obj)
+        self.assertEqual(self.builds, 1)
+        with open(self.registry_path) as f:
+            registry = json.load(f)
+        self.assertEqual(registry["fw_names"]["TestSerializer Export Name"],
+                         ["fireworks.user_objects.firetasks.unittest_tasks"])
+
+        # the next process uses the registry on disk
+        self._reset_process()
+        self.assertEqual(load_object(dict(obj_dict)), obj)
+        self.assertEqual(self.builds, 1)
+
+        # unknown names rebuild the registry once per process
+        for _ in range(2):
+            with self.assertRaises(ValueError) as cm:
+                load_object({"_fw_name": "No Such Task"})
+            self.assertIn("ADD_USER_PACKAGES", str(cm.exception))
+            self.assertEqual(self.builds, 2)
+
+        # the registry is rebuilt when the packages change
+        registry["stamps"][0][1] -= 1
+        with open(self.registry_path, "w") as f:
+            json.dump(registry, f)
+        self._reset_process()
+        self.assertEqual(load_object(dict(obj_dict)), obj)
+        self.assertEqual(self.builds, 3)
+
+        # the registry of another Python environment is kept apart
+        self.assertEqual(os.listdir(os.path.dirname(self.registry_path)),
+                         [os.path.basename(self.registry_path)])
+        self.assertNotEqual(self.registry_path, fw_serializers.FW_NAME_REGISTRY)
+        # and so is the one of a package installed elsewhere
+        self.assertIn(os.path.abspath(fireworks.user_objects.__file__), registry["stamps"][0][2])
+
+        # classes missing from the registry, e.g. added in a subpackage, are found by a rebuild
+        with open(self.registry_path) as f:
+            registry = json.load(f)
+        del registry["fw_names"]["TestSerializer Export Name"]
+        with open(self.registry_path, "w") as f:
+            json.dump(registry, f)
+        self._reset_process()
+        self.assertEqual(load_object(dict(obj_dict)), obj)
+        self.assertEqual(self.builds, 4)
+
+
 if __name__ == "__main__":
     unittest.main()